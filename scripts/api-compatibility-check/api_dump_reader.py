@@ -0,0 +1,198 @@
+"""Incremental reader for `swift-api-digester` API/ABI JSON dumps.
+
+ABI dumps of MapboxMaps together with its re-exported dependencies run to hundreds of MB,
+so `json.load` is not an option for tools that only need to look at declarations one by one.
+`iter_declarations` tokenizes the dump chunk by chunk and yields every declaration node as soon
+as it has been read. Only the scalar fields of the nodes on the current path are kept in memory,
+so memory usage does not depend on the size of the dump.
+"""
+
+import codecs
+import json
+import re
+from collections import namedtuple
+
+CHUNK_SIZE = 1 << 20
+
+# A declaration node from the dump.
+# `path` holds the printed names of the enclosing nodes, starting from the top level declaration.
+Declaration = namedtuple("Declaration", ["kind", "decl_kind", "name", "printed_name", "usr", "module", "path"])
+
+# Every token is reported as a `(punct, string, number, literal, error)` tuple with exactly one
+# non-empty group, except for the empty string literal where all groups are empty.
+_TOKEN = re.compile(
+    r"""[ \t\n\r]*(?:
+    ([{}\[\]:,])
+    |"([^"\\]*(?:\\.[^"\\]*)*)"
+    |(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)
+    |(true|false|null)
+    |([^ \t\n\r])
+    )""",
+    re.VERBOSE,
+)
+_LITERALS = {"true": True, "false": False, "null": None}
+
+
+class DumpFormatError(Exception):
+    pass
+
+
+def tokenize(f, chunk_size: int = CHUNK_SIZE):
+    """Yields lists of token tuples read from a binary file object, one list per chunk.
+
+    The digester pretty-prints its dumps, and JSON strings cannot contain raw newlines, so a chunk
+    can be cut after its last newline and tokenized with a single `findall`. Buffers without a newline
+    are tokenized one token at a time, keeping back a token that may continue in the next chunk.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    eof = False
+
+    while not eof:
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer += decoder.decode(chunk, final=eof)
+
+        if eof:
+            cut = len(buffer)
+        else:
+            cut = buffer.rfind("\n") + 1
+
+        if cut > 0:
+            tokens = _TOKEN.findall(buffer, 0, cut)
+        else:
+            tokens = []
+            while True:
+                m = _TOKEN.match(buffer, cut)
+                # Numbers are kept back until a delimiter is seen, as the next chunk may extend them.
+                if m is None or m.lastindex == 5 or (m.lastindex == 3 and m.end() + 3 > len(buffer)):
+                    break
+                tokens.append(m.groups())
+                cut = m.end()
+
+        buffer = buffer[cut:]
+        if tokens:
+            yield tokens
+
+    if buffer.strip():
+        raise DumpFormatError(f"Unexpected input: {buffer[:32]!r}")
+
+
+# Frames of the parser stack.
+_DOCUMENT, _NODE, _CHILDREN, _LIST, _SKIP = range(5)
+
+
+def iter_nodes(path: str, chunk_size: int = CHUNK_SIZE):
+    """Yields `(fields, path)` for every node under `ABIRoot`, children before their parents.
+
+    `fields` contains the scalar and scalar-list fields of the node. Other containers are skipped.
+    """
+    # Each frame is [frame kind, fields or list values, pending object key, node path, owner frame].
+    stack = []
+    with open(path, "rb") as f:
+        for tokens in tokenize(f, chunk_size):
+            for punct, string, number, literal, error in tokens:
+                frame = stack[-1] if stack else None
+
+                if frame is not None and frame[0] == _SKIP:
+                    if punct == "{" or punct == "[":
+                        frame[1] += 1
+                    elif punct == "}" or punct == "]":
+                        frame[1] -= 1
+                        if frame[1] == 0:
+                            stack.pop()
+                            if stack[-1][0] == _DOCUMENT or stack[-1][0] == _NODE:
+                                stack[-1][2] = None
+                    elif error:
+                        raise DumpFormatError(f"Unexpected character {error!r}")
+                    continue
+
+                if punct:
+                    if punct == "," or punct == ":":
+                        continue
+                    if punct == "}" or punct == "]":
+                        if frame is None:
+                            raise DumpFormatError(f"Unexpected '{punct}'")
+                        stack.pop()
+                        if frame[0] == _NODE:
+                            yield frame[1], frame[3]
+                        elif frame[0] == _LIST and frame[1] is not None:
+                            frame[4][1][frame[2]] = frame[1]
+                        if stack:
+                            stack[-1][2] = None
+                        continue
+                    value = punct
+                elif number:
+                    value = float(number) if "." in number or "e" in number or "E" in number else int(number)
+                elif literal:
+                    value = _LITERALS[literal]
+                elif error:
+                    raise DumpFormatError(f"Unexpected character {error!r}")
+                else:
+                    value = json.loads(f'"{string}"') if "\\" in string else string
+
+                if frame is None:
+                    if value != "{" or not punct:
+                        raise DumpFormatError(f"Expected a JSON object, got {value!r}")
+                    stack.append([_DOCUMENT, None, None, (), None])
+                    continue
+
+                frame_kind = frame[0]
+                if frame_kind == _DOCUMENT or frame_kind == _NODE:
+                    key = frame[2]
+                    if key is None:
+                        if punct or number or literal:
+                            raise DumpFormatError(f"Expected object key, got {value!r}")
+                        frame[2] = value
+                    elif not punct:
+                        if frame_kind == _NODE:
+                            frame[1][key] = value
+                        frame[2] = None
+                    elif frame_kind == _DOCUMENT:
+                        if key == "ABIRoot" and value == "{":
+                            stack.append([_NODE, {}, None, (), None])
+                        else:
+                            stack.append([_SKIP, 1, None, None, None])
+                    elif key == "children" and value == "[":
+                        # `declKind` is written after `children`, so declarations are told apart from types by `kind`.
+                        fields = frame[1]
+                        node_kind = fields.get("kind", "")
+                        node_path = frame[3]
+                        if node_kind == "TypeDecl" or not (node_kind == "Root" or node_kind.startswith("Type")):
+                            node_path = node_path + (fields.get("printedName", fields.get("name", "")),)
+                        stack.append([_CHILDREN, None, None, node_path, frame])
+                    elif value == "[":
+                        stack.append([_LIST, [], key, None, frame])
+                    else:
+                        stack.append([_SKIP, 1, None, None, None])
+                elif frame_kind == _CHILDREN:
+                    if value == "{" and punct:
+                        stack.append([_NODE, {}, None, frame[3], frame])
+                    elif punct:
+                        stack.append([_SKIP, 1, None, None, None])
+                elif not punct:
+                    if frame[1] is not None:
+                        frame[1].append(value)
+                else:
+                    # Only lists of scalars are kept.
+                    frame[1] = None
+                    stack.append([_SKIP, 1, None, None, None])
+
+    if stack:
+        raise DumpFormatError("Unexpected end of dump")
+
+
+def iter_declarations(path: str, chunk_size: int = CHUNK_SIZE):
+    """Yields a `Declaration` for every declaration node in the dump at `path`."""
+    for fields, parents in iter_nodes(path, chunk_size):
+        if "declKind" not in fields:
+            continue
+        yield Declaration(
+            kind=fields.get("kind"),
+            decl_kind=fields["declKind"],
+            name=fields.get("name"),
+            printed_name=fields.get("printedName"),
+            usr=fields.get("usr"),
+            module=fields.get("moduleName"),
+            path=parents,
+        )
@@ -0,0 +1,537 @@
+"""Compact binary format for `swift-api-digester` API/ABI dumps.
+
+JSON dumps have to be parsed in full before any question can be asked about them. A binary dump is read
+through `mmap` instead: opening one only reads its header, and lookups touch the few pages they need.
+
+Layout, all integers little endian:
+
+- header: the magic `APIBD`, a format version byte, then the offset and length of every section in
+  `SECTIONS` order (two u64 each),
+- `string_offsets`, `string_data`: every key and string value of the dump, once, as UTF-8. The strings
+  are sorted by their bytes, so that string ids sort like the strings and a string is found by binary search,
+- `shape_offsets`, `shape_data`: the key lists of objects, shared by all objects with the same keys in the
+  same order. A key is a string id, with `EXTRA_FLAG` set when its value is stored in `values`,
+- `nodes`: one fixed-width `NODE` record per node, in breadth-first order so that the children of a node are
+  contiguous: parent, first child, child count, shape, offset of its other fields in `values`, and the
+  string ids of the fields most tools look at (`COLUMNS`),
+- `values`: the other fields, tagged (`TAG_*`). Objects are a shape id followed by their values,
+- `usr_index`, `attribute_index`: sorted `(string id, node)` pairs for USRs and `declAttributes` entries,
+- `name_index`, `qualified_names`: the qualified names of the declarations, the printed names of the enclosing
+  declarations and of the declaration joined with dots like `Viewport.init(cameraOptions:)`, sorted and
+  separated by newlines, and `(node, offset of the name)` pairs in the same order.
+
+Converting back to JSON gives the same document, key order included.
+"""
+
+import fnmatch
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from collections import deque, namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+
+MAGIC = b"APIBD"
+FORMAT_VERSION = 1
+SECTIONS = (
+    "string_offsets",
+    "string_data",
+    "shape_offsets",
+    "shape_data",
+    "nodes",
+    "values",
+    "usr_index",
+    "name_index",
+    "qualified_names",
+    "attribute_index",
+)
+HEADER = struct.Struct("<5sB2x" + "QQ" * len(SECTIONS))
+# Node fields stored in the node record when they are strings.
+COLUMNS = ("kind", "name", "printedName", "declKind", "usr", "moduleName")
+NODE = struct.Struct("<5I" + "I" * len(COLUMNS))
+U32 = struct.Struct("<I")
+PAIR = struct.Struct("<II")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+NONE = 0xFFFFFFFF
+EXTRA_FLAG = 0x80000000
+CHILDREN = "children"
+
+TAG_NULL, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_FLOAT, TAG_STRING, TAG_LIST, TAG_OBJECT = range(8)
+
+# Swift spellings of the attributes accepted by `query --attribute`, mapped to their name in the dumps.
+ATTRIBUTE_SPELLINGS = {
+    "_spi": "SPIAccessControl",
+    "available": "Available",
+    "discardableResult": "DiscardableResult",
+    "dynamic": "Dynamic",
+    "final": "Final",
+    "frozen": "Frozen",
+    "inlinable": "Inlinable",
+    "nonobjc": "NonObjC",
+    "objc": "ObjC",
+    "preconcurrency": "Preconcurrency",
+    "usableFromInline": "UsableFromInline",
+}
+
+# A node of a binary dump, with its column fields resolved to strings or None.
+Node = namedtuple(
+    "Node", ["index", "parent", "child_count", "kind", "name", "printed_name", "decl_kind", "usr", "module"]
+)
+
+
+class BinaryDumpError(Exception):
+    pass
+
+
+def is_binary_dump(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class _Writer:
+    def __init__(self, root: dict):
+        self.nodes = []
+        self.parents = []
+        self.first_children = []
+        self.qualified_names = []
+        self.strings = {}
+        self.shapes = {}
+        self.values = bytearray()
+
+        # Breadth-first order keeps the children of every node next to each other.
+        queue = deque([(root, NONE, None)])
+        while queue:
+            node, parent, parent_name = queue.popleft()
+            if not isinstance(node, dict):
+                raise BinaryDumpError(f"Expected a node object, got {type(node).__name__}")
+            index = len(self.nodes)
+            self.nodes.append(node)
+            self.parents.append(parent)
+            qualified_name = None
+            if "declKind" in node:
+                name = node.get("printedName", node.get("name", ""))
+                qualified_name = f"{parent_name}.{name}" if parent_name else name
+            self.qualified_names.append(qualified_name)
+            self.first_children.append(len(self.nodes) + len(queue))
+            queue.extend((child, index, qualified_name) for child in node.get(CHILDREN, ()))
+            for key, value in node.items():
+                self.strings[key] = None
+                if key != CHILDREN:
+                    self.__collect_strings(value)
+
+        ordered = sorted(self.strings, key=lambda string: string.encode("utf-8"))
+        self.strings = {string: index for index, string in enumerate(ordered)}
+
+    def __collect_strings(self, value):
+        if isinstance(value, str):
+            self.strings[value] = None
+        elif isinstance(value, list):
+            for item in value:
+                self.__collect_strings(item)
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                self.strings[key] = None
+                self.__collect_strings(item)
+
+    def __shape(self, keys: tuple) -> int:
+        return self.shapes.setdefault(keys, len(self.shapes))
+
+    def __encode(self, value):
+        values = self.values
+        if value is None:
+            values.append(TAG_NULL)
+        elif value is True:
+            values.append(TAG_TRUE)
+        elif value is False:
+            values.append(TAG_FALSE)
+        elif isinstance(value, int):
+            values.append(TAG_INT)
+            values += I64.pack(value)
+        elif isinstance(value, float):
+            values.append(TAG_FLOAT)
+            values += F64.pack(value)
+        elif isinstance(value, str):
+            values.append(TAG_STRING)
+            values += U32.pack(self.strings[value])
+        elif isinstance(value, list):
+            values.append(TAG_LIST)
+            values += U32.pack(len(value))
+            for item in value:
+                self.__encode(item)
+        elif isinstance(value, dict):
+            values.append(TAG_OBJECT)
+            values += U32.pack(self.__shape(tuple(self.strings[key] | EXTRA_FLAG for key in value)))
+            for item in value.values():
+                self.__encode(item)
+        else:
+            raise BinaryDumpError(f"Unsupported value {value!r}")
+
+    def __node_record(self, index: int) -> bytes:
+        node = self.nodes[index]
+        columns = dict.fromkeys(COLUMNS, NONE)
+        keys = []
+        values_offset = len(self.values)
+        for key, value in node.items():
+            key_id = self.strings[key]
+            if key == CHILDREN:
+                keys.append(key_id)
+            elif key in columns and isinstance(value, str):
+                columns[key] = self.strings[value]
+                keys.append(key_id)
+            else:
+                keys.append(key_id | EXTRA_FLAG)
+                self.__encode(value)
+        child_count = len(node.get(CHILDREN, ()))
+        first_child = self.first_children[index] if child_count else NONE
+        return NODE.pack(
+            self.parents[index], first_child, child_count, self.__shape(tuple(keys)), values_offset, *columns.values()
+        )
+
+    def sections(self) -> dict:
+        nodes = b"".join(self.__node_record(index) for index in range(len(self.nodes)))
+
+        string_offsets = bytearray()
+        string_data = bytearray()
+        for string in self.strings:
+            string_offsets += U32.pack(len(string_data))
+            string_data += string.encode("utf-8")
+        string_offsets += U32.pack(len(string_data))
+
+        shape_offsets = bytearray()
+        shape_data = bytearray()
+        for keys in self.shapes:
+            shape_offsets += U32.pack(len(shape_data) // U32.size)
+            shape_data += struct.pack(f"<{len(keys)}I", *keys)
+        shape_offsets += U32.pack(len(shape_data) // U32.size)
+
+        usrs = []
+        attributes = []
+        for index, node in enumerate(self.nodes):
+            if isinstance(node.get("usr"), str):
+                usrs.append((self.strings[node["usr"]], index))
+            if "declKind" in node:
+                attributes.extend(
+                    (self.strings[attribute], index)
+                    for attribute in dict.fromkeys(node.get("declAttributes", ()))
+                    if isinstance(attribute, str)
+                )
+        # UTF-8 sorts like code points, so the names are sorted as `str` and searched as bytes.
+        named = sorted((name, index) for index, name in enumerate(self.qualified_names) if name is not None)
+        name_index = bytearray()
+        qualified_names = bytearray()
+        for name, index in named:
+            name_index += PAIR.pack(index, len(qualified_names))
+            qualified_names += name.encode("utf-8") + b"\n"
+
+        return {
+            "string_offsets": bytes(string_offsets),
+            "string_data": bytes(string_data),
+            "shape_offsets": bytes(shape_offsets),
+            "shape_data": bytes(shape_data),
+            "nodes": nodes,
+            "values": bytes(self.values),
+            "usr_index": b"".join(PAIR.pack(*pair) for pair in sorted(usrs)),
+            "name_index": bytes(name_index),
+            "qualified_names": bytes(qualified_names),
+            "attribute_index": b"".join(PAIR.pack(*pair) for pair in sorted(attributes)),
+        }
+
+
+def write_binary_dump(document: dict, output_path: str):
+    """Writes a JSON dump document, `{"ABIRoot": ...}`, as a binary dump."""
+    if list(document) != ["ABIRoot"]:
+        raise BinaryDumpError(f"Expected a document with only an ABIRoot, got the keys {', '.join(document)}")
+    sections = _Writer(document["ABIRoot"]).sections()
+
+    layout = []
+    offset = HEADER.size
+    for name in SECTIONS:
+        # Sections start on 8-byte boundaries.
+        offset += -offset % 8
+        layout.append((offset, len(sections[name])))
+        offset += len(sections[name])
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, *(value for section in layout for value in section)))
+            for name, (offset, _) in zip(SECTIONS, layout):
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(sections[name])
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+@tracing.traced("Convert dump to binary")
+def convert_to_binary(json_path: str, output_path: str):
+    with open(json_path, "rb") as f:
+        document = json.load(f)
+    write_binary_dump(document, output_path)
+
+
+@tracing.traced("Convert dump to JSON")
+def convert_to_json(binary_path: str, output_path: str):
+    with BinaryDump(binary_path) as dump:
+        document = {"ABIRoot": dump.to_dict()}
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class BinaryDump:
+    """Read-only view of a binary dump. Nothing is parsed up front, every lookup reads the mapped file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise BinaryDumpError(f"{path} is empty") from None
+        if len(self.data) < HEADER.size or self.data[: len(MAGIC)] != MAGIC:
+            self.data.close()
+            raise BinaryDumpError(f"{path} is not a binary API dump")
+        header = HEADER.unpack_from(self.data, 0)
+        if header[1] != FORMAT_VERSION:
+            self.data.close()
+            raise BinaryDumpError(f"{path} has format version {header[1]}, expected {FORMAT_VERSION}")
+        self.sections = {name: header[2 + 2 * index : 4 + 2 * index] for index, name in enumerate(SECTIONS)}
+        self.string_count = self.sections["string_offsets"][1] // U32.size - 1
+        self.node_count = self.sections["nodes"][1] // NODE.size
+        self.__string_offsets = self.sections["string_offsets"][0]
+        self.__string_data = self.sections["string_data"][0]
+        self.__nodes = self.sections["nodes"][0]
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Strings
+
+    def string_bytes(self, string_id: int) -> bytes:
+        start, end = struct.unpack_from("<II", self.data, self.__string_offsets + string_id * U32.size)
+        return self.data[self.__string_data + start : self.__string_data + end]
+
+    def string(self, string_id: int):
+        return None if string_id == NONE else self.string_bytes(string_id).decode("utf-8")
+
+    def find_string(self, string: str):
+        """Returns the id of `string`, or None if the dump does not contain it."""
+        target = string.encode("utf-8")
+        index = _lower_bound(self.string_count, self.string_bytes, target)
+        if index < self.string_count and self.string_bytes(index) == target:
+            return index
+        return None
+
+    # Nodes
+
+    def record(self, index: int) -> tuple:
+        return NODE.unpack_from(self.data, self.__nodes + index * NODE.size)
+
+    def column(self, index: int, column: str) -> int:
+        """Returns the string id of a `COLUMNS` field of a node, or `NONE`."""
+        return U32.unpack_from(self.data, self.__nodes + index * NODE.size + (5 + COLUMNS.index(column)) * U32.size)[0]
+
+    def node(self, index: int) -> Node:
+        parent, _, child_count, _, _, *columns = self.record(index)
+        return Node(index, None if parent == NONE else parent, child_count, *(self.string(c) for c in columns))
+
+    def children(self, index: int) -> range:
+        _, first_child, child_count, _, _, *_ = self.record(index)
+        return range(first_child, first_child + child_count) if child_count else range(0)
+
+    def qualified_name(self, index: int) -> str:
+        names = []
+        while index != NONE:
+            record = self.record(index)
+            if record[8] == NONE:  # declKind
+                break
+            name = record[7] if record[7] != NONE else record[6]  # printedName, then name
+            names.append(self.string(name) if name != NONE else "")
+            index = record[0]
+        return ".".join(reversed(names))
+
+    def fields(self, index: int) -> dict:
+        """Returns all the fields of a node but its children."""
+        return self.__node_dict(index, children=False)
+
+    def to_dict(self, index: int = 0) -> dict:
+        """Returns the node with all its descendants, as in the JSON dump."""
+        return self.__node_dict(index, children=True)
+
+    def __node_dict(self, index: int, children: bool) -> dict:
+        _, first_child, child_count, shape, position, *columns = self.record(index)
+        column_values = dict(zip(COLUMNS, columns))
+        node = {}
+        for key_id in self.__shape(shape):
+            key = self.string(key_id & ~EXTRA_FLAG)
+            if key_id & EXTRA_FLAG:
+                node[key], position = self.__decode(position)
+            elif key == CHILDREN:
+                if children:
+                    node[key] = [self.to_dict(child) for child in range(first_child, first_child + child_count)]
+            else:
+                node[key] = self.string(column_values[key])
+        return node
+
+    def __shape(self, shape: int) -> tuple:
+        start, end = struct.unpack_from("<II", self.data, self.sections["shape_offsets"][0] + shape * U32.size)
+        return struct.unpack_from(f"<{end - start}I", self.data, self.sections["shape_data"][0] + start * U32.size)
+
+    def __decode(self, position: int) -> tuple:
+        data = self.data
+        offset = self.sections["values"][0] + position
+        tag = data[offset]
+        offset += 1
+        position += 1
+        if tag == TAG_NULL:
+            return None, position
+        if tag == TAG_TRUE:
+            return True, position
+        if tag == TAG_FALSE:
+            return False, position
+        if tag == TAG_INT:
+            return I64.unpack_from(data, offset)[0], position + I64.size
+        if tag == TAG_FLOAT:
+            return F64.unpack_from(data, offset)[0], position + F64.size
+        (operand,) = U32.unpack_from(data, offset)
+        position += U32.size
+        if tag == TAG_STRING:
+            return self.string(operand), position
+        if tag == TAG_LIST:
+            items = []
+            for _ in range(operand):
+                item, position = self.__decode(position)
+                items.append(item)
+            return items, position
+        if tag == TAG_OBJECT:
+            value = {}
+            for key_id in self.__shape(operand):
+                value[self.string(key_id & ~EXTRA_FLAG)], position = self.__decode(position)
+            return value, position
+        raise BinaryDumpError(f"Unknown value tag {tag} in {self.path}")
+
+    # Indexes
+
+    def __postings(self, section: str, string_id: int) -> list:
+        offset, size = self.sections[section]
+        count = size // PAIR.size
+
+        def key(index):
+            return PAIR.unpack_from(self.data, offset + index * PAIR.size)[0]
+
+        nodes = []
+        index = _lower_bound(count, key, string_id)
+        while index < count:
+            found, node = PAIR.unpack_from(self.data, offset + index * PAIR.size)
+            if found != string_id:
+                break
+            nodes.append(node)
+            index += 1
+        return nodes
+
+    def find_usr(self, usr: str) -> list:
+        """Returns the nodes with the given USR."""
+        string_id = self.find_string(usr)
+        return [] if string_id is None else self.__postings("usr_index", string_id)
+
+    def with_attribute(self, attribute: str) -> list:
+        """Returns the declarations with the given `declAttributes` entry, like `SPIAccessControl`."""
+        string_id = self.find_string(attribute)
+        return [] if string_id is None else self.__postings("attribute_index", string_id)
+
+    def match_names(self, pattern: str = "*"):
+        """Returns the declarations whose qualified name matches the glob `pattern`, in name order."""
+        offset, size = self.sections["name_index"]
+        names_offset, names_size = self.sections["qualified_names"]
+        count = size // PAIR.size
+
+        def name_offset(index):
+            return PAIR.unpack_from(self.data, offset + index * PAIR.size)[1] if index < count else names_size
+
+        def name_at(index):
+            return self.data[names_offset + name_offset(index) : names_offset + name_offset(index + 1) - 1]
+
+        # Only the names starting with the literal prefix of the pattern can match it, and they are contiguous.
+        prefix_length = min((pattern.find(c) for c in "*?[" if c in pattern), default=len(pattern))
+        prefix = pattern[:prefix_length].encode("utf-8")
+        start = _lower_bound(count, name_at, prefix)
+        end = start + _lower_bound(count - start, lambda index: not name_at(start + index).startswith(prefix), True)
+
+        text = self.data[names_offset + name_offset(start) : names_offset + name_offset(end)].decode("utf-8")
+        match = re.compile(fnmatch.translate(pattern)).match
+        return [
+            PAIR.unpack_from(self.data, offset + (start + position) * PAIR.size)[0]
+            for position, name in enumerate(text.split("\n")[: end - start])
+            if match(name)
+        ]
+
+    def query(self, name: str = None, kind: str = None, attribute: str = None, module: str = None, usr: str = None):
+        """Returns the declarations matching all the given filters, in qualified name order."""
+        filters = {}
+        for column, value in (("declKind", kind), ("moduleName", module)):
+            if value is not None:
+                string_id = self.find_string(value)
+                if string_id is None:
+                    return []
+                filters[column] = string_id
+
+        # Start from the most selective index. Only the name index is in name order.
+        by_name = usr is None and (attribute is None or (name is not None and name[:1] not in "*?["))
+        if usr is not None:
+            candidates = self.find_usr(usr)
+        elif not by_name:
+            candidates = self.with_attribute(attribute)
+        else:
+            candidates = self.match_names("*" if name is None else name)
+        if attribute is not None and by_name:
+            with_attribute = set(self.with_attribute(attribute))
+            candidates = [node for node in candidates if node in with_attribute]
+
+        if usr is not None:
+            # Type nodes have USRs too.
+            candidates = [node for node in candidates if self.column(node, "declKind") != NONE]
+        matches = candidates
+        for column, string_id in filters.items():
+            matches = [node for node in matches if self.column(node, column) == string_id]
+        if by_name:
+            return matches
+        named = sorted((self.qualified_name(node), node) for node in matches)
+        return [node for qualified_name, node in named if name is None or fnmatch.fnmatchcase(qualified_name, name)]
+
+
+def _lower_bound(count: int, key, target) -> int:
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if key(middle) < target:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def attribute_name(spelling: str) -> str:
+    """Maps a Swift attribute spelling like `@_spi` to its name in the dumps, other names are kept as they are."""
+    spelling = spelling.lstrip("@")
+    return ATTRIBUTE_SPELLINGS.get(spelling, spelling)
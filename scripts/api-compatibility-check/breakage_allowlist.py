@@ -0,0 +1,199 @@
+"""Matching of API breakage reports against `breakage_allowlist.txt`.
+
+Every non-empty line of the allowlist is an entry, except for `//` comments and `/* Category */`
+headers copied from reports. By default an entry has to match a report line exactly. Entries can
+also be patterns and can be restricted to a single report category:
+
+    Func MapboxMap.tileCover(for:) has been removed
+    glob: Func MapboxMap.tileCover(for:) has return type change from [*] to [*]
+    regex: Var \\w+\\.mbxCollisionBox has been removed
+    [Protocol Conformance Change] glob: Extension * has removed conformance to SendableMetatype
+
+Exact entries are looked up in a set. The patterns of each scope are compiled into a single regular
+expression, so checking a report line costs the same regardless of the number of entries. Regex entries
+with numeric backreferences are matched on their own, their group numbers change once combined. The allowlist
+keeps track of the entries that matched, which lets `unused_entries` point at entries that can be removed.
+"""
+
+import re
+
+_SCOPE = re.compile(r"\[([^\]]+)\]\s*")
+_GLOB_WILDCARDS = {"*": ".*", "?": "."}
+# Numeric backreferences in regex entries: \1 to \99.
+_PATTERN_BACKREFERENCE = re.compile(r"\\[1-9]")
+
+
+class Entry:
+    __slots__ = ("line_number", "text", "kind", "value", "category", "matches")
+
+    def __init__(self, line_number: int, text: str, kind: str, value: str, category: str = None):
+        self.line_number = line_number
+        self.text = text
+        self.kind = kind
+        self.value = value
+        self.category = category
+        self.matches = 0
+
+    def pattern(self) -> str:
+        if self.kind == "glob":
+            # Only `*` and `?` are wildcards, brackets are common in type names like `[String]`.
+            return (
+                "".join(_GLOB_WILDCARDS.get(part, re.escape(part)) for part in re.split(r"([*?])", self.value)) + r"\Z"
+            )
+        if self.kind == "regex":
+            return rf"(?:{self.value})\Z"
+        return re.escape(self.value) + r"\Z"
+
+    def __repr__(self):
+        return f"Entry({self.line_number}: {self.text})"
+
+
+def parse_entry(line_number: int, line: str):
+    """Returns the entry defined by an allowlist line, or None for blank lines, comments and headers."""
+    text = line.strip()
+    if not text or text.startswith("//") or text.startswith("/* "):
+        return None
+
+    category = None
+    scope = _SCOPE.match(text)
+    if scope is not None:
+        category = scope.group(1).strip()
+        text = text[scope.end() :]
+
+    kind, value = "exact", text
+    for prefix in ("glob:", "regex:"):
+        if text.startswith(prefix):
+            kind, value = prefix[:-1], text[len(prefix) :].strip()
+            break
+
+    entry = Entry(line_number, line.strip(), kind, value, category)
+    if kind == "regex":
+        try:
+            re.compile(value)
+        except re.error as error:
+            raise Exception(f"Invalid regex in allowlist line {line_number}: {error}")
+    return entry
+
+
+class Matcher:
+    """Entries sharing one scope: a set of exact lines and one compiled regex for the patterns."""
+
+    def __init__(self):
+        self.exact = {}
+        self.patterns = []
+        self.__regex = None
+        # (index, entry) of the patterns matched one by one, in allowlist order.
+        self.__separate = []
+        self.__compiled = False
+
+    def add(self, entry: Entry):
+        if entry.kind == "exact":
+            self.exact.setdefault(entry.value, []).append(entry)
+        else:
+            self.patterns.append(entry)
+
+    def __compile(self):
+        self.__compiled = True
+        combined = []
+        for index, entry in enumerate(self.patterns):
+            if entry.kind == "regex" and _PATTERN_BACKREFERENCE.search(entry.value):
+                self.__separate.append((index, entry))
+            else:
+                combined.append((index, entry))
+        if not combined:
+            return
+        try:
+            self.__regex = re.compile("|".join(f"(?P<e{index}>{entry.pattern()})" for index, entry in combined))
+        except re.error:
+            # Named groups used by several entries cannot be combined, match one by one.
+            self.__regex = None
+            self.__separate = list(enumerate(self.patterns))
+
+    def match(self, line: str):
+        """Returns the first entry matching `line` and counts the match, or None."""
+        entries = self.exact.get(line)
+        if entries:
+            entries[0].matches += 1
+            return entries[0]
+
+        if not self.__compiled:
+            self.__compile()
+        first = None
+        if self.__regex is not None:
+            match = self.__regex.match(line)
+            if match is not None:
+                first = int(match.lastgroup[1:])
+        for index, entry in self.__separate:
+            if first is not None and index > first:
+                break
+            if re.match(entry.pattern(), line):
+                first = index
+                break
+        if first is None:
+            return None
+        entry = self.patterns[first]
+        entry.matches += 1
+        return entry
+
+
+class BreakageAllowlist:
+    def __init__(self, entries: list):
+        self.entries = entries
+        self.__matchers = {}
+        for entry in entries:
+            self.__matchers.setdefault(entry.category, Matcher()).add(entry)
+        # Allowed lines, kept to credit patterns shadowed by another entry.
+        self.__allowed_lines = []
+
+    @staticmethod
+    def load(path: str) -> "BreakageAllowlist":
+        with open(path, "r") as f:
+            entries = [parse_entry(number, line) for number, line in enumerate(f, start=1)]
+        return BreakageAllowlist([entry for entry in entries if entry is not None])
+
+    def match(self, category: str, line: str):
+        """Returns the entry allowing `line` from the report `category`, or None."""
+        line = line.strip()
+        for scope in (category, None):
+            matcher = self.__matchers.get(scope)
+            if matcher is None:
+                continue
+            entry = matcher.match(line)
+            if entry is not None:
+                self.__allowed_lines.append((category, line))
+                return entry
+        return None
+
+    def filter_report(self, report_path: str) -> int:
+        """Removes allowed lines from the report in place. Returns the number of removed lines."""
+        with open(report_path, "r") as f:
+            report_lines = f.readlines()
+
+        kept = []
+        category = None
+        for line in report_lines:
+            if line.startswith("/* "):
+                category = line.strip()[3:-3]
+            elif not line.strip():
+                category = None
+            elif self.match(category, line) is not None:
+                continue
+            kept.append(line)
+
+        with open(report_path, "w") as f:
+            f.write("".join(kept))
+        return len(report_lines) - len(kept)
+
+    def unused_entries(self) -> list:
+        """Entries that did not match any report line so far."""
+        unused = [entry for entry in self.entries if entry.matches == 0]
+        # A pattern is never reported as the match of a line that another entry caught first.
+        for entry in unused:
+            if entry.kind == "exact":
+                continue
+            pattern = re.compile(entry.pattern())
+            if any(
+                entry.category in (None, category) and pattern.match(line) for category, line in self.__allowed_lines
+            ):
+                entry.matches += 1
+        return [entry for entry in unused if entry.matches == 0]
@@ -1,17 +1,47 @@
 #!/usr/bin/env python3
 import glob
+import hashlib
 import json
+import mmap
 import os
 import argparse
-import subprocess
+import concurrent.futures
+import contextlib
 import plistlib
+import re
 import shutil
+import struct
 import sys
 import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+
+import api_dump_reader
+import binary_dump
+import native_digester
+from breakage_allowlist import BreakageAllowlist
+from executor import Executor, ExecutorError, ProcessExecutor, RecordingExecutor, ReplayExecutor
+from github_client import GitHubClient, GitHubError
+import sdk_archive
+from disk_cache import (
+    DiskCache,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_WORKSPACE_SIZE,
+    default_cache_dir,
+    format_size,
+    hash_file,
+    hash_tree,
+    parse_size,
+)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Build and check the API compatibility.")
+    tracing.add_argument(parser)
 
     subparsers = parser.add_subparsers(dest="command")
 
@@ -34,7 +64,11 @@ def main():
         type=os.path.abspath,
         help="Path to the Maps SDK release zip archive.",
     )
-    dumpSDKParser.add_argument("--module", help="Name of the module to dump.")
+    dumpSDKParser.add_argument(
+        "--module",
+        action="append",
+        help="Name of the module to dump. Repeat the option to dump several modules of the SDK in one run.",
+    )
     dumpSDKParser.add_argument("--triplet-target", help="Clang target triplet like 'arm64-apple-ios11.0'")
     dumpSDKParser.add_argument(
         "--abi",
@@ -42,30 +76,87 @@ def main():
         action=argparse.BooleanOptionalAction,
         help="Generate ABI report.",
     )
+    dumpSDKParser.add_argument(
+        "--mode",
+        action="append",
+        choices=["api", "abi"],
+        help="Report to generate. Repeat the option to generate both API and ABI reports. Overrides --abi.",
+    )
     dumpSDKParser.add_argument(
         "-o",
         "--output-path",
         type=os.path.abspath,
         help="Path to the output JSON API report. Default to <sdk-name>.API.json",
     )
+    dumpSDKParser.add_argument(
+        "--output-dir",
+        type=os.path.abspath,
+        help="Directory for <module>.API.json and <module>.ABI.json reports when dumping several modules or modes. Default to the current directory.",
+    )
+    dumpSDKParser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Maximum number of digester processes running at the same time. Default to the number of CPUs.",
+    )
 
-    checkAPIParser = subparsers.add_parser("check-api", help="Check for API breakage.")
+    dumpSDKParser.add_argument(
+        "--cache",
+        default=True,
+        action=argparse.BooleanOptionalAction,
+        help="Reuse dumps of unchanged XCFrameworks from the local dump cache.",
+    )
+    add_cache_arguments(dumpSDKParser)
+    add_executor_arguments(dumpSDKParser)
+
+    checkAPIParser = subparsers.add_parser(
+        "check-api",
+        help="Check for API breakage.",
+        description="Compare two SDK API JSON dumps. Either side can also be an SDK zip archive or an XCFramework, "
+        "both sides are then dumped at the same time before the comparison.",
+    )
     checkAPIParser.add_argument(
         "base_dump",
         metavar="base-dump-path",
         type=os.path.abspath,
-        help="Path to the baseline (old) SDK API JSON dump.",
+        help="Path to the baseline (old) SDK API JSON dump, SDK zip archive or XCFramework.",
     )
     checkAPIParser.add_argument(
         "latest_dump",
         metavar="latest-dump-path",
         type=os.path.abspath,
-        help="Path to the latest (new) SDK API JSON dump.",
+        help="Path to the latest (new) SDK API JSON dump, SDK zip archive or XCFramework.",
+    )
+    checkAPIParser.add_argument(
+        "--module",
+        help="Name of the module to dump from SDK archives. Detected when the archive contains a single XCFramework.",
     )
+    checkAPIParser.add_argument(
+        "--dump-dir",
+        type=os.path.abspath,
+        help="Keep the dumps of SDK archives and XCFrameworks in this directory as baseline.API.json and latest.API.json. "
+        "By default they are deleted after the check.",
+    )
+    checkAPIParser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Maximum number of digester processes running at the same time. Default to the number of CPUs.",
+    )
+    checkAPIParser.add_argument(
+        "--cache",
+        default=True,
+        action=argparse.BooleanOptionalAction,
+        help="Reuse extracted archives and dumps of unchanged XCFrameworks from the local cache.",
+    )
+    add_cache_arguments(checkAPIParser)
     checkAPIParser.add_argument(
         "--breakage-allowlist-path",
         type=os.path.abspath,
-        help="Path to the file containing the list of allowed API breakages.",
+        help="Path to the file containing the list of allowed API breakages. Besides exact report lines, "
+        "entries can be 'glob:' or 'regex:' patterns, optionally scoped to a report category with a '[Category]' prefix.",
     )
     checkAPIParser.add_argument(
         "--report-path",
@@ -79,42 +170,246 @@ def main():
         action=argparse.BooleanOptionalAction,
         help="Leave a comment on the PR with the API check report.",
     )
+    checkAPIParser.add_argument(
+        "--engine",
+        default="digester",
+        choices=["digester", "native"],
+        help="Comparison engine. 'digester' runs swift-api-digester -diagnose-sdk (macOS only), "
+        "'native' diffs the dumps in Python and works on any platform.",
+    )
+    checkAPIParser.add_argument(
+        "--fingerprints",
+        default=True,
+        action=argparse.BooleanOptionalAction,
+        help="With the native engine, skip unchanged declarations using fingerprint indexes saved next to the dumps.",
+    )
+    checkAPIParser.add_argument(
+        "--fail-on-unused-allowlist-entries",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Fail when some allowlist entries did not match any breakage, so that the allowlist stays minimal.",
+    )
+    add_executor_arguments(checkAPIParser)
+
+    summarizeParser = subparsers.add_parser(
+        "summarize",
+        help="Print declaration counts of a JSON API/ABI dump.",
+        description="Stream the dump and print declaration counts per kind and module. Memory usage stays flat regardless of the dump size.",
+    )
+    summarizeParser.add_argument(
+        "dump_path",
+        metavar="dump-path",
+        type=os.path.abspath,
+        help="Path to the SDK API or ABI JSON dump.",
+    )
+
+    convertParser = subparsers.add_parser(
+        "convert",
+        help="Convert a JSON API/ABI dump to the binary format, or a binary dump back to JSON.",
+        description="Convert between JSON dumps and binary dumps. The direction is given by the format of the input.",
+    )
+    convertParser.add_argument("input_path", metavar="input-path", type=os.path.abspath, help="JSON or binary dump.")
+    convertParser.add_argument("output_path", metavar="output-path", type=os.path.abspath, help="Converted dump.")
+
+    queryParser = subparsers.add_parser(
+        "query",
+        help="Find declarations in a binary dump.",
+        description="Print the declarations of a binary dump matching all the given filters, "
+        "for example `query MapboxMaps.API.bin --name 'Viewport*' --kind Constructor`.",
+    )
+    queryParser.add_argument("dump_path", metavar="dump-path", type=os.path.abspath, help="Binary dump, see convert.")
+    queryParser.add_argument(
+        "--name",
+        help="Glob matched against the qualified name of declarations, "
+        "the printed names of the enclosing declarations and of the declaration joined with dots.",
+    )
+    queryParser.add_argument("--kind", help="Declaration kind, for example Constructor, Func, Var or Class.")
+    queryParser.add_argument(
+        "--attribute",
+        type=binary_dump.attribute_name,
+        help="Declaration attribute, as in the dump (SPIAccessControl) or in Swift (@_spi).",
+    )
+    queryParser.add_argument("--module", help="Module name.")
+    queryParser.add_argument("--usr", help="USR of the declaration.")
+    queryParser.add_argument(
+        "--json",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Print the fields of every declaration as a line of JSON.",
+    )
+
+    cacheParser = subparsers.add_parser("cache", help="Inspect or prune the local dump cache.")
+    cacheSubparsers = cacheParser.add_subparsers(dest="cache_command", required=True)
+    cacheStatsParser = cacheSubparsers.add_parser("stats", help="Print the cache location, size and number of entries.")
+    add_cache_arguments(cacheStatsParser)
+    cachePruneParser = cacheSubparsers.add_parser(
+        "prune", help="Evict least recently used dumps until the cache fits into the size budget."
+    )
+    add_cache_arguments(cachePruneParser)
+    cachePruneParser.add_argument(
+        "--max-size",
+        type=parse_size,
+        help="Size to prune the cache down to, for example '500M' or '0' to clear it. Defaults to --cache-size.",
+    )
 
     args = parser.parse_args()
+    tracing.setup(args.trace)
 
+    with tracing.span(args.command or "breaking-api-check"):
+        run_command(args)
+
+
+def run_command(args):
     if args.command == "dump":
-        dump_sdk(args.sdk_path, args.output_path, args.abi, args.module, args.triplet_target)
-    elif args.command == "check-api":
-        check_api_breaking_changes(
-            args.base_dump,
-            args.latest_dump,
-            args.breakage_allowlist_path,
-            args.report_path,
-            args.comment_pr,
+        cache = dump_cache(args) if args.cache else None
+        workspaces = workspace_cache(args) if args.cache else None
+        abi_modes = [mode == "abi" for mode in dict.fromkeys(args.mode)] if args.mode else [args.abi]
+        dump_sdk(
+            args.sdk_path,
+            args.output_path,
+            abi_modes,
+            list(dict.fromkeys(args.module or [])),
+            args.triplet_target,
+            cache,
+            args.jobs,
+            args.output_dir,
+            workspaces,
+            digester_executor(args),
         )
+    elif args.command == "check-api":
+        executor = digester_executor(args)
+        with contextlib.ExitStack() as cleanup:
+            dump_dir = args.dump_dir
+            if dump_dir is None and not (is_dump(args.base_dump) and is_dump(args.latest_dump)):
+                dump_dir = cleanup.enter_context(tempfile.TemporaryDirectory(prefix="API-check-dumps-"))
+            base_dump, latest_dump = dump_both_sides(
+                args.base_dump,
+                args.latest_dump,
+                dump_dir,
+                args.module,
+                dump_cache(args) if args.cache else None,
+                args.jobs,
+                workspace_cache(args) if args.cache else None,
+                executor,
+            )
+            check_api_breaking_changes(
+                base_dump,
+                latest_dump,
+                args.breakage_allowlist_path,
+                args.report_path,
+                args.comment_pr,
+                args.engine,
+                args.fail_on_unused_allowlist_entries,
+                executor,
+                os.path.basename(args.latest_dump),
+                args.fingerprints,
+            )
+    elif args.command == "summarize":
+        summarize_dump(args.dump_path)
+    elif args.command == "convert":
+        if binary_dump.is_binary_dump(args.input_path):
+            binary_dump.convert_to_json(args.input_path, args.output_path)
+        else:
+            binary_dump.convert_to_binary(args.input_path, args.output_path)
+        print(f"Converted {args.input_path} to {args.output_path} ({format_size(os.path.getsize(args.output_path))})")
+    elif args.command == "query":
+        query_dump(args)
+    elif args.command == "cache":
+        for cache in [dump_cache(args), workspace_cache(args)]:
+            if args.cache_command == "stats":
+                cache.print_stats()
+            elif args.cache_command == "prune":
+                evicted = cache.prune(args.max_size)
+                print(
+                    f"Evicted {len(evicted)} entries, {format_size(sum(entry.size for entry in evicted))} from {cache.root}"
+                )
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--cache-dir",
+        default=default_cache_dir(),
+        type=os.path.abspath,
+        help="Location of the dump cache. Defaults to $API_CHECK_CACHE_DIR or ~/.cache/mapbox-api-check.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        default=DEFAULT_CACHE_SIZE,
+        type=parse_size,
+        help=f"Size budget of the dump cache, for example '4G'. Defaults to {format_size(DEFAULT_CACHE_SIZE)}.",
+    )
+    parser.add_argument(
+        "--workspace-size",
+        default=DEFAULT_WORKSPACE_SIZE,
+        type=parse_size,
+        help=f"Size budget of the extracted SDK archives. Defaults to {format_size(DEFAULT_WORKSPACE_SIZE)}.",
+    )
+
+
+def add_executor_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Kill swift-api-digester runs that take longer than this number of seconds.",
+    )
+    parser.add_argument(
+        "--stream-digester-output",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Print the swift-api-digester output while it runs. By default only the end of it is printed on failure.",
+    )
+    fixtures = parser.add_mutually_exclusive_group()
+    fixtures.add_argument(
+        "--record-fixtures",
+        metavar="DIR",
+        type=os.path.abspath,
+        help="Save every swift-api-digester and xcrun run, with the files it wrote, as a fixture in DIR.",
+    )
+    fixtures.add_argument(
+        "--replay-fixtures",
+        metavar="DIR",
+        type=os.path.abspath,
+        help="Answer swift-api-digester and xcrun runs from the fixtures in DIR instead of running them. Works without Xcode.",
+    )
+
+
+def digester_executor(args) -> Executor:
+    if args.replay_fixtures:
+        return ReplayExecutor(args.replay_fixtures)
+    executor = ProcessExecutor(getattr(args, "jobs", None), args.timeout, args.stream_digester_output)
+    if args.record_fixtures:
+        return RecordingExecutor(executor, args.record_fixtures)
+    return executor
+
+
+def dump_cache(args) -> DiskCache:
+    return DiskCache(os.path.join(args.cache_dir, "dumps"), args.cache_size)
+
+
+def workspace_cache(args) -> DiskCache:
+    return DiskCache(os.path.join(args.cache_dir, "workspaces"), args.workspace_size)
 
 
 def dump_sdk(
     sdk_path: str,
     output_path: str,
-    abi: bool,
-    module_name: str,
+    abi_modes: list,
+    module_names: list,
     triplet_target: str = None,
+    cache: DiskCache = None,
+    max_workers: int = None,
+    output_dir: str = None,
+    workspaces: DiskCache = None,
+    executor: Executor = None,
 ):
-    tempDir = tempfile.mkdtemp(prefix="API-check-")
-    print(tempDir)
-
-    def dittoSDK(sdk_path, destination):
+    def dittoSDK(sdk_path):
         if os.path.splitext(sdk_path)[1] == ".zip":
-            # If the SDK is a zip archive, unzip it first.
-            # Then copy the contents of artifacts/ folder to the destination.
-            # to align structure with other SDKs.
-            shutil.unpack_archive(sdk_path, destination)
-            if os.path.exists(os.path.join(destination, "artifacts")):
-                artifacts_path = os.path.join(destination, "artifacts/")
-                for f in os.listdir(artifacts_path):
-                    shutil.move(os.path.join(artifacts_path, f), destination)
-                shutil.rmtree(artifacts_path)
+            # If the SDK is a zip archive, extract the parts needed for dumping.
+            # XCFrameworks land in the root of the destination to align structure with other SDKs.
+            if workspaces is not None:
+                return sdk_archive.cached_sdk_workspace(sdk_path, workspaces)
+            destination = cleanup.enter_context(tempfile.TemporaryDirectory(prefix="API-check-"))
+            sdk_archive.extract_sdk_archive(sdk_path, destination)
             return destination
         elif os.path.splitext(sdk_path)[1] == ".xcframework":
             return os.path.dirname(sdk_path)
@@ -126,39 +421,147 @@ def dump_sdk(
 
     def detect_module_name(sdk_path: str, frameworks_root: str) -> str:
         if os.path.splitext(sdk_path)[1] == ".zip":
-            modules = [f for f in os.listdir(frameworks_root) if f.endswith(".xcframework")]
+            modules = XCFrameworkInventory(frameworks_root).names()
             if len(modules) != 1:
                 raise Exception(f"Could not detect module name from {sdk_path}")
             else:
-                return modules[0].split(".")[0]
+                return modules[0]
         elif os.path.splitext(sdk_path)[1] == ".xcframework":
             return os.path.splitext(os.path.basename(sdk_path))[0]
         else:
             raise Exception("Cannot detect module name from SDK path. Please specify the module name with --module")
 
-    frameworks_root = dittoSDK(sdk_path, tempDir)
-    if module_name is None:
-        print("Detecting module name...")
-        module_name = detect_module_name(sdk_path, frameworks_root)
-        print(f"Module name: {module_name}")
+    with contextlib.ExitStack() as cleanup:
+        with tracing.span("Prepare SDK", path=sdk_path):
+            frameworks_root = dittoSDK(sdk_path)
+        if not module_names:
+            print("Detecting module name...")
+            module_names = [detect_module_name(sdk_path, frameworks_root)]
+            print(f"Module name: {module_names[0]}")
+
+        jobs = [(module_name, abi) for module_name in module_names for abi in abi_modes]
+        if output_path is not None and len(jobs) > 1:
+            raise Exception(
+                "--output-path can only be used to dump a single module in a single mode. Use --output-dir."
+            )
 
-    xcframework_path = os.path.join(frameworks_root, f"{module_name}.xcframework")
-    digester = APIDigester()
-    if output_path is None:
-        suffix = "ABI" if abi else "API"
-        output_path = os.path.abspath(f"{module_name}.{suffix}.json")
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
 
-    if os.path.exists(xcframework_path):
-        current_xcframework = XCFramework(xcframework_path)
+        digester = APIDigester(executor)
+        # Shared by all jobs so that every plist and binary is parsed at most once per run.
+        inventory = XCFrameworkInventory(frameworks_root)
 
-        digester.dump_sdk_xcframework(current_xcframework, frameworks_root, output_path, abi)
-    else:
-        # We are in the DerivedData folder.
-        if triplet_target is None:
-            raise Exception(
-                "Please specify the triplet target with --triplet-target. That option is required when dumping from modules folder."
+        def dump_job(module_name: str, abi: bool) -> float:
+            with tracing.span(f"Dump {job_name(module_name, abi)}"):
+                return run_dump_job(module_name, abi)
+
+        def run_dump_job(module_name: str, abi: bool) -> float:
+            started_at = time.monotonic()
+            job_output_path = output_path
+            if job_output_path is None:
+                suffix = "ABI" if abi else "API"
+                job_output_path = os.path.join(output_dir or os.getcwd(), f"{module_name}.{suffix}.json")
+
+            current_xcframework = inventory.framework(module_name)
+            if current_xcframework is not None:
+                digester.dump_sdk_xcframework(current_xcframework, inventory, job_output_path, abi, cache)
+            else:
+                # We are in the DerivedData folder.
+                if triplet_target is None:
+                    raise Exception(
+                        "Please specify the triplet target with --triplet-target. That option is required when dumping from modules folder."
+                    )
+                digester.dump_sdk(frameworks_root, module_name, triplet_target, job_output_path, abi)
+            return time.monotonic() - started_at
+
+        def job_name(module_name: str, abi: bool) -> str:
+            return f"{module_name} ({'ABI' if abi else 'API'})"
+
+        timings = []
+        traced_dump_job = tracing.in_current_span(dump_job)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(traced_dump_job, module_name, abi): (module_name, abi) for module_name, abi in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    elapsed = future.result()
+                except Exception as error:
+                    # Fail fast: drop queued jobs and stop the running digester processes.
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    digester.terminate()
+                    print(f"Failed to dump {job_name(*futures[future])}", file=sys.stderr)
+                    if isinstance(error, APIDigester.DigesterError):
+                        print(error.stderr, file=sys.stderr)
+                    raise
+                print(f"Dumped {job_name(*futures[future])} in {elapsed:.1f}s")
+                timings.append((job_name(*futures[future]), elapsed))
+
+        if len(timings) > 1:
+            print("Dump timings:")
+            width = max(len(name) for name, _ in timings)
+            for name, elapsed in sorted(timings, key=lambda timing: -timing[1]):
+                print(f"  {name:<{width}}  {elapsed:.1f}s")
+
+
+def is_dump(path: str) -> bool:
+    return os.path.splitext(path)[1] == ".json"
+
+
+def dump_both_sides(
+    baseline_path: str,
+    latest_path: str,
+    dump_dir: str,
+    module_name: str = None,
+    cache: DiskCache = None,
+    max_workers: int = None,
+    workspaces: DiskCache = None,
+    executor: Executor = None,
+) -> tuple:
+    """Dumps the sides of the check that are SDK archives or XCFrameworks, both at the same time.
+
+    Returns the paths of the baseline and latest API dumps. The sides share the executor, so `max_workers`
+    bounds the digester processes of both, and the caches, so an unchanged baseline is not dumped again.
+    """
+    sides = {"baseline": baseline_path, "latest": latest_path}
+    dumps = {name: path for name, path in sides.items() if is_dump(path)}
+    pending = {name: path for name, path in sides.items() if not is_dump(path)}
+    if not pending:
+        return dumps["baseline"], dumps["latest"]
+    for path in pending.values():
+        if os.path.splitext(path)[1] not in (".zip", ".xcframework"):
+            raise Exception(f"{path} must be an API JSON dump, an SDK zip archive or an XCFramework")
+
+    executor = executor or ProcessExecutor(max_workers)
+    os.makedirs(dump_dir, exist_ok=True)
+
+    def dump_side(name: str, path: str) -> str:
+        output_path = os.path.join(dump_dir, f"{name}.API.json")
+        with tracing.span(f"Dump {name}", path=path):
+            dump_sdk(
+                path,
+                output_path,
+                [False],
+                [module_name] if module_name else [],
+                cache=cache,
+                max_workers=max_workers,
+                workspaces=workspaces,
+                executor=executor,
             )
-        digester.dump_sdk(frameworks_root, module_name, triplet_target, output_path, abi)
+        return output_path
+
+    started_at = time.monotonic()
+    traced_dump_side = tracing.in_current_span(dump_side)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(pending)) as pool:
+        futures = {pool.submit(traced_dump_side, name, path): name for name, path in pending.items()}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                dumps[futures[future]] = future.result()
+            except Exception:
+                # The sides share the executor, stop the digester processes of the other side as well.
+                executor.terminate()
+                raise
+    print(f"Dumped {' and '.join(pending)} in {time.monotonic() - started_at:.1f}s")
+    return dumps["baseline"], dumps["latest"]
 
 
 def check_api_breaking_changes(
@@ -167,19 +570,35 @@ def check_api_breaking_changes(
     breakage_allow_list_path: str,
     report_path: str,
     should_comment_pr: bool,
+    engine: str = "digester",
+    fail_on_unused_allowlist_entries: bool = False,
+    executor: Executor = None,
+    latest_name: str = None,
+    use_fingerprints: bool = True,
 ):
-    tool = APIDigester()
+    tool = APIDigester(executor)
 
-    report = tool.compare(baseline_dump_path, latest_dump_path, report_path, breakage_allow_list_path)
+    report = tool.compare(
+        baseline_dump_path, latest_dump_path, report_path, breakage_allow_list_path, engine, use_fingerprints
+    )
 
     if should_comment_pr:
-        add_comment_to_pr(report)
+        with tracing.span("Comment on PR"):
+            add_comment_to_pr(report)
+
+    if report.unused_allowlist_entries:
+        print(f"Allowlist entries that matched nothing in {os.path.basename(breakage_allow_list_path)}:")
+        for entry in report.unused_allowlist_entries:
+            print(f"  {entry.line_number}: {entry.text}")
+        if fail_on_unused_allowlist_entries:
+            print("ERROR: Remove the unused allowlist entries listed above.", file=sys.stderr)
+            exit(1)
 
     if not report.is_good:
         print(
             f"""
 ======================================
-ERROR: API breakage detected in {os.path.basename(latest_dump_path)}
+ERROR: API breakage detected in {latest_name or os.path.basename(latest_dump_path)}
 ======================================
 {open(report_path, "r").read()}
         """,
@@ -188,11 +607,48 @@ ERROR: API breakage detected in {os.path.basename(latest_dump_path)}
         exit(1)
 
 
+def summarize_dump(dump_path: str):
+    by_kind = {}
+    by_module = {}
+    total = 0
+    for declaration in api_dump_reader.iter_declarations(dump_path):
+        total += 1
+        by_kind[declaration.decl_kind] = by_kind.get(declaration.decl_kind, 0) + 1
+        module = declaration.module or "<unknown>"
+        by_module[module] = by_module.get(module, 0) + 1
+
+    def print_counts(title, counts):
+        print(f"{title}:")
+        width = max((len(key) for key in counts), default=0)
+        for key, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+            print(f"  {key:<{width}}  {count}")
+
+    print(f"{os.path.basename(dump_path)}: {total} declarations")
+    print_counts("Declarations per kind", by_kind)
+    print_counts("Declarations per module", by_module)
+
+
+def query_dump(args):
+    started_at = time.perf_counter()
+    with binary_dump.BinaryDump(args.dump_path) as dump:
+        with tracing.span("Query dump"):
+            matches = dump.query(args.name, args.kind, args.attribute, args.module, args.usr)
+        for index in matches:
+            if args.json:
+                print(json.dumps(dump.fields(index)))
+            else:
+                node = dump.node(index)
+                print(f"{node.decl_kind} {dump.qualified_name(index)}  [{node.module}] {node.usr or ''}".rstrip())
+    print(f"{len(matches)} declarations in {(time.perf_counter() - started_at) * 1000:.1f} ms", file=sys.stderr)
+
+
 def add_comment_to_pr(report: "APIDigester.BreakageReport"):
     print("Commenting on PR")
 
     helper = GHHelper()
     number = helper.findPRNumber()
+    if number is None:
+        return
     comments = helper.findPRComments(number)
 
     def findApiReportComment(comments):
@@ -220,57 +676,148 @@ def add_comment_to_pr(report: "APIDigester.BreakageReport"):
 
 
 class GHHelper:
-    def __init__(self):
-        pass
+    def __init__(self, client: GitHubClient = None):
+        self.client = client or GitHubClient()
+        self.__repository = None
+        self.__repository_resolved = False
+
+    @property
+    def repository(self):
+        """`owner/repo` of the repository the PR is opened against, or None when it cannot be detected."""
+        if not self.__repository_resolved:
+            self.__repository = self.findRepository()
+            self.__repository_resolved = True
+        return self.__repository
+
+    @staticmethod
+    def findRepository():
+        if os.environ.get("GITHUB_REPOSITORY"):
+            return os.environ["GITHUB_REPOSITORY"]
+        try:
+            proc = tracing.run(["git", "remote", "get-url", "origin"], capture_output=True, text=True)
+        except OSError:
+            proc = None
+        match = proc and re.search(r"[:/]([^/:]+/[^/]+?)(?:\.git)?/?$", proc.stdout.strip())
+        if not proc or proc.returncode != 0 or match is None:
+            print("Cannot detect the GitHub repository. Set GITHUB_REPOSITORY to 'owner/repo'.")
+            return None
+        return match.group(1)
+
+    @staticmethod
+    def git(*arguments):
+        try:
+            proc = tracing.run(["git", *arguments], capture_output=True, text=True)
+        except OSError:
+            return None
+        return proc.stdout.strip() if proc.returncode == 0 else None
 
     def findPRNumber(self):
-        proc = subprocess.run(["gh", "pr", "view", "--json", "number", "-q", ".number"], capture_output=True, text=True)
-        if proc.returncode != 0:
-            print(f"Failed to find PR number. Error: {proc.stderr}")
+        # CI services expose the PR of the build, which saves a request.
+        for variable in ("CIRCLE_PULL_REQUEST", "GITHUB_REF"):
+            match = re.search(r"/pull/(\d+)", os.environ.get(variable, ""))
+            if match:
+                return match.group(1)
+        # GitHub Actions describe pull_request events, including those of forks, in the event payload.
+        if os.environ.get("GITHUB_EVENT_PATH"):
+            try:
+                with open(os.environ["GITHUB_EVENT_PATH"]) as f:
+                    number = (json.load(f).get("pull_request") or {}).get("number")
+            except (OSError, ValueError, AttributeError):
+                number = None
+            if number:
+                return str(number)
+
+        if self.repository is None:
+            print("Failed to find PR number. The GitHub repository is unknown.")
+            return None
+        branch = os.environ.get("CIRCLE_BRANCH") or self.git("rev-parse", "--abbrev-ref", "HEAD")
+        sha = os.environ.get("CIRCLE_SHA1") or self.git("rev-parse", "HEAD")
+        owner = self.repository.split("/")[0]
+        try:
+            pulls = []
+            if branch:
+                pulls = self.client.get(
+                    f"repos/{self.repository}/pulls", {"head": f"{owner}:{branch}", "state": "open"}
+                )
+            if not pulls and sha:
+                # PRs from forks have another owner for their head branch, they are found by their head commit.
+                pulls = [
+                    pull
+                    for pull in self.client.get_all(f"repos/{self.repository}/pulls", {"state": "open"})
+                    if pull["head"]["sha"] == sha
+                ]
+        except (GitHubError, OSError) as error:
+            print(f"Failed to find PR number. Error: {error}")
+            return None
+        if not pulls:
+            print(f"Failed to find PR number. No open PR for branch {branch} or commit {sha}")
             return None
-        # Check that proc.stdout is a number
-        return proc.stdout.rstrip()
+        return str(pulls[0]["number"])
 
     def findPRComments(self, prNumber):
-        proc = subprocess.run(
-            ["gh", "api", "repos/{owner}/{repo}/issues" + f"/{prNumber}/comments"], capture_output=True, text=True
-        )
-        if proc.returncode != 0:
-            print(f"Failed to find PR comments. Error: {proc.stderr}")
+        try:
+            return self.client.get_all(f"repos/{self.repository}/issues/{prNumber}/comments")
+        except (GitHubError, OSError) as error:
+            print(f"Failed to find PR comments. Error: {error}")
             return None
-        return json.loads(proc.stdout)
 
     def addCommentToPR(self, prNumber, body):
-        proc = subprocess.run(
-            ["gh", "api", "repos/{owner}/{repo}/issues" + f"/{prNumber}/comments", "-f", f"body={body}"],
-            capture_output=True,
-            text=True,
-        )
-        if proc.returncode != 0:
-            print(f"Failed to add comment. Error: {proc.stderr}")
+        try:
+            return self.client.post(f"repos/{self.repository}/issues/{prNumber}/comments", {"body": body})
+        except (GitHubError, OSError) as error:
+            print(f"Failed to add comment. Error: {error}")
             return None
-        return json.loads(proc.stdout)
 
     def updateCommentToPR(self, commentId, body):
-        proc = subprocess.run(
-            ["gh", "api", "repos/{owner}/{repo}/issues" + f"/comments/{commentId}", "-f", f"body={body}"],
-            capture_output=True,
-            text=True,
-        )
-        if proc.returncode != 0:
-            print(f"Failed to update comment. Error: {proc.stderr}")
+        try:
+            return self.client.patch(f"repos/{self.repository}/issues/comments/{commentId}", {"body": body})
+        except (GitHubError, OSError) as error:
+            print(f"Failed to update comment. Error: {error}")
             return None
-        return json.loads(proc.stdout)
 
 
 class APIDigester:
+    class DigesterError(Exception):
+        def __init__(self, message, stderr):
+            super().__init__(message)
+            self.stderr = stderr
+
+    def __init__(self, executor: Executor = None):
+        self.executor = executor or ProcessExecutor()
+
+    def run_digester(self, arguments: list, cwd: str = None, label: str = None) -> Executor.Result:
+        """Runs swift-api-digester and raises DigesterError with the end of its stderr on failure. Safe to call from several threads."""
+        try:
+            result = self.executor.run(arguments, cwd, label)
+        except ExecutorError as error:
+            raise APIDigester.DigesterError(str(error), "") from error
+        if result.timed_out:
+            raise APIDigester.DigesterError("swift-api-digester timed out", result.stderr)
+        if result.returncode != 0:
+            raise APIDigester.DigesterError("swift-api-digester failed", result.stderr)
+        return result
+
+    def terminate(self):
+        """Kills running digester processes and rejects new ones."""
+        self.executor.terminate()
+
     def compare(
         self,
         baseline_path,
         current_path,
         output_path,
         breakage_allow_list_path: str = None,
+        engine: str = "digester",
+        use_fingerprints: bool = True,
     ):
+        if engine == "native":
+            with tracing.span("Diagnose SDK", engine=engine):
+                native_digester.diagnose_sdk(baseline_path, current_path, output_path, use_fingerprints)
+            allowlist = None
+            if breakage_allow_list_path:
+                allowlist = self.apply_breakage_allow_list_workaround(breakage_allow_list_path, output_path)
+            return APIDigester.BreakageReport(output_path, allowlist)
+
         arguments = [
             "xcrun",
             "--sdk",
@@ -286,31 +833,28 @@ class APIDigester:
             "-v",
         ]
 
-        if breakage_allow_list_path:
-            arguments.append("-breakage-allowlist-path")
-            arguments.append(breakage_allow_list_path)
-
-        proc = subprocess.run(arguments, capture_output=True, text=True)
-        if proc.returncode != 0:
-            print(proc.stderr)
-            raise Exception("swift-api-digester failed")
+        # The allowlist is applied below rather than by the digester, so that unused entries can be reported.
+        try:
+            with tracing.span("Diagnose SDK", engine=engine):
+                self.run_digester(arguments, label="diagnose")
+        except APIDigester.DigesterError as error:
+            print(error.stderr)
+            raise
 
+        allowlist = None
         if breakage_allow_list_path:
-            self.apply_breakage_allow_list_workaround(breakage_allow_list_path, output_path)
+            allowlist = self.apply_breakage_allow_list_workaround(breakage_allow_list_path, output_path)
 
-        return APIDigester.BreakageReport(output_path)
+        return APIDigester.BreakageReport(output_path, allowlist)
 
     # Workaround: sometime swift-api-digester cannot skip some lines of the allow list
     # For example: 'Protocol LocationProvider has generic signature change from  to <Self : AnyObject>'
-    def apply_breakage_allow_list_workaround(self, allowlist_path, report_path):
-        with open(report_path, "r") as f:
-            report_list = f.readlines()
-        with open(allowlist_path, "r") as f:
-            allow_list = [line.strip() for line in f.readlines() if line.strip() != ""]
-
-        report_list = [line for line in report_list if line.strip() not in allow_list or line.startswith("/* ")]
-        with open(report_path, "w") as f:
-            f.write("".join(report_list))
+    # The whole allowlist is applied here, which also enables patterns, category scopes and unused entry reports.
+    @tracing.traced("Apply allowlist")
+    def apply_breakage_allow_list_workaround(self, allowlist_path, report_path) -> BreakageAllowlist:
+        allowlist = BreakageAllowlist.load(allowlist_path)
+        allowlist.filter_report(report_path)
+        return allowlist
 
     def dump_sdk(
         self,
@@ -342,19 +886,18 @@ class APIDigester:
         if abi:
             arguments.append("-abi")
 
-        proc = subprocess.run(arguments, capture_output=True, text=True, cwd=modules_path)
-        if proc.returncode != 0:
-            print(proc.stderr)
-            raise Exception("swift-api-digester failed")
+        self.run_digester(arguments, cwd=modules_path, label=f"{module_name} {'ABI' if abi else 'API'}")
 
     def dump_sdk_xcframework(
         self,
         xcframework: "XCFramework",
-        dependencies_path,
+        inventory: "XCFrameworkInventory",
         output_path,
         abi: bool = False,
+        cache: DiskCache = None,
     ):
         module = xcframework.iOSDeviceModule()
+        module_paths = []
         arguments = [
             "xcrun",
             "--sdk",
@@ -373,28 +916,16 @@ class APIDigester:
             arguments.append("-abi")
 
         def append_dependencies(arguments: list):
-            deps = module.list_dependencies()
-            xcDeps = list(
-                map(
-                    lambda dep: XCFramework(os.path.join(dependencies_path, dep)),
-                    [
-                        d
-                        for d in os.listdir(dependencies_path)
-                        if os.path.isdir(os.path.join(dependencies_path, d)) and d.endswith(".xcframework")
-                    ],
-                )
-            )
-
-            for dependency in deps:
-                dependency_name = os.path.basename(dependency)
-                for xcDep in xcDeps:
-                    if xcDep.name == dependency_name:
-                        arguments.append("-iframework")
-                        arguments.append(os.path.dirname(xcDep.iOSDeviceModule().path))
-                        break
+            for dependency in module.list_dependencies():
+                dependency_framework = inventory.framework(os.path.basename(dependency))
+                if dependency_framework is None:
+                    continue
+                dependency_module = dependency_framework.iOSDeviceModule()
+                arguments.append("-iframework")
+                arguments.append(os.path.dirname(dependency_module.path))
+                module_paths.append(dependency_module)
 
         def append_module(arguments: list):
-            module = xcframework.iOSDeviceModule()
             arguments.extend(
                 [
                     "-module",
@@ -405,31 +936,82 @@ class APIDigester:
                     os.path.dirname(module.path),
                 ]
             )
+            module_paths.append(module)
 
         append_dependencies(arguments)
         append_module(arguments)
 
-        proc = subprocess.run(arguments, capture_output=True, text=True)
-        if proc.returncode != 0:
-            print(proc.stderr)
-            raise Exception("swift-api-digester failed")
+        if cache is not None:
+            with tracing.span("Look up dump cache") as span:
+                key = self.dump_cache_key(arguments, module_paths, abi)
+                cached_dump = cache.get(key, ".json")
+                span.set(hit=cached_dump is not None)
+            if cached_dump is not None:
+                print(f"Using cached dump {cached_dump}")
+                shutil.copyfile(cached_dump, output_path)
+                return
+
+        self.run_digester(arguments, label=f"{xcframework.name} {'ABI' if abi else 'API'}")
+
+        if cache is not None:
+            cache.put_file(key, output_path, ".json")
+
+    def dump_cache_key(self, arguments: list, modules: list, abi: bool) -> str:
+        """Hashes the digester, its arguments and the contents of the dumped module and its dependencies."""
+        h = hashlib.sha256()
+        h.update(self.digester_identity().encode("utf-8") + b"\0")
+        h.update(b"abi\0" if abi else b"api\0")
+
+        # Output and temporary locations don't affect the dump, only the names of the inputs do.
+        normalized_arguments = []
+        for index, argument in enumerate(arguments):
+            if index > 0 and arguments[index - 1] == "-o":
+                continue
+            normalized_arguments.append(os.path.basename(argument) if os.path.isabs(argument) else argument)
+        h.update(json.dumps(normalized_arguments).encode("utf-8"))
+
+        for module in sorted(modules, key=lambda module: module.path):
+            h.update(os.path.basename(module.path).encode("utf-8") + b"\0")
+            hash_file(h, os.path.join(module.path, module.executable_path()))
+            for interface_dir in ["Modules", "Headers"]:
+                if os.path.isdir(os.path.join(module.path, interface_dir)):
+                    hash_tree(h, os.path.join(module.path, interface_dir))
+        return h.hexdigest()
+
+    def digester_identity(self) -> str:
+        if not hasattr(self, "_digester_identity"):
+            self._digester_identity = ""
+            try:
+                result = self.executor.run(
+                    ["xcrun", "--sdk", "iphoneos", "--find", "swift-api-digester"], label="xcrun --find"
+                )
+            except (OSError, ExecutorError):
+                return self._digester_identity
+            path = result.stdout.strip()
+            if result.returncode == 0 and not result.timed_out and os.path.exists(path):
+                stat = os.stat(path)
+                self._digester_identity = f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+        return self._digester_identity
 
     class BreakageReport:
-        def __init__(self, path):
+        def __init__(self, path, allowlist: BreakageAllowlist = None):
             self.path = path
             self.breakage = {}
             self.__parseReport()
             self.is_good = not self.breakage
+            self.unused_allowlist_entries = allowlist.unused_entries() if allowlist is not None else []
 
         def __parseReport(self):
-            for line in open(self.path).readlines():
-                if len(line.strip()) == 0:
-                    category = None
-                    continue
-                if line.startswith("/* "):
-                    category = line[3:-4]
-                elif category:
-                    self.breakage[category] = self.breakage.get(category, []) + [line]
+            category = None
+            with open(self.path) as f:
+                for line in f:
+                    if len(line.strip()) == 0:
+                        category = None
+                        continue
+                    if line.startswith("/* "):
+                        category = line[3:-4]
+                    elif category:
+                        self.breakage.setdefault(category, []).append(line)
 
         def reportComment(self):
             if self.is_good:
@@ -444,58 +1026,269 @@ class APIDigester:
 
 
 class Executable:
-    def __init__(self, path):
-        self.path = path
+    """Reads load commands of a Mach-O binary, a fat binary or a static archive of Mach-O objects.
+
+    The file is memory-mapped and only the headers and load commands are decoded.
+    """
+
+    FAT_MAGIC = 0xCAFEBABE
+    FAT_MAGIC_64 = 0xCAFEBABF
+    MH_MAGIC = 0xFEEDFACE
+    MH_MAGIC_64 = 0xFEEDFACF
+    AR_MAGIC = b"!<arch>\n"
+
+    LC_REQ_DYLD = 0x80000000
+    LOAD_COMMANDS = {
+        0x1: "LC_SEGMENT",
+        0x2: "LC_SYMTAB",
+        0xB: "LC_DYSYMTAB",
+        0xC: "LC_LOAD_DYLIB",
+        0xD: "LC_ID_DYLIB",
+        0x19: "LC_SEGMENT_64",
+        0x1B: "LC_UUID",
+        0x1D: "LC_CODE_SIGNATURE",
+        0x1E: "LC_SEGMENT_SPLIT_INFO",
+        0x20: "LC_LAZY_LOAD_DYLIB",
+        0x21: "LC_ENCRYPTION_INFO",
+        0x24: "LC_VERSION_MIN_MACOSX",
+        0x25: "LC_VERSION_MIN_IPHONEOS",
+        0x26: "LC_FUNCTION_STARTS",
+        0x29: "LC_DATA_IN_CODE",
+        0x2A: "LC_SOURCE_VERSION",
+        0x2C: "LC_ENCRYPTION_INFO_64",
+        0x2F: "LC_VERSION_MIN_TVOS",
+        0x30: "LC_VERSION_MIN_WATCHOS",
+        0x31: "LC_NOTE",
+        0x32: "LC_BUILD_VERSION",
+        0x18 | LC_REQ_DYLD: "LC_LOAD_WEAK_DYLIB",
+        0x1C | LC_REQ_DYLD: "LC_RPATH",
+        0x1F | LC_REQ_DYLD: "LC_REEXPORT_DYLIB",
+        0x22 | LC_REQ_DYLD: "LC_DYLD_INFO_ONLY",
+        0x23 | LC_REQ_DYLD: "LC_LOAD_UPWARD_DYLIB",
+        0x28 | LC_REQ_DYLD: "LC_MAIN",
+        0x33 | LC_REQ_DYLD: "LC_DYLD_EXPORTS_TRIE",
+        0x34 | LC_REQ_DYLD: "LC_DYLD_CHAINED_FIXUPS",
+    }
+    DYLIB_COMMANDS = {
+        "LC_ID_DYLIB",
+        "LC_LOAD_DYLIB",
+        "LC_LOAD_WEAK_DYLIB",
+        "LC_REEXPORT_DYLIB",
+        "LC_LAZY_LOAD_DYLIB",
+        "LC_LOAD_UPWARD_DYLIB",
+    }
+    VERSION_MIN_PLATFORMS = {
+        "LC_VERSION_MIN_MACOSX": "macos",
+        "LC_VERSION_MIN_IPHONEOS": "ios",
+        "LC_VERSION_MIN_TVOS": "tvos",
+        "LC_VERSION_MIN_WATCHOS": "watchos",
+    }
+    PLATFORMS = {
+        1: "macos",
+        2: "ios",
+        3: "tvos",
+        4: "watchos",
+        6: "maccatalyst",
+        7: "ios-simulator",
+        8: "tvos-simulator",
+        9: "watchos-simulator",
+        11: "xros",
+        12: "xros-simulator",
+    }
+    CPU_TYPES = {
+        (0x0100000C, 2): "arm64e",
+        (0x0100000C, None): "arm64",
+        (0x0200000C, None): "arm64_32",
+        (0x01000007, None): "x86_64",
+        (12, 9): "armv7",
+        (12, 11): "armv7s",
+        (12, 12): "armv7k",
+        (12, None): "arm",
+        (7, None): "i386",
+    }
+
+    class Slice:
+        def __init__(self, architecture: str, load_commands: list):
+            self.architecture = architecture
+            self.load_commands = load_commands
 
-    def parse_load_commands(self):
-        otool_proc = subprocess.run(["otool", "-l", self.path], capture_output=True, text=True)
-        if otool_proc.returncode != 0:
-            print(otool_proc.stderr)
-            raise Exception(f"Failed to run otool -l {self.path}")
+        def __repr__(self):
+            return f"Executable.Slice({self.architecture}, {len(self.load_commands)} load commands)"
 
-        load_commands = []
-        command_buffer = {}
-        for line in otool_proc.stdout.splitlines()[1:]:
-            line = line.strip()
-            if len(line) == 0:
-                continue
+    def __init__(self, path):
+        self.path = path
+        self.__slices = None
+
+    def slices(self) -> list:
+        if self.__slices is None:
+            with open(self.path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    self.__slices = self.__parse(data)
+        return self.__slices
+
+    def slice(self, architecture: str = None) -> "Executable.Slice":
+        """Returns the slice for `architecture`, or the first slice of the binary."""
+        slices = self.slices()
+        if architecture is None:
+            return slices[0]
+        for binary_slice in slices:
+            if binary_slice.architecture == architecture:
+                return binary_slice
+        raise Exception(f"{self.path} has no {architecture} slice")
+
+    def architectures(self) -> list:
+        return [binary_slice.architecture for binary_slice in self.slices()]
+
+    def parse_load_commands(self, architecture: str = None) -> list:
+        return self.slice(architecture).load_commands
+
+    def dylibs(self, architecture: str = None) -> list:
+        return [
+            command["name"]
+            for command in self.parse_load_commands(architecture)
+            if command["cmd"] in Executable.DYLIB_COMMANDS and command["cmd"] != "LC_ID_DYLIB"
+        ]
 
-            if line.startswith("Load command"):
-                if command_buffer and len(command_buffer) > 0:
-                    load_commands.append(command_buffer)
-                command_buffer = {}
-            elif line.startswith("Section"):
-                if command_buffer and len(command_buffer) > 0:
-                    load_commands.append(command_buffer)
-                command_buffer = None
-            elif command_buffer is not None:
-                key = line.split(" ")[0]
-                value = " ".join(line.split(" ")[1:])
-                command_buffer[key] = value
+    def rpaths(self, architecture: str = None) -> list:
+        return [command["path"] for command in self.parse_load_commands(architecture) if command["cmd"] == "LC_RPATH"]
 
-        if command_buffer is not None and len(command_buffer) > 0:
-            load_commands.append(command_buffer)
+    def minimum_os_version(self, architecture: str = None):
+        for command in self.parse_load_commands(architecture):
+            if "minos" in command:
+                return command["minos"]
+        return None
 
-        return load_commands
+    def platform(self, architecture: str = None):
+        for command in self.parse_load_commands(architecture):
+            if "platform" in command:
+                return command["platform"]
+        return None
 
     def list_all_dependencies(self):
-        dynamic_dependencies = (
-            subprocess.run(["xcrun", "otool", "-L", self.path], capture_output=True, text=True)
-            .stdout.strip()
-            .split("\n\t")
+        # Matches `otool -L`: the install name of a dylib comes first, followed by the libraries it loads.
+        return [
+            command["name"] for command in self.parse_load_commands() if command["cmd"] in Executable.DYLIB_COMMANDS
+        ]
+
+    def __parse(self, data) -> list:
+        if data[:8] == Executable.AR_MAGIC:
+            return self.__parse_archive(data)
+
+        (magic,) = struct.unpack_from(">I", data, 0)
+        if magic in (Executable.FAT_MAGIC, Executable.FAT_MAGIC_64):
+            (count,) = struct.unpack_from(">I", data, 4)
+            slices = []
+            for index in range(count):
+                if magic == Executable.FAT_MAGIC:
+                    _, _, offset, size, _ = struct.unpack_from(">5I", data, 8 + index * 20)
+                else:
+                    _, _, offset, size, _, _ = struct.unpack_from(">IIQQII", data, 8 + index * 32)
+                slices.extend(self.__parse_thin(data, offset, offset + size))
+            return slices
+        return self.__parse_thin(data, 0, len(data))
+
+    def __parse_archive(self, data) -> list:
+        # Static libraries carry no dylib load commands. The first object describes the architecture and deployment target.
+        offset = len(Executable.AR_MAGIC)
+        while offset + 60 <= len(data):
+            header = data[offset : offset + 60]
+            name = header[:16].decode("ascii", "replace").strip()
+            size = int(header[48:58].decode("ascii").strip())
+            body = offset + 60
+            if name.startswith("#1/"):
+                name_length = int(name[3:])
+                name = data[body : body + name_length].rstrip(b"\0").decode("utf-8", "replace")
+                body += name_length
+            end = offset + 60 + size
+            if name.endswith(".o"):
+                slices = self.__parse_thin(data, body, end)
+                if slices:
+                    return [
+                        Executable.Slice(s.architecture, [c for c in s.load_commands if "minos" in c]) for s in slices
+                    ]
+            offset = end + (end % 2)
+        return []
+
+    def __parse_thin(self, data, start: int, end: int) -> list:
+        (magic,) = struct.unpack_from("<I", data, start)
+        if magic in (Executable.MH_MAGIC, Executable.MH_MAGIC_64):
+            order = "<"
+        else:
+            (magic,) = struct.unpack_from(">I", data, start)
+            order = ">"
+        if magic not in (Executable.MH_MAGIC, Executable.MH_MAGIC_64):
+            raise Exception(f"{self.path} is not a Mach-O binary")
+
+        cpu_type, cpu_subtype, _, command_count, _, _ = struct.unpack_from(order + "6I", data, start + 4)
+        architecture = Executable.CPU_TYPES.get(
+            (cpu_type, cpu_subtype & 0x00FFFFFF), Executable.CPU_TYPES.get((cpu_type, None), hex(cpu_type))
         )
-        return list(map(lambda x: x.split()[0], dynamic_dependencies[1:]))
+
+        offset = start + (32 if magic == Executable.MH_MAGIC_64 else 28)
+        load_commands = []
+        for _ in range(command_count):
+            cmd, cmdsize = struct.unpack_from(order + "2I", data, offset)
+            if cmdsize < 8 or offset + cmdsize > end:
+                raise Exception(f"{self.path} has a malformed load command at offset {offset}")
+            load_commands.append(self.__decode_load_command(data, offset, cmd, cmdsize, order))
+            offset += cmdsize
+        return [Executable.Slice(architecture, load_commands)]
+
+    @staticmethod
+    def __version(value: int) -> str:
+        major, minor, patch = value >> 16, (value >> 8) & 0xFF, value & 0xFF
+        return f"{major}.{minor}.{patch}" if patch else f"{major}.{minor}"
+
+    def __decode_load_command(self, data, offset: int, cmd: int, cmdsize: int, order: str) -> dict:
+        name = Executable.LOAD_COMMANDS.get(cmd, hex(cmd))
+        command = {"cmd": name, "cmdsize": cmdsize}
+
+        def string_at(string_offset: int) -> str:
+            raw = data[offset + string_offset : offset + cmdsize]
+            return raw.split(b"\0", 1)[0].decode("utf-8")
+
+        if name in Executable.DYLIB_COMMANDS:
+            name_offset, timestamp, current_version, compatibility_version = struct.unpack_from(
+                order + "4I", data, offset + 8
+            )
+            command["name"] = string_at(name_offset)
+            command["current_version"] = Executable.__version(current_version)
+            command["compatibility_version"] = Executable.__version(compatibility_version)
+        elif name == "LC_RPATH":
+            (path_offset,) = struct.unpack_from(order + "I", data, offset + 8)
+            command["path"] = string_at(path_offset)
+        elif name == "LC_BUILD_VERSION":
+            platform, minos, sdk = struct.unpack_from(order + "3I", data, offset + 8)
+            command["platform"] = Executable.PLATFORMS.get(platform, str(platform))
+            command["minos"] = Executable.__version(minos)
+            command["sdk"] = Executable.__version(sdk)
+        elif name in Executable.VERSION_MIN_PLATFORMS:
+            version, sdk = struct.unpack_from(order + "2I", data, offset + 8)
+            command["platform"] = Executable.VERSION_MIN_PLATFORMS[name]
+            command["minos"] = Executable.__version(version)
+            command["sdk"] = Executable.__version(sdk)
+        elif name == "LC_UUID":
+            command["uuid"] = str(uuid.UUID(bytes=bytes(data[offset + 8 : offset + 24]))).upper()
+        elif name in ("LC_SEGMENT", "LC_SEGMENT_64"):
+            command["segname"] = data[offset + 8 : offset + 24].split(b"\0", 1)[0].decode("ascii", "replace")
+        return command
 
 
 class SDKModule:
+    __slots__ = ("library", "path", "__plist", "__executable")
+
     def __init__(self, root, library: "XCFramework.Library"):
         self.library = library
         self.path = os.path.join(root, library.libraryIdentifier(), library.path())
-        self.__parse_info_plist()
+        self.__plist = None
+        self.__executable = None
 
-    def __parse_info_plist(self):
-        with open(os.path.join(self.path, "Info.plist"), "rb") as f:
-            self.plist = plistlib.load(f)
+    @property
+    def plist(self) -> dict:
+        if self.__plist is None:
+            with open(os.path.join(self.path, "Info.plist"), "rb") as f:
+                self.__plist = plistlib.load(f)
+        return self.__plist
 
     def minimum_os_version(self):
         return self.plist["MinimumOSVersion"]
@@ -508,26 +1301,18 @@ class SDKModule:
         return self.plist["CFBundleExecutable"]
 
     def executable(self) -> Executable:
-        path = os.path.join(self.path, self.executable_path())
-        return Executable(path)
+        if self.__executable is None:
+            self.__executable = Executable(os.path.join(self.path, self.executable_path()))
+        return self.__executable
 
     def __repr__(self):
-        return f"SDKModule({self.path, self.plist})"
+        return f"SDKModule({self.path})"
 
     def list_all_dependencies(self):
-        dynamic_dependencies = (
-            subprocess.run(
-                ["xcrun", "otool", "-L", self.executable()],
-                capture_output=True,
-                text=True,
-            )
-            .stdout.strip()
-            .split("\n\t")
-        )
-        return list(map(lambda x: x.split()[0], dynamic_dependencies[1:]))
+        return self.executable().list_all_dependencies()
 
     def list_dependencies(self):
-        module_path = os.path.join(self.library.library["LibraryPath"], self.executable_path())
+        module_path = os.path.join(self.library.path(), self.executable_path())
 
         def filter_system_dependencies(dependency):
             return (
@@ -542,6 +1327,8 @@ class SDKModule:
 
 class XCFramework:
     class Library:
+        __slots__ = ("library", "root_path")
+
         def __init__(self, library, root_path):
             self.library = library
             self.root_path = root_path
@@ -564,6 +1351,11 @@ class XCFramework:
         def supported_architectures(self) -> list:
             return self.library["SupportedArchitectures"]
 
+        def slice_keys(self) -> list:
+            # Device slices have no variant.
+            variant = self.library.get("SupportedPlatformVariant")
+            return [(self.supported_platform(), variant, arch) for arch in self.supported_architectures()]
+
         def is_simulator(self):
             return self.supported_platform_variant() == "simulator"
 
@@ -576,33 +1368,91 @@ class XCFramework:
         def is_macos(self):
             return self.supported_platform() == "macos"
 
+    __slots__ = ("path", "name", "__libraries", "__slices", "__device_module")
+
     def __init__(self, path):
         self.path = os.path.abspath(path)
 
         if not os.path.isdir(self.path) and self.path.endswith(".xcframework"):
             raise Exception(f"{self.path} is not a valid XCFramework")
 
-        self.name = os.path.basename(self.path).split(".")[0]
-        self.libraries = self.__parse_libraries()
-
-    def __parse_libraries(self):
-        with open(os.path.join(self.path, "Info.plist")) as f:
-            plist = plistlib.loads(f.read().encode("utf-8"))
-            return list(
-                map(
-                    lambda x: XCFramework.Library(x, self.path),
-                    plist["AvailableLibraries"],
-                )
-            )
+        self.name = os.path.splitext(os.path.basename(self.path))[0]
+        self.__libraries = None
+        self.__slices = None
+        self.__device_module = None
+
+    @property
+    def libraries(self) -> list:
+        # Info.plist is parsed on first use, most dependencies of the dumped module are never inspected.
+        if self.__libraries is None:
+            with open(os.path.join(self.path, "Info.plist"), "rb") as f:
+                plist = plistlib.load(f)
+            self.__libraries = [XCFramework.Library(x, self.path) for x in plist["AvailableLibraries"]]
+        return self.__libraries
+
+    def slice(self, platform: str, variant: str = None, arch: str = None):
+        """Returns the library built for the (platform, variant, arch) slice, or None.
+
+        Without `arch`, returns the first library listed for the platform and variant.
+        """
+        if self.__slices is None:
+            slices = {}
+            for library in self.libraries:
+                for key in library.slice_keys():
+                    slices.setdefault(key, library)
+                    slices.setdefault(key[:2] + (None,), library)
+            self.__slices = slices
+        return self.__slices.get((platform, variant, arch))
 
     def iOSDeviceModule(self):
-        deviceLibrary = list(filter(lambda x: x.is_ios() and x.is_device(), self.libraries))[0]
-        # return SDKModule(os.path.join(self.path, deviceLibrary.libraryIdentifier(), deviceLibrary.path()))
-        return SDKModule(self.path, deviceLibrary)
+        if self.__device_module is None:
+            deviceLibrary = self.slice("ios")
+            if deviceLibrary is None:
+                raise Exception(f"{self.path} has no iOS device library")
+            self.__device_module = SDKModule(self.path, deviceLibrary)
+        return self.__device_module
 
     def __repr__(self):
         return f"XCFramework({self.path})"
 
 
+class XCFrameworkInventory:
+    """XCFrameworks of an SDK folder, indexed by framework name.
+
+    The folder is listed once. Frameworks, their plists and their slice indexes are loaded
+    lazily and shared by every dump that runs against the same folder.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.__paths = {}
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.endswith(".xcframework") and entry.is_dir():
+                    self.__paths[os.path.splitext(entry.name)[0]] = entry.path
+        self.__frameworks = {}
+        self.__lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__paths
+
+    def names(self) -> list:
+        return sorted(self.__paths)
+
+    def framework(self, name: str):
+        """Returns the XCFramework called `name`, or None if the folder does not contain it."""
+        path = self.__paths.get(name)
+        if path is None:
+            return None
+        with self.__lock:
+            framework = self.__frameworks.get(name)
+            if framework is None:
+                framework = self.__frameworks[name] = XCFramework(path)
+            return framework
+
+    def __repr__(self):
+        return f"XCFrameworkInventory({self.root}, {self.names()})"
+
+
 if __name__ == "__main__":
     main()
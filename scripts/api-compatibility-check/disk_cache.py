@@ -0,0 +1,190 @@
+"""Content-addressed on-disk cache with a size budget and LRU eviction.
+
+Entries are plain files or directories named after their key. The modification time of an
+entry is bumped on every hit and is used as its last-use time for eviction.
+"""
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+from sizes import format_size
+
+DEFAULT_CACHE_SIZE = 4 * 1024**3
+DEFAULT_WORKSPACE_SIZE = 8 * 1024**3
+
+
+def default_cache_dir() -> str:
+    if "API_CHECK_CACHE_DIR" in os.environ:
+        return os.environ["API_CHECK_CACHE_DIR"]
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "mapbox-api-check")
+
+
+def parse_size(value: str) -> int:
+    """Parses sizes like '512M', '4G' or '1048576' into bytes."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kKmMgGtT]?)i?[bB]?\s*", value)
+    if match is None:
+        raise ValueError(f"Invalid size: {value}")
+    exponent = " KMGT".index(match.group(2).upper() or " ")
+    return int(float(match.group(1)) * 1024**exponent)
+
+
+def hash_file(h, path: str):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            h.update(chunk)
+
+
+def hash_tree(h, path: str):
+    """Feeds relative paths and contents of every file under `path` into `h` in a stable order."""
+    if os.path.isfile(path):
+        hash_file(h, path)
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            h.update(os.path.relpath(file_path, path).encode("utf-8") + b"\0")
+            hash_file(h, file_path)
+
+
+def entry_size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if not os.path.islink(file_path):
+                size += os.path.getsize(file_path)
+    return size
+
+
+class DiskCache:
+    class Entry:
+        def __init__(self, path: str, size: int, last_used: float):
+            self.path = path
+            self.size = size
+            self.last_used = last_used
+
+        def __repr__(self):
+            return f"DiskCache.Entry({self.path}, {self.size}, {self.last_used})"
+
+    def __init__(self, root: str, max_size: int = DEFAULT_CACHE_SIZE):
+        self.root = root
+        self.max_size = max_size
+        # Entries used by this process, for example the workspaces of concurrent dumps, are never evicted.
+        self.in_use = set()
+
+    def path(self, key: str, suffix: str = "") -> str:
+        return os.path.join(self.root, key + suffix)
+
+    def get(self, key: str, suffix: str = ""):
+        """Returns the path of the entry and marks it as recently used, or None on a miss."""
+        path = self.path(key, suffix)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    def put_file(self, key: str, source_path: str, suffix: str = "") -> str:
+        """Copies `source_path` into the cache. The entry appears atomically."""
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        os.close(fd)
+        try:
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, self.path(key, suffix))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.prune(keep=(self.path(key, suffix),))
+        return self.path(key, suffix)
+
+    def put_tree(self, key: str, populate, suffix: str = "") -> str:
+        """Creates a directory entry filled by `populate(path)`. The entry appears atomically."""
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        path = self.path(key, suffix)
+        try:
+            populate(temp_path)
+            os.rename(temp_path, path)
+        except OSError:
+            if not os.path.isdir(path):
+                shutil.rmtree(temp_path, ignore_errors=True)
+                raise
+            # Another process created the same entry in the meantime.
+            shutil.rmtree(temp_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+        self.prune(keep=(path,))
+        return path
+
+    def entries(self) -> list:
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for name in os.listdir(self.root):
+            if name.startswith(".tmp-"):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                entries.append(DiskCache.Entry(path, entry_size(path), os.path.getmtime(path)))
+            except FileNotFoundError:
+                # Evicted by a concurrent prune.
+                continue
+        return entries
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {
+            "root": self.root,
+            "entries": len(entries),
+            "size": sum(entry.size for entry in entries),
+            "max_size": self.max_size,
+            "oldest": min((entry.last_used for entry in entries), default=None),
+            "newest": max((entry.last_used for entry in entries), default=None),
+        }
+
+    def prune(self, max_size: int = None, keep: tuple = ()) -> list:
+        """Evicts least recently used entries until the cache fits into `max_size`. Returns evicted entries."""
+        max_size = self.max_size if max_size is None else max_size
+        entries = sorted(self.entries(), key=lambda entry: entry.last_used)
+        total = sum(entry.size for entry in entries)
+        evicted = []
+        for entry in entries:
+            if total <= max_size:
+                break
+            if entry.path in keep or entry.path in self.in_use:
+                continue
+            if os.path.isdir(entry.path):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+            total -= entry.size
+            evicted.append(entry)
+        return evicted
+
+    def print_stats(self):
+        stats = self.stats()
+
+        def format_time(timestamp):
+            return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else "-"
+
+        print(f"Cache directory: {stats['root']}")
+        print(f"Entries: {stats['entries']}")
+        print(f"Size: {format_size(stats['size'])} of {format_size(stats['max_size'])}")
+        print(f"Least recently used: {format_time(stats['oldest'])}")
+        print(f"Most recently used: {format_time(stats['newest'])}")
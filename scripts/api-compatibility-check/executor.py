@@ -0,0 +1,273 @@
+"""Runs the external tools of the API check: `swift-api-digester` and `xcrun`.
+
+- `ProcessExecutor` starts real processes. At most `max_jobs` of them run at the same time, whichever thread
+  starts them. Runs longer than `timeout` seconds are killed with their whole process group. Output is read
+  while the process runs: it can be printed line by line, and only the last `TAIL_LINES` lines of stderr are kept
+  for error messages.
+- `RecordingExecutor` runs commands through another executor and saves every result as a fixture, including
+  the files written to `-o`.
+- `ReplayExecutor` answers commands from fixtures without running anything, so that the `dump` and `check-api`
+  pipeline can run on machines without Xcode, for example to benchmark it or to test it on Linux.
+
+Fixtures are looked up by the arguments of the command. Absolute paths are reduced to the part that does not
+depend on the machine: files by their name and content hash, bundles (`.xcframework`, `.framework`,
+`.swiftmodule`) by their path from the outermost bundle, other folders by their name. Folders and bundles also
+get a hash of the interface files they contain (`INTERFACE_EXTENSIONS`, `Info.plist`), so that fixtures of an
+SDK are not replayed once its API changed.
+"""
+
+import collections
+import functools
+import hashlib
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+from disk_cache import hash_file
+
+TAIL_LINES = 200
+OUTPUT_OPTIONS = ("-o",)
+BUNDLE_EXTENSIONS = (".xcframework", ".framework", ".swiftmodule")
+# Files the digester reads the API of a module from. Binaries are left out, they are large and do not declare API.
+INTERFACE_EXTENSIONS = (".swiftinterface", ".swiftmodule", ".h", ".modulemap")
+# Bump when the fixture key or format changes so that stale fixtures are not replayed.
+FIXTURE_VERSION = "2"
+
+
+class ExecutorError(Exception):
+    pass
+
+
+class Executor:
+    class Result:
+        __slots__ = ("returncode", "stdout", "stderr", "timed_out")
+
+        def __init__(self, returncode: int, stdout: str, stderr: str, timed_out: bool = False):
+            self.returncode = returncode
+            self.stdout = stdout
+            self.stderr = stderr
+            self.timed_out = timed_out
+
+    def run(self, arguments: list, cwd: str = None, label: str = None) -> "Executor.Result":
+        """Runs a command to completion. `label` prefixes its streamed output."""
+        raise NotImplementedError
+
+    def terminate(self):
+        """Kills running commands and rejects new ones."""
+
+
+class ProcessExecutor(Executor):
+    def __init__(self, max_jobs: int = None, timeout: float = None, stream_output: bool = False):
+        self.timeout = timeout
+        self.stream_output = stream_output
+        self.__slots = threading.BoundedSemaphore(max_jobs or os.cpu_count() or 1)
+        self.__running = set()
+        self.__lock = threading.Lock()
+        self.__print_lock = threading.Lock()
+        self.__terminated = False
+
+    def run(self, arguments: list, cwd: str = None, label: str = None) -> Executor.Result:
+        with self.__slots:
+            with self.__lock:
+                if self.__terminated:
+                    raise ExecutorError(f"{os.path.basename(arguments[0])} was cancelled")
+                # A session of its own lets a timeout kill the tools that xcrun starts, not just xcrun.
+                proc = tracing.Popen(
+                    arguments,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    errors="replace",
+                    cwd=cwd,
+                    start_new_session=True,
+                )
+                self.__running.add(proc)
+            try:
+                return self.__collect(proc, label or os.path.basename(arguments[0]))
+            finally:
+                with self.__lock:
+                    self.__running.discard(proc)
+
+    def __collect(self, proc: subprocess.Popen, label: str) -> Executor.Result:
+        stdout = []
+        stderr = collections.deque(maxlen=TAIL_LINES)
+
+        def pump(stream, lines):
+            for line in stream:
+                lines.append(line)
+                if self.stream_output:
+                    with self.__print_lock:
+                        print(f"[{label}] {line}", end="" if line.endswith("\n") else "\n", file=sys.stderr)
+            stream.close()
+
+        readers = [
+            threading.Thread(target=pump, args=(proc.stdout, stdout), daemon=True),
+            threading.Thread(target=pump, args=(proc.stderr, stderr), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        timed_out = False
+        try:
+            proc.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            self.__kill(proc)
+            proc.wait()
+        except BaseException:
+            self.__kill(proc)
+            proc.wait()
+            raise
+        for reader in readers:
+            reader.join()
+        if timed_out:
+            stderr.append(f"Killed after {self.timeout:g}s\n")
+        return Executor.Result(proc.returncode, "".join(stdout), "".join(stderr), timed_out)
+
+    @staticmethod
+    def __kill(proc: subprocess.Popen):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            proc.kill()
+
+    def terminate(self):
+        with self.__lock:
+            self.__terminated = True
+            for proc in self.__running:
+                self.__kill(proc)
+
+
+def normalize_argument(argument: str) -> str:
+    if not os.path.isabs(argument):
+        return argument
+    if os.path.isfile(argument):
+        h = hashlib.sha256()
+        hash_file(h, argument)
+        return f"{os.path.basename(argument)}@{h.hexdigest()[:16]}"
+    components = argument.rstrip(os.sep).split(os.sep)
+    name = components[-1]
+    for index, component in enumerate(components):
+        if component.endswith(BUNDLE_EXTENSIONS):
+            name = "/".join(components[index:])
+            break
+    if os.path.isdir(argument):
+        return f"{name}@{interface_digest(argument)[:16]}"
+    return name
+
+
+@functools.lru_cache(maxsize=None)
+def interface_digest(path: str) -> str:
+    """Hashes the relative paths and contents of the interface files under the folder `path`.
+
+    Cached for the whole run: the same SDK folder is passed to every dump, and it does not change while they run.
+    """
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(INTERFACE_EXTENSIONS) or name == "Info.plist":
+                file_path = os.path.join(root, name)
+                h.update(os.path.relpath(file_path, path).encode("utf-8") + b"\0")
+                hash_file(h, file_path)
+    return h.hexdigest()
+
+
+def fixture_key(arguments: list) -> tuple:
+    """Returns the hash of the normalized arguments and the positions of the output files in `arguments`."""
+    normalized = []
+    outputs = []
+    for index, argument in enumerate(arguments):
+        if index > 0 and arguments[index - 1] in OUTPUT_OPTIONS:
+            normalized.append("<output>")
+            outputs.append(index)
+        else:
+            normalized.append(normalize_argument(argument))
+    h = hashlib.sha256(f"fixture-v{FIXTURE_VERSION}\0".encode("utf-8"))
+    h.update(json.dumps(normalized).encode("utf-8"))
+    return h.hexdigest(), normalized, outputs
+
+
+class RecordingExecutor(Executor):
+    def __init__(self, executor: Executor, fixtures_dir: str):
+        self.executor = executor
+        self.fixtures_dir = fixtures_dir
+        os.makedirs(fixtures_dir, exist_ok=True)
+
+    def run(self, arguments: list, cwd: str = None, label: str = None) -> Executor.Result:
+        # Input files can be rewritten by the command, they are hashed before it runs.
+        key, normalized, outputs = fixture_key(arguments)
+        result = self.executor.run(arguments, cwd, label)
+        if result.timed_out:
+            return result
+
+        fixture = {
+            "arguments": normalized,
+            "returncode": result.returncode,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+            "outputs": {},
+        }
+        for index in outputs:
+            path = os.path.join(cwd or "", arguments[index])
+            if os.path.isfile(path):
+                name = f"{key}.{index}{os.path.splitext(path)[1]}"
+                copy_atomically(path, os.path.join(self.fixtures_dir, name))
+                fixture["outputs"][str(index)] = name
+        write_fixture(os.path.join(self.fixtures_dir, f"{key}.json"), fixture)
+        return result
+
+    def terminate(self):
+        self.executor.terminate()
+
+
+class ReplayExecutor(Executor):
+    def __init__(self, fixtures_dir: str):
+        if not os.path.isdir(fixtures_dir):
+            raise ExecutorError(f"Fixture folder {fixtures_dir} does not exist")
+        self.fixtures_dir = fixtures_dir
+
+    def run(self, arguments: list, cwd: str = None, label: str = None) -> Executor.Result:
+        key, normalized, _ = fixture_key(arguments)
+        fixture_path = os.path.join(self.fixtures_dir, f"{key}.json")
+        with tracing.span(f"Replay {label or os.path.basename(arguments[0])}"):
+            try:
+                with open(fixture_path) as f:
+                    fixture = json.load(f)
+            except FileNotFoundError:
+                raise ExecutorError(
+                    f"No fixture for {' '.join(normalized)} in {self.fixtures_dir}. Record it with --record-fixtures."
+                ) from None
+            for index, name in fixture["outputs"].items():
+                copy_atomically(os.path.join(self.fixtures_dir, name), os.path.join(cwd or "", arguments[int(index)]))
+        return Executor.Result(fixture["returncode"], fixture["stdout"], fixture["stderr"])
+
+
+def copy_atomically(source: str, destination: str):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(destination)), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as target, open(source, "rb") as f:
+            shutil.copyfileobj(f, target, 1 << 20)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_fixture(path: str, fixture: dict):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(fixture, f, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
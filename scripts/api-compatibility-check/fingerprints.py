@@ -0,0 +1,349 @@
+"""Per-declaration fingerprints of API dumps, used to skip unchanged subtrees when diffing.
+
+The fingerprint of a node is a Merkle hash: its own fields followed by the fingerprints of its children,
+so two declarations have the same fingerprint exactly when their whole subtrees are equal. On top of the
+declarations, the index holds a rollup per module (the top level declarations of the module, in order) and
+the fingerprint of the root, which changes whenever anything in the dump changes.
+
+The index also records where the JSON of every top level declaration starts and ends in the dump. Two dumps
+with indexes are compared without parsing them: modules with the same rollup are skipped as a whole, top level
+declarations with a twin of the same fingerprint on the other side are skipped one by one, and only the
+remaining declarations are read from the dumps (see `changed_declarations` and `load_declarations`).
+
+The index is saved next to the dump as `<dump>.fingerprints`:
+
+- the magic `APIFP` and a format version byte,
+- the length of a JSON header (4 bytes, little endian) and the header: size, mtime and SHA-256 of the dump,
+  the number of fingerprints and of top level declarations, the root fingerprint and the module rollups,
+- one 16-byte fingerprint per declaration, in pre-order. The root comes first,
+- one `DECLARATION` record per child of the root: byte offset and length of its JSON in the dump, position
+  of its fingerprint and index of its module in the sorted module names (`NONE` for nodes without either).
+
+An index is reused as long as the dump did not change. It is checked against the size and mtime of the dump,
+then against its hash when only the mtime differs, like after a copy.
+"""
+
+import hashlib
+import json
+import os
+import re
+import struct
+import sys
+import tempfile
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+from disk_cache import hash_file
+
+MAGIC = b"APIFP"
+FORMAT_VERSION = 2
+DIGEST_SIZE = 16
+SUFFIX = ".fingerprints"
+HEADER_SIZE = struct.Struct("<I")
+DECLARATION = struct.Struct("<QQII")
+NONE = 0xFFFFFFFF
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class FingerprintIndex:
+    def __init__(self, digests: list, modules: dict, declarations: list):
+        self.digests = digests
+        self.modules = modules
+        # (offset, length, fingerprint position or NONE, module or None) of every child of the root, in order.
+        self.declarations = declarations
+
+    @property
+    def root(self) -> bytes:
+        return self.digests[0]
+
+    def attach(self, root: dict, position: int = 0, by_node: dict = None) -> dict:
+        """Maps `id()` of the declarations of `root` to their fingerprints, in `by_node` when given.
+
+        `root` is the whole loaded dump, or a top level declaration whose fingerprint is at `position`.
+        """
+        by_node = {} if by_node is None else by_node
+        positions = iter(range(position, len(self.digests)))
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if is_fingerprinted(node, root):
+                by_node[id(node)] = self.digests[next(positions)]
+            stack.extend(reversed(node.get("children", ())))
+        return by_node
+
+
+def is_fingerprinted(node: dict, root: dict) -> bool:
+    return node is root or "declKind" in node
+
+
+def build_index(root: dict, spans: list) -> FingerprintIndex:
+    """Fingerprints the loaded dump `root`, `spans` are the (offset, length) of its children from `load_dump`."""
+    digests = []
+    modules = {}
+    positions = []
+
+    def fingerprint(node: dict) -> bytes:
+        slot = None
+        if is_fingerprinted(node, root):
+            slot = len(digests)
+            digests.append(None)
+        h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        children = node.get("children")
+        own = {key: value for key, value in node.items() if key != "children"} if children is not None else node
+        h.update(json.dumps(own, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+        for child in children or ():
+            if node is root:
+                positions.append(len(digests) if "declKind" in child else NONE)
+            digest = fingerprint(child)
+            h.update(digest)
+            if node is root and "declKind" in child:
+                module = child.get("moduleName", "")
+                modules.setdefault(module, hashlib.blake2b(digest_size=DIGEST_SIZE)).update(digest)
+        digest = h.digest()
+        if slot is not None:
+            digests[slot] = digest
+        return digest
+
+    fingerprint(root)
+    declarations = [
+        (offset, length, position, root["children"][index].get("moduleName", "") if position != NONE else None)
+        for index, ((offset, length), position) in enumerate(zip(spans, positions))
+    ]
+    return FingerprintIndex(digests, {module: h.hexdigest() for module, h in sorted(modules.items())}, declarations)
+
+
+def _skip(text: str, position: int) -> int:
+    return _WHITESPACE.match(text, position).end()
+
+
+def _expect(text: str, position: int, character: str) -> int:
+    position = _skip(text, position)
+    if not text.startswith(character, position):
+        raise ValueError(f"Expected {character!r} at character {position}")
+    return position + 1
+
+
+def _parse_object(text: str, position: int, decoder, parse_value):
+    """Parses the JSON object at `position`, its values with `parse_value(key, position) -> (value, end)`."""
+    result = {}
+    position = _skip(text, _expect(text, position, "{"))
+    if text.startswith("}", position):
+        return result, position + 1
+    while True:
+        key, position = decoder.raw_decode(text, _skip(text, position))
+        position = _skip(text, _expect(text, position, ":"))
+        result[key], position = parse_value(key, position)
+        position = _skip(text, position)
+        if not text.startswith(",", position):
+            return result, _expect(text, position, "}")
+        position += 1
+
+
+def load_dump(dump_path: str):
+    """Parses a JSON dump. Returns its `ABIRoot` and the (byte offset, length) of every child of the root."""
+    with open(dump_path, "rb") as f:
+        data = f.read()
+    text = data.decode("utf-8")
+    decoder = json.JSONDecoder()
+    spans = []
+
+    def parse_children(position):
+        children = []
+        position = _skip(text, _expect(text, position, "["))
+        if text.startswith("]", position):
+            return children, position + 1
+        while True:
+            start = _skip(text, position)
+            child, position = decoder.raw_decode(text, start)
+            children.append(child)
+            spans.append((start, position))
+            position = _skip(text, position)
+            if not text.startswith(",", position):
+                return children, _expect(text, position, "]")
+            position += 1
+
+    def parse_root_value(key, position):
+        return parse_children(position) if key == "children" else decoder.raw_decode(text, position)
+
+    def parse_document_value(key, position):
+        if key == "ABIRoot":
+            return _parse_object(text, position, decoder, parse_root_value)
+        return decoder.raw_decode(text, position)
+
+    document, _ = _parse_object(text, _skip(text, 0), decoder, parse_document_value)
+    if len(text) != len(data):
+        # Character offsets are byte offsets only in ASCII dumps.
+        converted = []
+        characters = size = 0
+        for start, end in spans:
+            size += len(text[characters:start].encode("utf-8"))
+            length = len(text[start:end].encode("utf-8"))
+            converted.append((size, length))
+            characters, size = end, size + length
+        return document["ABIRoot"], converted
+    return document["ABIRoot"], [(start, end - start) for start, end in spans]
+
+
+def changed_declarations(baseline: FingerprintIndex, current: FingerprintIndex):
+    """Returns the top level declarations of both dumps that have no unchanged twin on the other side.
+
+    Modules with the same rollup on both sides are skipped first, then declarations are paired by fingerprint.
+    Returns the positions in `declarations` of the changed baseline and current declarations, in dump order,
+    and the number of skipped current declarations.
+    """
+    unchanged_modules = {module for module, rollup in baseline.modules.items() if current.modules.get(module) == rollup}
+
+    def candidates(index: FingerprintIndex) -> list:
+        return [
+            number
+            for number, (_, _, _, module) in enumerate(index.declarations)
+            if module is None or module not in unchanged_modules
+        ]
+
+    baseline_candidates = candidates(baseline)
+    current_candidates = candidates(current)
+    skipped = len(current.declarations) - len(current_candidates)
+
+    twins = defaultdict(deque)
+    for number in baseline_candidates:
+        position = baseline.declarations[number][2]
+        if position != NONE:
+            twins[baseline.digests[position]].append(number)
+    matched = set()
+    changed_current = []
+    for number in current_candidates:
+        position = current.declarations[number][2]
+        candidates_with_digest = twins.get(current.digests[position]) if position != NONE else None
+        if candidates_with_digest:
+            matched.add(candidates_with_digest.popleft())
+            skipped += 1
+        else:
+            changed_current.append(number)
+    changed_baseline = [number for number in baseline_candidates if number not in matched]
+    return changed_baseline, changed_current, skipped
+
+
+def load_declarations(dump_path: str, index: FingerprintIndex, numbers: list):
+    """Reads the given top level declarations of the dump without parsing the rest of it.
+
+    Returns a root holding them as children, and their fingerprints mapped by `id()` like `attach`.
+    """
+    children = []
+    by_node = {}
+    with open(dump_path, "rb") as f:
+        for number in numbers:
+            offset, length, position, _ = index.declarations[number]
+            f.seek(offset)
+            child = json.loads(f.read(length))
+            children.append(child)
+            if position != NONE:
+                index.attach(child, position, by_node)
+    return {"kind": "Root", "children": children}, by_node
+
+
+def index_path(dump_path: str) -> str:
+    return dump_path + SUFFIX
+
+
+def dump_stat(dump_path: str) -> dict:
+    stat = os.stat(dump_path)
+    h = hashlib.sha256()
+    hash_file(h, dump_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": h.hexdigest()}
+
+
+def load_index(dump_path: str):
+    """Returns the saved index of the dump, or None if there is none, it is out of date or it is unreadable."""
+    try:
+        with open(index_path(dump_path), "rb") as f:
+            data = f.read()
+        stat = os.stat(dump_path)
+    except OSError:
+        return None
+    offset = len(MAGIC) + 1 + HEADER_SIZE.size
+    if len(data) < offset or data[: len(MAGIC)] != MAGIC or data[len(MAGIC)] != FORMAT_VERSION:
+        return None
+    try:
+        (header_size,) = HEADER_SIZE.unpack_from(data, len(MAGIC) + 1)
+        header = json.loads(data[offset : offset + header_size])
+        count, size, mtime_ns, sha256 = header["count"], header["size"], header["mtime_ns"], header["sha256"]
+        root, modules, declaration_count = header["root"], header["modules"], header["declarations"]
+        module_names = sorted(modules)
+    except (struct.error, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    offset += header_size
+    if (
+        not isinstance(count, int)
+        or not isinstance(declaration_count, int)
+        or count < 1
+        or declaration_count < 0
+        or len(data) != offset + count * DIGEST_SIZE + declaration_count * DECLARATION.size
+        or stat.st_size != size
+    ):
+        return None
+    declarations_offset = offset + count * DIGEST_SIZE
+    digests = [data[start : start + DIGEST_SIZE] for start in range(offset, declarations_offset, DIGEST_SIZE)]
+    if digests[0].hex() != root:
+        return None
+    declarations = []
+    for start, length, position, module in DECLARATION.iter_unpack(data[declarations_offset:]):
+        if start + length > size or (position != NONE and position >= count):
+            return None
+        if module != NONE and module >= len(module_names):
+            return None
+        declarations.append((start, length, position, module_names[module] if module != NONE else None))
+    index = FingerprintIndex(digests, modules, declarations)
+    if stat.st_mtime_ns != mtime_ns:
+        current = dump_stat(dump_path)
+        if current["sha256"] != sha256:
+            return None
+        # Only the mtime changed, like after a copy. Record the new one so that the dump is not hashed again.
+        save_index(dump_path, index, current)
+    return index
+
+
+def save_index(dump_path: str, index: FingerprintIndex, stat: dict = None):
+    """Writes the index next to the dump. Read-only locations are skipped, the index is only an optimization.
+
+    `stat` is the `dump_stat` of the dump when the caller already has it.
+    """
+    header = dict(
+        stat or dump_stat(dump_path),
+        count=len(index.digests),
+        declarations=len(index.declarations),
+        root=index.root.hex(),
+        modules=index.modules,
+    )
+    encoded = json.dumps(header).encode("utf-8")
+    module_numbers = {module: number for number, module in enumerate(sorted(index.modules))}
+    declarations = b"".join(
+        DECLARATION.pack(offset, length, position, NONE if module is None else module_numbers[module])
+        for offset, length, position, module in index.declarations
+    )
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dump_path)), prefix=".tmp-")
+    except OSError:
+        return
+    try:
+        # mkstemp creates the file readable by its owner only, the index is as readable as the dump next to it.
+        os.fchmod(fd, os.stat(dump_path).st_mode & 0o666)
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + bytes([FORMAT_VERSION]) + HEADER_SIZE.pack(len(encoded)) + encoded)
+            f.write(b"".join(index.digests))
+            f.write(declarations)
+        os.replace(temp_path, index_path(dump_path))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def create_index(dump_path: str, root: dict, spans: list, save: bool = True) -> FingerprintIndex:
+    """Builds the index of the dump `root` loaded with `load_dump` and saves it next to the dump at `dump_path`."""
+    with tracing.span("Fingerprint dump", path=dump_path):
+        index = build_index(root, spans)
+    if save:
+        save_index(dump_path, index)
+    return index
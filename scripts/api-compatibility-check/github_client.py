@@ -0,0 +1,237 @@
+"""Minimal GitHub REST client built on `http.client`.
+
+- Connections are kept alive and reused through a small pool, one request never pays for a new TLS handshake.
+- List endpoints are paginated: the first page tells how many pages there are, the rest is fetched concurrently.
+- GET responses are cached on disk together with their ETag. Repeated requests are sent with `If-None-Match`,
+  and `304 Not Modified` answers do not count against the rate limit.
+
+The API root is read from `$GITHUB_API_URL` (`https://api.github.com` by default), so the client can be pointed
+to GitHub Enterprise or to a local stand-in server. The token is read from `$GITHUB_TOKEN` or `$GH_TOKEN`,
+falling back to `gh auth token`.
+"""
+
+import concurrent.futures
+import hashlib
+import http.client
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+from disk_cache import default_cache_dir
+
+DEFAULT_API_URL = "https://api.github.com"
+PAGE_SIZE = 100
+MAX_CONNECTIONS = 4
+
+_LAST_PAGE = re.compile(r'<[^>]*[?&]page=(\d+)[^>]*>;\s*rel="last"')
+
+
+class GitHubError(Exception):
+    def __init__(self, method: str, path: str, status: int, body: str):
+        super().__init__(f"{method} {path} failed with status {status}: {body}")
+        self.status = status
+        self.body = body
+
+
+def github_token():
+    for variable in ("GITHUB_TOKEN", "GH_TOKEN"):
+        if os.environ.get(variable):
+            return os.environ[variable]
+    try:
+        proc = tracing.run(["gh", "auth", "token"], capture_output=True, text=True)
+    except OSError:
+        return None
+    return proc.stdout.strip() if proc.returncode == 0 and proc.stdout.strip() else None
+
+
+class ETagCache:
+    """Stores GET response bodies with their ETags, one file per URL."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def __path(self, url: str, token) -> str:
+        # Responses depend on the permissions of the token, never share them between tokens.
+        key = hashlib.sha256(f"{token or ''}\0{url}".encode("utf-8")).hexdigest()
+        return os.path.join(self.root, key + ".json")
+
+    def get(self, url: str, token):
+        try:
+            with open(self.__path(url, token), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url: str, token, etag: str, body, link):
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"etag": etag, "body": body, "link": link}, f)
+        os.replace(temp_path, self.__path(url, token))
+
+
+class GitHubClient:
+    class Response:
+        __slots__ = ("status", "body", "link", "from_cache")
+
+        def __init__(self, status: int, body, link, from_cache: bool = False):
+            self.status = status
+            self.body = body
+            self.link = link
+            self.from_cache = from_cache
+
+    def __init__(self, api_url: str = None, token: str = None, cache_dir: str = None, max_connections=MAX_CONNECTIONS):
+        api_url = api_url or os.environ.get("GITHUB_API_URL") or DEFAULT_API_URL
+        parsed = urllib.parse.urlsplit(api_url)
+        if parsed.scheme not in ("http", "https"):
+            raise Exception(f"Unsupported GitHub API URL: {api_url}")
+        self.scheme = parsed.scheme
+        self.host = parsed.netloc
+        self.prefix = parsed.path.rstrip("/")
+        self.token = token if token is not None else github_token()
+        self.etags = ETagCache(cache_dir or os.path.join(default_cache_dir(), "github"))
+        self.max_connections = max_connections
+        self.__connections = queue.LifoQueue()
+        self.__lock = threading.Lock()
+        self.requests_sent = 0
+        self.not_modified = 0
+
+    # Connection pool
+
+    def __connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, timeout=60)
+        return http.client.HTTPConnection(self.host, timeout=60)
+
+    def __acquire(self) -> http.client.HTTPConnection:
+        try:
+            return self.__connections.get_nowait()
+        except queue.Empty:
+            return self.__connect()
+
+    def __release(self, connection: http.client.HTTPConnection):
+        self.__connections.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                self.__connections.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Requests
+
+    def url(self, path: str, params: dict = None) -> str:
+        url = f"{self.prefix}/{path.lstrip('/')}"
+        if params:
+            url += ("&" if "?" in url else "?") + urllib.parse.urlencode(params)
+        return url
+
+    def request(self, method: str, path: str, params: dict = None, body=None) -> "GitHubClient.Response":
+        with tracing.span(f"{method} {path}", params=params or {}) as span:
+            response = self.__request(method, path, params, body)
+            span.set(status=response.status, from_cache=response.from_cache)
+            return response
+
+    def __request(self, method: str, path: str, params: dict = None, body=None) -> "GitHubClient.Response":
+        url = self.url(path, params)
+        headers = {
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+            "User-Agent": "mapbox-api-compatibility-check",
+        }
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+
+        cached = None
+        if method == "GET":
+            cached = self.etags.get(url, self.token)
+            if cached is not None:
+                headers["If-None-Match"] = cached["etag"]
+
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        status, response_headers, data = self.__send(method, url, payload, headers)
+        with self.__lock:
+            self.requests_sent += 1
+            if status == 304:
+                self.not_modified += 1
+
+        if status == 304 and cached is not None:
+            return GitHubClient.Response(200, cached["body"], cached.get("link"), from_cache=True)
+        if status >= 400:
+            raise GitHubError(method, url, status, data.decode("utf-8", "replace"))
+
+        decoded = json.loads(data) if data else None
+        link = response_headers.get("Link")
+        if method == "GET" and response_headers.get("ETag"):
+            self.etags.put(url, self.token, response_headers["ETag"], decoded, link)
+        return GitHubClient.Response(status, decoded, link)
+
+    def __send(self, method: str, url: str, payload, headers: dict):
+        # A kept-alive connection may have been closed by the server since its last use, retry once on a new one.
+        for attempt in range(2):
+            connection = self.__acquire()
+            try:
+                connection.request(method, url, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if attempt == 1:
+                    raise
+                continue
+            except BaseException:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.__release(connection)
+            return response.status, response.headers, data
+
+    def get(self, path: str, params: dict = None):
+        return self.request("GET", path, params).body
+
+    def post(self, path: str, body: dict):
+        return self.request("POST", path, body=body).body
+
+    def patch(self, path: str, body: dict):
+        return self.request("PATCH", path, body=body).body
+
+    def get_all(self, path: str, params: dict = None) -> list:
+        """Returns the items of every page of a list endpoint, in order."""
+        params = dict(params or {}, per_page=PAGE_SIZE)
+        first = self.request("GET", path, dict(params, page=1))
+        match = _LAST_PAGE.search(first.link or "")
+        last_page = int(match.group(1)) if match else 1
+        if last_page == 1:
+            return list(first.body)
+
+        items = list(first.body)
+        workers = min(self.max_connections, last_page - 1)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            pages = pool.map(
+                tracing.in_current_span(lambda page: self.request("GET", path, dict(params, page=page)).body),
+                range(2, last_page + 1),
+            )
+            for page in pages:
+                items.extend(page)
+        return items
@@ -0,0 +1,404 @@
+"""Pure-Python replacement for `swift-api-digester -diagnose-sdk`.
+
+Compares two `.API.json` dumps produced by `swift-api-digester -dump-sdk` and writes
+a report in the same `/* Category */` format the digester uses, so that
+`APIDigester.BreakageReport` and the breakage allowlist work unchanged.
+
+The differ walks both declaration trees once. Children of every matched declaration
+are indexed by printed name, so the whole comparison runs in close to linear time.
+Removed declarations are looked up by USR in the latest dump to detect renames and moves.
+
+With fingerprints (see `fingerprints.py`), matched declarations whose whole subtrees are equal
+are not compared at all. When both dumps have an up-to-date index next to them, the dumps are not
+parsed: unchanged modules and top level declarations are skipped from their fingerprints, and only
+the declarations that changed are read. Dumps with the same root fingerprint are not read at all.
+
+Only the API-level diagnostics are implemented. ABI-only checks (layout order, witness
+table entries, etc.) still require the digester.
+"""
+
+import json
+import os
+import sys
+from collections import defaultdict
+
+import fingerprints
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+
+# Report categories in the order the digester prints them.
+CATEGORIES = [
+    "Generic Signature Changes",
+    "RawRepresentable Changes",
+    "Removed Decls",
+    "Moved Decls",
+    "Renamed Decls",
+    "Type Changes",
+    "Decl Attribute changes",
+    "Fixed-layout Type Changes",
+    "Protocol Conformance Change",
+    "Protocol Requirement Change",
+    "Class Inheritance Change",
+    "Others",
+]
+
+# Declaration attributes that break source compatibility when added or removed,
+# mapped to their spelling in the report.
+BREAKING_ATTRIBUTES = {
+    "Final": "final",
+    "Dynamic": "dynamic",
+    "Prefix": "prefix",
+    "Postfix": "postfix",
+    "Infix": "infix",
+    "ObjC": "objc",
+    "NonObjC": "nonobjc",
+    "Sendable": "Sendable",
+    "Preconcurrency": "preconcurrency",
+}
+
+IGNORED_DECL_KINDS = {"Import"}
+
+
+def load_dump(path: str) -> dict:
+    with open(path, "rb") as f:
+        return json.load(f)["ABIRoot"]
+
+
+def diagnose_sdk(baseline_path: str, current_path: str, output_path: str, use_fingerprints: bool = True):
+    """Compare two API dumps and write the digester-compatible report to `output_path`.
+
+    With `use_fingerprints`, the fingerprint index of each dump is loaded, or built and saved next to it.
+    """
+    baseline_index = current_index = None
+    if use_fingerprints:
+        baseline_index = fingerprints.load_index(baseline_path)
+        current_index = fingerprints.load_index(current_path)
+        if baseline_index and current_index and baseline_index.root == current_index.root:
+            print("The dumps have the same fingerprint, skipped the comparison")
+            differ = SDKDiffer({}, {})
+            with tracing.span("Write report"):
+                differ.write_report(output_path)
+            return differ
+
+    baseline_fingerprints = current_fingerprints = None
+    skipped = 0
+    if baseline_index and current_index:
+        with tracing.span("Load changed declarations") as span:
+            changed_baseline, changed_current, skipped = fingerprints.changed_declarations(
+                baseline_index, current_index
+            )
+            baseline_root, baseline_fingerprints = fingerprints.load_declarations(
+                baseline_path, baseline_index, changed_baseline
+            )
+            current_root, current_fingerprints = fingerprints.load_declarations(
+                current_path, current_index, changed_current
+            )
+            span.set(baseline=len(changed_baseline), current=len(changed_current), skipped=skipped)
+    elif use_fingerprints:
+        with tracing.span("Load dumps"):
+            baseline_root, baseline_spans = fingerprints.load_dump(baseline_path)
+            current_root, current_spans = fingerprints.load_dump(current_path)
+        baseline_index = baseline_index or fingerprints.create_index(baseline_path, baseline_root, baseline_spans)
+        current_index = current_index or fingerprints.create_index(current_path, current_root, current_spans)
+        baseline_fingerprints = baseline_index.attach(baseline_root)
+        current_fingerprints = current_index.attach(current_root)
+    else:
+        with tracing.span("Load dumps"):
+            baseline_root = load_dump(baseline_path)
+            current_root = load_dump(current_path)
+    differ = SDKDiffer(baseline_root, current_root, baseline_fingerprints, current_fingerprints)
+    with tracing.span("Diff declarations") as span:
+        differ.run()
+        differ.skipped_count += skipped
+        span.set(compared=differ.compared_count, skipped=differ.skipped_count)
+    if use_fingerprints:
+        print(
+            f"Skipped {differ.skipped_count} unchanged declaration subtrees, compared {differ.compared_count} declarations"
+        )
+    with tracing.span("Write report"):
+        differ.write_report(output_path)
+    return differ
+
+
+def is_decl(node: dict) -> bool:
+    return "declKind" in node and node["declKind"] not in IGNORED_DECL_KINDS
+
+
+def decl_children(node: dict) -> list:
+    return [child for child in node.get("children", []) if is_decl(child)]
+
+
+def type_children(node: dict) -> list:
+    return [child for child in node.get("children", []) if "declKind" not in child]
+
+
+class SDKDiffer:
+    def __init__(
+        self,
+        baseline_root: dict,
+        current_root: dict,
+        baseline_fingerprints: dict = None,
+        current_fingerprints: dict = None,
+    ):
+        """Fingerprints map the `id()` of declarations to their fingerprint, see `FingerprintIndex.attach`."""
+        self.baseline_root = baseline_root
+        self.current_root = current_root
+        self.diagnostics = defaultdict(set)
+        self.compared_count = 0
+        self.skipped_count = 0
+        self.__baseline_fingerprints = baseline_fingerprints or {}
+        self.__current_fingerprints = current_fingerprints or {}
+        self.__matched_current = set()
+        # Matched declarations of the latest dump whose subtrees were skipped: all their descendants are matched too.
+        self.__skipped_current = set()
+        self.__current_usrs = None
+
+    def run(self):
+        if self.__unchanged(self.baseline_root, self.current_root):
+            self.skipped_count += 1
+            return
+        removed = []
+        self.__compare_children(self.baseline_root, self.current_root, [], [], removed)
+        # Renames and moves can only be detected once every declaration was matched by name.
+        for node, parents in removed:
+            self.__diagnose_removed(node, parents)
+
+    def write_report(self, output_path: str):
+        with open(output_path, "w") as f:
+            for category in CATEGORIES:
+                f.write(f"/* {category} */\n")
+                for line in sorted(self.diagnostics.get(category, ())):
+                    f.write(f"{line}\n")
+                f.write("\n")
+
+    def __add(self, category: str, message: str):
+        self.diagnostics[category].add(message)
+
+    # Declaration naming
+
+    @staticmethod
+    def __screen_name(node: dict, parents: list) -> str:
+        if node.get("declKind") in ("Class", "Struct", "Enum", "Protocol") and node.get("isExternal"):
+            kind = "Extension"
+        else:
+            kind = node["declKind"]
+        qualified_name = ".".join([parent["printedName"] for parent in parents] + [node["printedName"]])
+        return f"{kind} {qualified_name}"
+
+    # Matching
+
+    def __pair(self, baseline_nodes: list, current_nodes: list):
+        """Pairs overloads sharing a printed name: by USR first, then by kind, then by position."""
+        pairs = []
+        remaining = list(current_nodes)
+        unmatched = []
+        for node in baseline_nodes:
+            usr = node.get("usr")
+            match = next((c for c in remaining if usr and c.get("usr") == usr), None)
+            if match is None:
+                unmatched.append(node)
+            else:
+                remaining.remove(match)
+                pairs.append((node, match))
+
+        for node in list(unmatched):
+            match = next(
+                (c for c in remaining if c["declKind"] == node["declKind"] and c.get("static") == node.get("static")),
+                None,
+            )
+            if match is not None:
+                remaining.remove(match)
+                unmatched.remove(node)
+                pairs.append((node, match))
+
+        while unmatched and remaining:
+            pairs.append((unmatched.pop(0), remaining.pop(0)))
+
+        return pairs, unmatched, remaining
+
+    def __compare_children(self, baseline: dict, current: dict, parents: list, current_parents: list, removed: list):
+        current_by_name = defaultdict(list)
+        for child in decl_children(current):
+            current_by_name[child["printedName"]].append(child)
+
+        baseline_by_name = defaultdict(list)
+        for child in decl_children(baseline):
+            baseline_by_name[child["printedName"]].append(child)
+
+        for name, current_nodes in current_by_name.items():
+            pairs, unmatched, added = self.__pair(baseline_by_name.get(name, []), current_nodes)
+            for old, new in pairs:
+                self.__matched_current.add(id(new))
+                if self.__unchanged(old, new):
+                    self.__skipped_current.add(id(new))
+                    self.skipped_count += 1
+                else:
+                    self.compared_count += 1
+                    self.__compare_decl(old, new, parents, current_parents, removed)
+            for old in unmatched:
+                removed.append((old, parents))
+            for new in added:
+                self.__diagnose_added(new, current, current_parents)
+
+        for name, baseline_nodes in baseline_by_name.items():
+            if name not in current_by_name:
+                removed.extend((old, parents) for old in baseline_nodes)
+
+    def __unchanged(self, old: dict, new: dict) -> bool:
+        fingerprint = self.__baseline_fingerprints.get(id(old))
+        return fingerprint is not None and fingerprint == self.__current_fingerprints.get(id(new))
+
+    def __is_matched(self, node: dict, parents: list) -> bool:
+        return id(node) in self.__matched_current or any(id(parent) in self.__skipped_current for parent in parents)
+
+    # Diagnostics
+
+    def __diagnose_removed(self, node: dict, parents: list):
+        usr = node.get("usr")
+        if usr:
+            match = self.__current_usr_index().get(usr)
+            if match is not None and not self.__is_matched(*match):
+                new, new_parents = match
+                old_parent = ".".join(p["printedName"] for p in parents)
+                new_parent = ".".join(p["printedName"] for p in new_parents)
+                if old_parent != new_parent:
+                    self.__add(
+                        "Moved Decls",
+                        f"{self.__screen_name(node, parents)} has been moved to {self.__screen_name(new, new_parents)}",
+                    )
+                else:
+                    self.__add(
+                        "Renamed Decls",
+                        f"{self.__screen_name(node, parents)} has been renamed to {self.__screen_name(new, new_parents)}",
+                    )
+                return
+
+        if node.get("isExternal") and node.get("declKind") in ("Class", "Struct", "Enum", "Protocol"):
+            # Extensions of external types are reported member by member.
+            for child in decl_children(node):
+                self.__diagnose_removed(child, parents + [node])
+            for conformance in node.get("conformances", []):
+                self.__add(
+                    "Protocol Conformance Change",
+                    f"{self.__screen_name(node, parents)} has removed conformance to {conformance['printedName']}",
+                )
+            return
+
+        suffix = " (deprecated)" if node.get("deprecated") else ""
+        self.__add("Removed Decls", f"{self.__screen_name(node, parents)} has been removed{suffix}")
+
+    def __diagnose_added(self, node: dict, parent: dict, parents: list):
+        name = self.__screen_name(node, parents)
+        parent_kind = parent.get("declKind")
+        if parent_kind == "Protocol" and node.get("protocolReq"):
+            has_default = any(
+                sibling["printedName"] == node["printedName"] and not sibling.get("protocolReq")
+                for sibling in decl_children(parent)
+            )
+            if not has_default:
+                self.__add("Protocol Requirement Change", f"{name} has been added as a protocol requirement")
+        elif parent_kind == "Enum" and node["declKind"] == "EnumElement":
+            if "Frozen" in parent.get("declAttributes", []):
+                self.__add("Fixed-layout Type Changes", f"{name} has been added as a new enum case")
+        elif parent_kind == "Class" and node["declKind"] == "Constructor":
+            if parent.get("isOpen") and node.get("init_kind") == "Designated":
+                self.__add(
+                    "Class Inheritance Change", f"{name} has been added as a designated initializer to an open class"
+                )
+
+    def __compare_decl(self, old: dict, new: dict, parents: list, current_parents: list, removed: list):
+        name = self.__screen_name(old, parents)
+
+        if old["declKind"] != new["declKind"]:
+            self.__add("Moved Decls", f"{name} has been changed to a {new['declKind']}")
+
+        if bool(old.get("static")) != bool(new.get("static")):
+            self.__add("Decl Attribute changes", f"{name} is now {'static' if new.get('static') else 'not static'}")
+
+        if old["declKind"] == "Var" and bool(old.get("isLet")) != bool(new.get("isLet")):
+            change = "from var to let" if new.get("isLet") else "from let to var"
+            self.__add("Decl Attribute changes", f"{name} changes {change}")
+
+        old_signature = old.get("genericSig", "")
+        new_signature = new.get("genericSig", "")
+        if old_signature != new_signature:
+            self.__add(
+                "Generic Signature Changes",
+                f"{name} has generic signature change from {old_signature} to {new_signature}",
+            )
+
+        self.__compare_attributes(old, new, name)
+        self.__compare_types(old, new, name)
+        self.__compare_conformances(old, new, name)
+        self.__compare_inheritance(old, new, name)
+
+        self.__compare_children(old, new, parents + [old], current_parents + [new], removed)
+
+    def __compare_attributes(self, old: dict, new: dict, name: str):
+        old_attributes = set(old.get("declAttributes", [])) & BREAKING_ATTRIBUTES.keys()
+        new_attributes = set(new.get("declAttributes", [])) & BREAKING_ATTRIBUTES.keys()
+        for attribute in new_attributes - old_attributes:
+            self.__add("Decl Attribute changes", f"{name} is now with @{BREAKING_ATTRIBUTES[attribute]}")
+        for attribute in old_attributes - new_attributes:
+            self.__add("Decl Attribute changes", f"{name} is now without @{BREAKING_ATTRIBUTES[attribute]}")
+
+    def __compare_types(self, old: dict, new: dict, name: str):
+        old_types = type_children(old)
+        new_types = type_children(new)
+
+        def describe(index: int) -> str:
+            if old["declKind"] == "Var":
+                return "declared"
+            if old["declKind"] == "TypeAlias":
+                return "underlying"
+            return "return" if index == 0 else f"parameter {index - 1}"
+
+        for index, (old_type, new_type) in enumerate(zip(old_types, new_types)):
+            if old_type.get("printedName") != new_type.get("printedName"):
+                self.__add(
+                    "Type Changes",
+                    f"{name} has {describe(index)} type change from {old_type.get('printedName')} to {new_type.get('printedName')}",
+                )
+            elif index > 0 and old_type.get("hasDefaultArg") and not new_type.get("hasDefaultArg"):
+                self.__add("Type Changes", f"{name} has removed default argument from parameter {index - 1}")
+
+    def __compare_conformances(self, old: dict, new: dict, name: str):
+        old_conformances = {c["printedName"] for c in old.get("conformances", [])}
+        new_conformances = {c["printedName"] for c in new.get("conformances", [])}
+        is_protocol = old["declKind"] == "Protocol"
+        for conformance in old_conformances - new_conformances:
+            relation = "inherited protocol" if is_protocol else "conformance to"
+            self.__add("Protocol Conformance Change", f"{name} has removed {relation} {conformance}")
+        if is_protocol:
+            for conformance in new_conformances - old_conformances:
+                self.__add("Protocol Conformance Change", f"{name} has added inherited protocol {conformance}")
+
+    def __compare_inheritance(self, old: dict, new: dict, name: str):
+        if old["declKind"] != "Class":
+            return
+        if old.get("isOpen") and not new.get("isOpen"):
+            self.__add("Class Inheritance Change", f"{name} is no longer open for subclassing")
+
+        old_superclass = (old.get("superclassNames") or [None])[0]
+        new_superclass = (new.get("superclassNames") or [None])[0]
+        if old_superclass and not new_superclass:
+            self.__add("Class Inheritance Change", f"{name} has removed its super class {old_superclass}")
+        elif old_superclass and old_superclass != new_superclass:
+            self.__add(
+                "Class Inheritance Change",
+                f"{name} has changed its super class from {old_superclass} to {new_superclass}",
+            )
+
+    def __current_usr_index(self) -> dict:
+        if self.__current_usrs is None:
+            self.__current_usrs = {}
+            stack = [(self.current_root, [])]
+            while stack:
+                node, parents = stack.pop()
+                for child in decl_children(node):
+                    usr = child.get("usr")
+                    if usr:
+                        self.__current_usrs.setdefault(usr, (child, parents))
+                    stack.append((child, parents + [child]))
+        return self.__current_usrs
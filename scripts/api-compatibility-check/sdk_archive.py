@@ -0,0 +1,116 @@
+"""Selective extraction of SDK release archives.
+
+Release zips contain every slice of every XCFramework, while the API check only reads the iOS device
+slices. `extract_sdk_archive` streams just the members the digester needs straight out of the zip:
+
+- every `Info.plist`,
+- the iOS device slice of each XCFramework (the dumped module and all of its potential dependencies),
+- standalone `.swiftmodule` bundles.
+
+XCFrameworks are extracted to the root of the destination regardless of the folder they are nested in
+inside the archive (for example `artifacts/`).
+"""
+
+import hashlib
+import os
+import plistlib
+import shutil
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+from disk_cache import DiskCache, hash_file
+
+# Bump when the selection rules change so that cached workspaces are re-extracted.
+EXTRACTION_VERSION = "1"
+
+
+def archive_hash(archive_path: str) -> str:
+    h = hashlib.sha256()
+    h.update(f"extraction-v{EXTRACTION_VERSION}\0".encode("utf-8"))
+    hash_file(h, archive_path)
+    return h.hexdigest()
+
+
+def _xcframework_root(name: str):
+    """Returns the archive prefix up to and including the `.xcframework` folder of a member, if any."""
+    parts = name.split("/")
+    for index, part in enumerate(parts):
+        if part.endswith(".xcframework"):
+            return "/".join(parts[: index + 1])
+    return None
+
+
+def _device_library_identifiers(archive: zipfile.ZipFile, xcframework_root: str) -> list:
+    try:
+        plist = plistlib.loads(archive.read(f"{xcframework_root}/Info.plist"))
+    except KeyError:
+        return []
+    return [
+        library["LibraryIdentifier"]
+        for library in plist.get("AvailableLibraries", [])
+        if library.get("SupportedPlatform") == "ios" and "SupportedPlatformVariant" not in library
+    ]
+
+
+def select_members(archive: zipfile.ZipFile) -> dict:
+    """Maps the archive members needed for dumping to their paths relative to the destination."""
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    roots = sorted({root for root in (_xcframework_root(info.filename) for info in members) if root})
+    device_slices = {
+        root: tuple(f"{root}/{identifier}/" for identifier in _device_library_identifiers(archive, root))
+        for root in roots
+    }
+
+    selected = {}
+    for info in members:
+        name = info.filename
+        if name.startswith("/") or ".." in name.split("/"):
+            continue
+        root = _xcframework_root(name)
+        if root is not None:
+            wanted = name.endswith("/Info.plist") or name.startswith(device_slices[root])
+            relative_path = os.path.join(os.path.basename(root), name[len(root) + 1 :])
+        else:
+            wanted = name.endswith("Info.plist") or ".swiftmodule/" in name
+            relative_path = name
+        if wanted:
+            selected[info.filename] = relative_path
+    return selected
+
+
+@tracing.traced("Extract SDK archive")
+def extract_sdk_archive(archive_path: str, destination: str) -> int:
+    """Extracts the members needed for dumping into `destination`. Returns the number of extracted bytes."""
+    extracted_size = 0
+    with zipfile.ZipFile(archive_path) as archive:
+        for name, relative_path in select_members(archive).items():
+            info = archive.getinfo(name)
+            target_path = os.path.join(destination, relative_path)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with archive.open(info) as source, open(target_path, "wb") as target:
+                shutil.copyfileobj(source, target, 1 << 20)
+            mode = (info.external_attr >> 16) & 0o777
+            if mode:
+                os.chmod(target_path, mode)
+            extracted_size += info.file_size
+    return extracted_size
+
+
+def cached_sdk_workspace(archive_path: str, workspaces: DiskCache) -> str:
+    """Returns a workspace with the extracted archive, reusing the one from a previous run when possible."""
+    with tracing.span("Hash SDK archive"):
+        key = archive_hash(archive_path)
+    # Keep concurrent dumps of other archives from evicting this workspace while it is in use.
+    workspaces.in_use.add(workspaces.path(key))
+    workspace = workspaces.get(key)
+    if workspace is not None:
+        print(f"Using extracted SDK from {workspace}")
+        return workspace
+
+    def extract(destination):
+        size = extract_sdk_archive(archive_path, destination)
+        print(f"Extracted {size / 1024**2:.1f} MB from {os.path.basename(archive_path)}")
+
+    return workspaces.put_tree(key, extract)
@@ -0,0 +1,470 @@
+"""Deterministic generators of synthetic inputs for the benchmarks.
+
+Every generator takes a scale factor where 1 approximates the MapboxMaps release inputs:
+
+- API dumps: 1,500 public types with 8 members each: initializers, properties with accessors, methods and
+  enum cases, with attributes and conformances,
+- digester reports: 300 breakage lines, allowlists: 100 entries,
+- symbol graphs: 40 files of 500 symbols,
+- DocC archives: 1,000 symbol pages with 8 member pages each,
+- llvm-cov exports: 40 MB, with about 30% of the lines not covered.
+
+The same scale and seed always produce the same bytes, so timings of different runs are comparable.
+"""
+
+import json
+import os
+import random
+
+MODULE = "MapboxMaps"
+DOCC_ROOT = "doc://com.mapbox.MapboxMaps/documentation/MapboxMaps"
+TYPE_KINDS = ["Class", "Struct", "Enum", "Protocol"]
+MEMBER_TYPES = ["Double", "String", "Bool", "CLLocationCoordinate2D", "[String]", "StyleColor?", "TimeInterval"]
+
+
+CONFORMANCES = ["Equatable", "Hashable", "Codable", "Sendable", "CustomStringConvertible"]
+# Attributes of members, the first ones break source compatibility when added or removed.
+MEMBER_ATTRIBUTES = [["ObjC"], ["Final"], ["DiscardableResult"], ["SPIAccessControl"], []]
+
+
+def typeNominal(name, hasDefaultArg=False):
+    node = {"kind": "TypeNominal", "name": name, "printedName": name, "usr": f"s:{name}"}
+    if hasDefaultArg:
+        node["hasDefaultArg"] = True
+    return node
+
+
+def conformance(name):
+    return {"kind": "Conformance", "name": name, "printedName": name, "usr": f"s:{name}"}
+
+
+def accessor(typeName, varName, accessorKind, valueType):
+    return {
+        "kind": "Accessor",
+        "name": accessorKind.capitalize(),
+        "printedName": f"{accessorKind.capitalize()}()",
+        "children": [typeNominal(valueType)],
+        "declKind": "Accessor",
+        "usr": f"s:{MODULE}.{typeName}.{varName}.{accessorKind}",
+        "moduleName": MODULE,
+        "accessorKind": accessorKind,
+    }
+
+
+def member(rng, typeName, typeKind, index):
+    name = f"member{index}"
+    attributes = list(rng.choice(MEMBER_ATTRIBUTES))
+    if index == 0 and typeKind in ("Class", "Struct"):
+        node = {
+            "kind": "Constructor",
+            "name": "init",
+            "printedName": f"init({name}:)",
+            "children": [
+                typeNominal(typeName),
+                typeNominal(rng.choice(MEMBER_TYPES), hasDefaultArg=rng.random() < 0.5),
+            ],
+            "declKind": "Constructor",
+            "usr": f"s:{MODULE}.{typeName}.init({name}:)",
+            "moduleName": MODULE,
+            "init_kind": "Designated" if typeKind == "Class" else "Convenience",
+        }
+    elif typeKind == "Enum" and index < 3:
+        node = {
+            "kind": "Var",
+            "name": name,
+            "printedName": name,
+            "children": [typeNominal(typeName)],
+            "declKind": "EnumElement",
+            "usr": f"s:{MODULE}.{typeName}.{name}",
+            "moduleName": MODULE,
+        }
+    elif index % 2:
+        valueType = rng.choice(MEMBER_TYPES)
+        isLet = rng.random() < 0.3
+        accessors = [accessor(typeName, name, "get", valueType)]
+        if not isLet:
+            accessors.append(accessor(typeName, name, "set", valueType))
+        node = {
+            "kind": "Var",
+            "name": name,
+            "printedName": name,
+            "children": [typeNominal(valueType)] + accessors,
+            "declKind": "Var",
+            "usr": f"s:{MODULE}.{typeName}.{name}",
+            "moduleName": MODULE,
+            "isLet": isLet,
+        }
+    else:
+        node = {
+            "kind": "Function",
+            "name": name,
+            "printedName": f"{name}(with:)",
+            "children": [typeNominal("Void"), typeNominal(rng.choice(MEMBER_TYPES), hasDefaultArg=rng.random() < 0.2)],
+            "declKind": "Func",
+            "usr": f"s:{MODULE}.{typeName}.{name}(with:)",
+            "moduleName": MODULE,
+        }
+    if typeKind == "Protocol":
+        node["protocolReq"] = True
+    if attributes and node["declKind"] != "EnumElement":
+        node["declAttributes"] = attributes
+    return node
+
+
+def typeDecl(rng, typeIndex):
+    typeName = f"Type{typeIndex}"
+    typeKind = TYPE_KINDS[typeIndex % len(TYPE_KINDS)]
+    node = {
+        "kind": "TypeDecl",
+        "name": typeName,
+        "printedName": typeName,
+        "children": [member(rng, typeName, typeKind, index) for index in range(8)],
+        "declKind": typeKind,
+        "usr": f"s:{MODULE}.{typeName}",
+        "moduleName": MODULE,
+    }
+    attributes = []
+    if typeKind == "Class":
+        node["superclassNames"] = ["NSObject"] if rng.random() < 0.5 else []
+        if rng.random() < 0.3:
+            node["isOpen"] = True
+            attributes.append("ObjC")
+        else:
+            attributes.append("Final")
+    elif typeKind == "Enum" and rng.random() < 0.5:
+        attributes.append("Frozen")
+    if rng.random() < 0.2:
+        attributes.append("Preconcurrency")
+    if attributes:
+        node["declAttributes"] = attributes
+    node["conformances"] = [conformance(name) for name in rng.sample(CONFORMANCES, rng.randint(0, 3))]
+    return node
+
+
+def changeType(rng, node):
+    """Applies one random API change to a type declaration of `apiDump`."""
+    members = node["children"]
+    operation = rng.choice(["remove", "rename", "retype", "attribute", "conformance", "initializer"])
+    position = rng.randrange(len(members))
+    if operation == "remove":
+        del members[position]
+    elif operation == "rename":
+        members[position]["printedName"] += "Renamed"
+        members[position]["name"] += "Renamed"
+    elif operation == "retype":
+        members[position]["children"][-1 if members[position]["declKind"] == "Func" else 0] = typeNominal("Int")
+    elif operation == "attribute":
+        attributes = members[position].setdefault("declAttributes", [])
+        if "ObjC" in attributes:
+            attributes.remove("ObjC")
+        else:
+            attributes.append("ObjC")
+    elif operation == "conformance":
+        if node["conformances"]:
+            node["conformances"].pop()
+        else:
+            node["conformances"].append(conformance(CONFORMANCES[0]))
+    else:
+        initializers = [m for m in members if m["declKind"] == "Constructor"]
+        if node["declKind"] != "Class" and initializers and initializers[0]["children"][-1].get("hasDefaultArg"):
+            del initializers[0]["children"][-1]["hasDefaultArg"]
+        else:
+            # A designated initializer added to an open class is a breakage.
+            typeName = node["printedName"]
+            members.append(
+                {
+                    "kind": "Constructor",
+                    "name": "init",
+                    "printedName": "init(added:)",
+                    "children": [typeNominal(typeName), typeNominal("Int")],
+                    "declKind": "Constructor",
+                    "usr": f"s:{MODULE}.{typeName}.init(added:)",
+                    "moduleName": MODULE,
+                    "init_kind": "Designated",
+                }
+            )
+
+
+def apiDump(scale, seed=0, changes=0):
+    """Returns a `swift-api-digester -dump-sdk` style dump.
+
+    `changes` is the share of types with a removed, renamed or retyped member, a toggled attribute, a changed
+    conformance or a changed initializer.
+    """
+    rng = random.Random(seed)
+    changeRng = random.Random(seed + 1)
+    types = []
+    for typeIndex in range(int(1500 * scale)):
+        node = typeDecl(rng, typeIndex)
+        if changes and changeRng.random() < changes:
+            changeType(changeRng, node)
+        types.append(node)
+    root = {
+        "kind": "Root",
+        "name": "TopLevel",
+        "printedName": "TopLevel",
+        "children": [
+            {"kind": "Import", "name": "UIKit", "printedName": "UIKit", "declKind": "Import", "moduleName": MODULE}
+        ]
+        + types,
+        "json_format_version": 8,
+    }
+    return {"ABIRoot": root}
+
+
+def writeApiDump(path, scale, seed=0, changes=0):
+    with open(path, "w") as f:
+        json.dump(apiDump(scale, seed, changes), f, indent=1)
+
+
+REPORT_CATEGORIES = ["Removed Decls", "Renamed Decls", "Type Changes", "Decl Attribute changes", "Others"]
+
+
+def breakageLines(scale, seed=0):
+    rng = random.Random(seed)
+    lines = {category: [] for category in REPORT_CATEGORIES}
+    for index in range(int(300 * scale)):
+        category = rng.choice(REPORT_CATEGORIES)
+        name = f"{MODULE}.Type{rng.randrange(1500)}.member{index}"
+        if category == "Removed Decls":
+            line = f"Func {name}(with:) has been removed"
+        elif category == "Renamed Decls":
+            line = f"Var {name} has been renamed to Var {name}Renamed"
+        elif category == "Type Changes":
+            line = f"Func {name}(with:) has return type change from [String] to {rng.choice(MEMBER_TYPES)}"
+        elif category == "Decl Attribute changes":
+            line = f"Func {name}(with:) is now with @objc"
+        else:
+            line = f"Struct {name} is now with @frozen"
+        lines[category].append(line)
+    return lines
+
+
+def writeDigesterReport(path, scale, seed=0):
+    """Writes a report in the `/* Category */` format of `swift-api-digester -diagnose-sdk`."""
+    lines = breakageLines(scale, seed)
+    with open(path, "w") as f:
+        for category in REPORT_CATEGORIES:
+            f.write(f"/* {category} */\n")
+            for line in lines[category]:
+                f.write(f"{line}\n")
+            f.write("\n")
+
+
+def writeAllowlist(path, scale, seed=0):
+    """Writes an allowlist of exact lines and patterns matching part of `writeDigesterReport(seed)`."""
+    rng = random.Random(seed + 2)
+    lines = breakageLines(scale, seed)
+    entries = ["// Synthetic allowlist", ""]
+    for index in range(int(100 * scale)):
+        category = rng.choice(REPORT_CATEGORIES)
+        kind = index % 3
+        if kind == 0 and lines[category]:
+            entries.append(rng.choice(lines[category]))
+        elif kind == 1:
+            entries.append(f"[{category}] glob: * {MODULE}.Type{rng.randrange(1500)}.*")
+        else:
+            entries.append(rf"regex: Func {MODULE}\.Type{rng.randrange(1500)}\.member\d+\(with:\) has been removed")
+    with open(path, "w") as f:
+        f.write("\n".join(entries) + "\n")
+
+
+def symbol(rng, index, title=None):
+    title = title or f"symbol{index}"
+    return {
+        "kind": {"identifier": "swift.property", "displayName": "Instance Property"},
+        "identifier": {"precise": f"s:{MODULE}.{title}.{index}", "interfaceLanguage": "swift"},
+        "pathComponents": [f"Type{index // 8}", title],
+        "names": {"title": title, "subHeading": [{"kind": "identifier", "spelling": title}]},
+        "declarationFragments": [
+            {"kind": "keyword", "spelling": "var"},
+            {"kind": "text", "spelling": " "},
+            {"kind": "identifier", "spelling": title},
+            {"kind": "text", "spelling": ": "},
+            {"kind": "typeIdentifier", "spelling": rng.choice(MEMBER_TYPES)},
+        ],
+        "accessLevel": "public",
+    }
+
+
+def writeSymbolGraphs(directory, scale, seed=0):
+    """Writes `.symbols.json` files, a few of them contain the `char8_t` compiler artifact."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for fileIndex in range(int(40 * scale)):
+        symbols = [symbol(rng, fileIndex * 500 + index) for index in range(500)]
+        if fileIndex % 20 == 0:
+            symbols.append(symbol(rng, fileIndex * 500 + 500, "char8_t"))
+        relationships = [
+            {"kind": "memberOf", "source": s["identifier"]["precise"], "target": symbols[0]["identifier"]["precise"]}
+            for s in symbols[1:]
+        ]
+        graph = {
+            "metadata": {"formatVersion": {"major": 0, "minor": 6, "patch": 0}, "generator": "synthetic"},
+            "module": {"name": f"{MODULE}{fileIndex}", "platform": {"operatingSystem": {"name": "ios"}}},
+            "symbols": symbols,
+            "relationships": relationships,
+        }
+        with open(os.path.join(directory, f"{MODULE}{fileIndex}.symbols.json"), "w") as f:
+            json.dump(graph, f)
+
+
+def doccPage(identifier, kind, role, sections=(), references=()):
+    return {
+        "identifier": {"url": identifier, "interfaceLanguage": "swift"},
+        "kind": kind,
+        "metadata": {"role": role, "title": identifier.rsplit("/", 1)[1]},
+        "topicSections": [{"title": title, "identifiers": identifiers} for title, identifiers in sections],
+        "references": {
+            reference: {
+                "type": "topic",
+                "identifier": reference,
+                "url": "/" + reference.split("/", 3)[3].lower(),
+                "title": reference.rsplit("/", 1)[1],
+            }
+            for reference in references
+        },
+        "primaryContentSections": [
+            {"kind": "content", "content": [{"type": "paragraph", "inlineContent": [{"type": "text", "text": "Docs"}]}]}
+        ],
+        "hierarchy": {"paths": [[DOCC_ROOT]]},
+    }
+
+
+def writeDoccArchive(root, scale):
+    """Writes a valid `.doccarchive`: catalogs curate every type, types curate their members."""
+
+    def write(identifier, page):
+        relative = identifier.split("documentation/", 1)[1].lower()
+        path = os.path.join(root, "data", "documentation", relative + ".json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(page, f, indent=2)
+        html = os.path.join(root, "documentation", relative, "index.html")
+        os.makedirs(os.path.dirname(html), exist_ok=True)
+        with open(html, "w") as f:
+            f.write("<!doctype html><html><head><title>MapboxMaps</title></head><body></body></html>\n")
+
+    catalogs = [f"{DOCC_ROOT}/Catalog{index}" for index in range(20)]
+    types = [f"{DOCC_ROOT}/Type{index}" for index in range(int(1000 * scale))]
+    write(
+        DOCC_ROOT,
+        doccPage(
+            DOCC_ROOT, "symbol", "collection", [("Essentials", catalogs[:10]), ("Advanced", catalogs[10:])], catalogs
+        ),
+    )
+    for index, catalog in enumerate(catalogs):
+        curated = types[index :: len(catalogs)]
+        write(catalog, doccPage(catalog, "article", "collectionGroup", [("Types", curated)], curated))
+    for identifier in types:
+        members = [f"{identifier}/member{index}" for index in range(8)]
+        write(identifier, doccPage(identifier, "symbol", "symbol", [("Instance Properties", members)], members))
+        for memberIdentifier in members:
+            write(memberIdentifier, doccPage(memberIdentifier, "symbol", "symbol", [], [identifier]))
+
+
+COVERAGE_LINES = 400
+COVERAGE_FUNCTIONS = 8
+# Share of lines, regions and functions that are never executed.
+UNCOVERED_RATIO = 0.3
+
+
+def coverageCount(rng):
+    return 0 if rng.random() < UNCOVERED_RATIO else rng.randint(1, 500)
+
+
+def coverageSummary(covered, count, notCovered=False):
+    summary = {"count": count, "covered": covered}
+    if notCovered:
+        summary["notcovered"] = count - covered
+    summary["percent"] = covered / count * 100 if count else 0
+    return summary
+
+
+def coverageFilename(index):
+    return f"/Users/runner/mapbox-maps-ios/Sources/MapboxMaps/Module{index % 50}/File{index}.swift"
+
+
+def coverageFile(seed, index):
+    """Returns the file report of file `index` and its function records, with summaries matching them.
+
+    Every line holds one region, so each line is executable and covered when the count of its region is
+    not 0. Files of the same index in exports of different seeds have the same
+    segments, branches and functions with other counts.
+    """
+    rng = random.Random(f"{seed}:{index}")
+    filename = coverageFilename(index)
+    segments = []
+    for line in range(1, COVERAGE_LINES):
+        segments.append([line, rng.randint(1, 80), coverageCount(rng), True, True, False])
+        segments.append([line, 81, 0, False, False, False])
+    branches = [[line, 5, line, 30, rng.randint(0, 9), rng.randint(0, 9), 0, 0, 4] for line in range(1, 40)]
+    functions = []
+    for functionIndex in range(COVERAGE_FUNCTIONS):
+        firstLine = functionIndex * 40 + 1
+        regions = [[line, 1, line + 3, 2, coverageCount(rng), 0, 0, 0] for line in range(firstLine, firstLine + 10)]
+        functions.append(
+            {
+                "branches": [],
+                "count": regions[0][4],
+                "filenames": [filename],
+                # Names containing the key in a string must not confuse the streaming parser.
+                "name": f'$s10MapboxMaps4File{index}8Function{functionIndex}C"totals":yyF',
+                "regions": regions,
+            }
+        )
+
+    linesCovered = sum(1 for segment in segments if segment[3] and segment[2] > 0)
+    executedFunctions = sum(1 for function in functions if function["count"] > 0)
+    fileReport = {
+        "branches": branches,
+        "expansions": [],
+        "filename": filename,
+        "segments": segments,
+        "summary": {
+            "branches": coverageSummary(
+                sum((branch[4] > 0) + (branch[5] > 0) for branch in branches), 2 * len(branches), notCovered=True
+            ),
+            "functions": coverageSummary(executedFunctions, len(functions)),
+            "instantiations": coverageSummary(executedFunctions, len(functions)),
+            "lines": coverageSummary(linesCovered, COVERAGE_LINES - 1),
+            "regions": coverageSummary(
+                sum(1 for function in functions for region in function["regions"] if region[4] > 0),
+                sum(len(function["regions"]) for function in functions),
+                notCovered=True,
+            ),
+        },
+    }
+    return fileReport, functions
+
+
+def writeCoverageExport(path, scale, seed=0):
+    """Writes an `llvm-cov export` of about 40 MB per scale unit. Returns its totals.
+
+    About 30% of the lines, regions and functions are not covered, the totals are the sums of the file
+    summaries like llvm-cov reports them.
+    """
+    target = int(40 * scale * 2**20)
+    sums = {}
+    with open(path, "w") as f:
+        f.write('{"data":[{"files":[')
+        count = 0
+        # The file reports take about 80% of the export, their functions the rest.
+        while f.tell() < target * 0.8:
+            fileReport, _ = coverageFile(seed, count)
+            for name, summary in fileReport["summary"].items():
+                covered, total = sums.get(name, (0, 0))
+                sums[name] = (covered + summary["covered"], total + summary["count"])
+            f.write(("," if count else "") + json.dumps(fileReport))
+            count += 1
+        f.write('],"functions":[')
+        for index in range(count):
+            # Files are generated again rather than kept, memory stays flat at any scale.
+            _, functions = coverageFile(seed, index)
+            f.write(("," if index else "") + ",".join(json.dumps(function) for function in functions))
+        totals = {
+            name: coverageSummary(covered, total, notCovered=name in ("branches", "regions"))
+            for name, (covered, total) in sorted(sums.items())
+        }
+        f.write('],"totals":' + json.dumps(totals) + '}],"type":"llvm.coverage.json.export","version":"2.0.1"}')
+    return totals
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""Benchmark the release and CI scripts on synthetic inputs.
+
+Every benchmark runs one entry point in its own process on inputs from `generators.py`, and records the
+wall time and the peak memory (ru_maxrss) of that process and its workers. Results are compared to the
+baselines stored in `baselines.json`: a benchmark fails when it is slower or uses more memory than its
+baseline times the threshold. Nothing requires Xcode, the suite runs on plain Linux.
+
+Example:
+    ./scripts/benchmarks/run-benchmarks.py --scale 1 10
+    ./scripts/benchmarks/run-benchmarks.py --filter 'coverage-*' --update-baselines
+"""
+
+import argparse
+import fnmatch
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import generators
+
+benchmarks_dir = os.path.dirname(os.path.realpath(__file__))
+scripts_dir = os.path.dirname(benchmarks_dir)
+BASELINES_PATH = os.path.join(benchmarks_dir, "baselines.json")
+
+API_CHECK = os.path.join(scripts_dir, "api-compatibility-check", "breaking-api-check.py")
+PARSE_CODE_COVERAGE = os.path.join(scripts_dir, "code-coverage", "parse-code-coverage.py")
+STRIP_COMPILER_ARTIFACTS = os.path.join(scripts_dir, "doc-generation", "strip-compiler-artifacts.py")
+RESTRICT_TOP_SECTIONS = os.path.join(scripts_dir, "doc-generation", "restrict-top-sections.py")
+POSTPROCESS_DOCC = os.path.join(scripts_dir, "doc-generation", "postprocess-docc.py")
+
+
+def loadScript(path):
+    """Imports a hyphenated script, with its folder on the path for its helper modules."""
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3].replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Inputs:
+    """Generates every input once per scale, in a folder shared by the benchmarks of a run."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def get(self, name, scale, generate):
+        path = os.path.join(self.root, f"{scale:g}x", name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            start = time.perf_counter()
+            generate(path, scale)
+            print(f"  generated {name} at {scale:g}x in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        return path
+
+    def apiDump(self, scale, changes=0):
+        name = "current.API.json" if changes else "baseline.API.json"
+        return self.get(name, scale, lambda path, scale: generators.writeApiDump(path, scale, changes=changes))
+
+    def binaryApiDump(self, scale):
+        def convert(path, scale):
+            subprocess.run(
+                [sys.executable, API_CHECK, "convert", self.apiDump(scale), path], check=True, stdout=subprocess.DEVNULL
+            )
+
+        return self.get("baseline.API.bin", scale, convert)
+
+    def digesterReport(self, scale):
+        return self.get("api-check-report.txt", scale, generators.writeDigesterReport)
+
+    def allowlist(self, scale):
+        return self.get("breakage_allowlist.txt", scale, generators.writeAllowlist)
+
+    def symbolGraphs(self, scale):
+        return self.get("symbol-graphs", scale, generators.writeSymbolGraphs)
+
+    def doccArchive(self, scale):
+        return self.get("MapboxMaps.doccarchive", scale, generators.writeDoccArchive)
+
+    def coverageExport(self, scale, seed=0):
+        return self.get(
+            f"coverage-{seed}.json", scale, lambda path, scale: generators.writeCoverageExport(path, scale, seed)
+        )
+
+
+def scratchCopy(path, scratch):
+    """Copies an input that the benchmarked script modifies in place."""
+    destination = os.path.join(scratch, os.path.basename(path))
+    if os.path.isdir(path):
+        shutil.copytree(path, destination)
+    else:
+        shutil.copy(path, destination)
+    return destination
+
+
+class Benchmark:
+    def __init__(self, name, command, exitCodes=(0,), warmUp=False, check=None):
+        self.name = name
+        # command(inputs, scale, scratch, jobs) returns the arguments of the process to measure.
+        self.command = command
+        self.exitCodes = exitCodes
+        # Run the command once without measuring it before every measured run, in the same scratch folder.
+        # For scripts that keep a cache next to their inputs, so that only the runs reusing it are measured.
+        self.warmUp = warmUp
+        # check(inputs, scale, scratch) raises when the output of a measured run is wrong.
+        self.check = check
+
+
+BENCHMARKS = [
+    Benchmark(
+        "api-summarize",
+        lambda inputs, scale, scratch, jobs: [API_CHECK, "summarize", inputs.apiDump(scale)],
+    ),
+    Benchmark(
+        "api-convert",
+        lambda inputs, scale, scratch, jobs: [
+            API_CHECK,
+            "convert",
+            inputs.apiDump(scale),
+            os.path.join(scratch, "baseline.API.bin"),
+        ],
+    ),
+    Benchmark(
+        "api-query",
+        lambda inputs, scale, scratch, jobs: [
+            API_CHECK,
+            "query",
+            inputs.binaryApiDump(scale),
+            "--kind",
+            "Constructor",
+            "--attribute",
+            "ObjC",
+        ],
+    ),
+    Benchmark(
+        "api-check-native",
+        lambda inputs, scale, scratch, jobs: [
+            API_CHECK,
+            "check-api",
+            inputs.apiDump(scale),
+            inputs.apiDump(scale, changes=0.05),
+            "--engine",
+            "native",
+            "--breakage-allowlist-path",
+            inputs.allowlist(scale),
+            "--report-path",
+            os.path.join(scratch, "report.txt"),
+            "--no-fingerprints",
+        ],
+        # Breakages are expected in the synthetic dumps.
+        exitCodes=(0, 1),
+    ),
+    Benchmark(
+        "api-check-incremental",
+        # The warm-up saves the fingerprint indexes next to the scratch copies of the dumps, the measured run reuses them.
+        lambda inputs, scale, scratch, jobs: [
+            API_CHECK,
+            "check-api",
+            scratchCopy(inputs.apiDump(scale), scratch),
+            scratchCopy(inputs.apiDump(scale, changes=0.05), scratch),
+            "--engine",
+            "native",
+            "--breakage-allowlist-path",
+            inputs.allowlist(scale),
+            "--report-path",
+            os.path.join(scratch, "report.txt"),
+        ],
+        exitCodes=(0, 1),
+        warmUp=True,
+    ),
+    Benchmark(
+        "breakage-report",
+        lambda inputs, scale, scratch, jobs: [
+            "--child",
+            "breakage-report",
+            scratchCopy(inputs.digesterReport(scale), scratch),
+            inputs.allowlist(scale),
+        ],
+    ),
+    Benchmark(
+        "strip-compiler-artifacts",
+        lambda inputs, scale, scratch, jobs: [
+            STRIP_COMPILER_ARTIFACTS,
+            scratchCopy(inputs.symbolGraphs(scale), scratch),
+            "--no-manifest",
+            "-j",
+            str(jobs),
+        ],
+    ),
+    Benchmark(
+        "restrict-top-sections",
+        lambda inputs, scale, scratch, jobs: [
+            RESTRICT_TOP_SECTIONS,
+            "--docc",
+            inputs.doccArchive(scale),
+            "-j",
+            str(jobs),
+        ],
+    ),
+    Benchmark(
+        "postprocess-docc",
+        lambda inputs, scale, scratch, jobs: [
+            POSTPROCESS_DOCC,
+            scratchCopy(inputs.doccArchive(scale), scratch),
+            "-j",
+            str(jobs),
+        ],
+    ),
+    Benchmark(
+        "coverage-totals-streaming",
+        lambda inputs, scale, scratch, jobs: ["--child", "coverage-totals", "streaming", inputs.coverageExport(scale)],
+    ),
+    Benchmark(
+        "coverage-totals-full",
+        lambda inputs, scale, scratch, jobs: ["--child", "coverage-totals", "full", inputs.coverageExport(scale)],
+    ),
+    Benchmark(
+        "coverage-diff",
+        lambda inputs, scale, scratch, jobs: [
+            PARSE_CODE_COVERAGE,
+            "diff",
+            inputs.coverageExport(scale),
+            inputs.coverageExport(scale, seed=1),
+        ],
+    ),
+    Benchmark(
+        "coverage-merge",
+        lambda inputs, scale, scratch, jobs: [
+            PARSE_CODE_COVERAGE,
+            "-j",
+            str(jobs),
+            "merge",
+            inputs.coverageExport(scale),
+            inputs.coverageExport(scale, seed=1),
+            "-o",
+            os.path.join(scratch, "merged.json"),
+        ],
+        check=lambda inputs, scale, scratch: checkMergedTotals(
+            [inputs.coverageExport(scale), inputs.coverageExport(scale, seed=1)], os.path.join(scratch, "merged.json")
+        ),
+    ),
+]
+
+
+def checkMergedTotals(reportPaths, mergedPath):
+    """Fails when the merged line totals cannot be the merge of the reports.
+
+    The exports share their files and lines and differ in which are covered, so the merge has the lines of
+    the largest one, at least as many covered lines as any of them, and still some uncovered lines.
+    """
+    parser = loadScript(PARSE_CODE_COVERAGE)
+    lines = [parser.streamTotals(path)["lines"] for path in reportPaths]
+    merged = parser.streamTotals(mergedPath)["lines"]
+    if merged["count"] != max(line["count"] for line in lines):
+        raise Exception(f"Merged {merged['count']} lines, expected {max(line['count'] for line in lines)}")
+    if not max(line["covered"] for line in lines) <= merged["covered"] < merged["count"]:
+        raise Exception(
+            f"Merged coverage of {merged['covered']}/{merged['count']} lines is not consistent with "
+            + ", ".join(f"{line['covered']}/{line['count']}" for line in lines)
+        )
+
+
+def runChild(name, arguments):
+    """Entry points without a command line of their own, run in the measured process."""
+    if name == "breakage-report":
+        reportPath, allowlistPath = arguments
+        apiCheck = loadScript(API_CHECK)
+        allowlist = apiCheck.BreakageAllowlist.load(allowlistPath)
+        allowlist.filter_report(reportPath)
+        report = apiCheck.APIDigester.BreakageReport(reportPath, allowlist)
+        print(sum(len(lines) for lines in report.breakage.values()), "breakages")
+    elif name == "coverage-totals":
+        mode, reportPath = arguments
+        parser = loadScript(PARSE_CODE_COVERAGE)
+        totals = parser.parseReport(reportPath, streaming=mode == "streaming")
+        if not totals:
+            raise Exception(f"No totals found in {reportPath}")
+    else:
+        raise Exception(f"Unknown child benchmark {name}")
+
+
+def measure(arguments, exitCodes):
+    """Runs a process and returns its wall time in seconds and peak RSS in bytes."""
+    if arguments[0] == "--child":
+        arguments = [os.path.realpath(__file__)] + arguments
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = process.stderr.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode not in exitCodes:
+        raise Exception(
+            f"{' '.join(arguments)} failed with exit code {process.returncode}:\n{stderr.decode(errors='replace')}"
+        )
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    peak = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return elapsed, peak
+
+
+def runBenchmark(benchmark, inputs, scale, repeat, jobs):
+    """Returns the best time and the highest peak memory of `repeat` runs."""
+    times = []
+    peaks = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as scratch:
+            arguments = benchmark.command(inputs, scale, scratch, jobs)
+            if benchmark.warmUp:
+                measure(arguments, benchmark.exitCodes)
+            elapsed, peak = measure(arguments, benchmark.exitCodes)
+            if benchmark.check:
+                benchmark.check(inputs, scale, scratch)
+        times.append(elapsed)
+        peaks.append(peak)
+    return {"seconds": round(min(times), 3), "peakMB": round(max(peaks) / 2**20, 1)}
+
+
+def loadBaselines():
+    try:
+        with open(BASELINES_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def saveBaselines(baselines):
+    with open(BASELINES_PATH, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(result, baseline, timeThreshold, memoryThreshold):
+    """Returns the list of exceeded limits."""
+    failures = []
+    if baseline is None:
+        return failures
+    if result["seconds"] > baseline["seconds"] * timeThreshold:
+        failures.append(f"time {result['seconds']:.2f}s > {baseline['seconds']:.2f}s x {timeThreshold:g}")
+    if result["peakMB"] > baseline["peakMB"] * memoryThreshold:
+        failures.append(f"memory {result['peakMB']:.0f} MB > {baseline['peakMB']:.0f} MB x {memoryThreshold:g}")
+    return failures
+
+
+def formatRatio(value, baseline):
+    return f"{value / baseline:5.2f}x" if baseline else "     -"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the release and CI scripts on synthetic inputs.")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        nargs="+",
+        default=[1],
+        help="Input sizes relative to MapboxMaps, for example '1 10 50'. Defaults to 1.",
+    )
+    parser.add_argument("--filter", action="append", help="Only run benchmarks matching this glob, repeatable.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the fastest one counts.")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="Worker processes of the benchmarked scripts."
+    )
+    parser.add_argument("--time-threshold", type=float, default=1.5, help="Allowed slowdown factor, 1.5 by default.")
+    parser.add_argument(
+        "--memory-threshold", type=float, default=1.3, help="Allowed peak memory growth factor, 1.3 by default."
+    )
+    parser.add_argument("--update-baselines", action="store_true", help=f"Store the results in {BASELINES_PATH}.")
+    parser.add_argument("--inputs", help="Folder to keep the generated inputs in and reuse them from.")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit.")
+    parser.add_argument("--child", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        runChild(args.child[0], args.child[1:])
+        return
+
+    selected = [
+        benchmark
+        for benchmark in BENCHMARKS
+        if not args.filter or any(fnmatch.fnmatch(benchmark.name, pattern) for pattern in args.filter)
+    ]
+    if args.list:
+        for benchmark in selected:
+            print(benchmark.name)
+        return
+
+    baselines = loadBaselines()
+    failures = []
+    results = []
+    with tempfile.TemporaryDirectory() as tempDir:
+        inputs = Inputs(os.path.abspath(args.inputs) if args.inputs else tempDir)
+        for scale in args.scale:
+            for benchmark in selected:
+                print(f"Running {benchmark.name} at {scale:g}x", file=sys.stderr)
+                result = runBenchmark(benchmark, inputs, scale, args.repeat, args.jobs)
+                baseline = baselines.get(benchmark.name, {}).get(f"{scale:g}")
+                exceeded = compare(result, baseline, args.time_threshold, args.memory_threshold)
+                failures += [f"{benchmark.name} at {scale:g}x: {failure}" for failure in exceeded]
+                results.append((benchmark.name, scale, result, baseline, exceeded))
+                if args.update_baselines:
+                    baselines.setdefault(benchmark.name, {})[f"{scale:g}"] = result
+
+    print(f"{'Benchmark':<26} {'Scale':>5} {'Time':>8} {'vs base':>7} {'Peak RSS':>9} {'vs base':>7}")
+    for name, scale, result, baseline, exceeded in results:
+        print(
+            f"{name:<26} {scale:>4g}x {result['seconds']:>7.2f}s "
+            f"{formatRatio(result['seconds'], baseline and baseline['seconds']):>7} "
+            f"{result['peakMB']:>6.0f} MB {formatRatio(result['peakMB'], baseline and baseline['peakMB']):>7}"
+            + ("  FAILED" if exceeded else "")
+        )
+
+    missing = [f"{name} at {scale:g}x" for name, scale, _, baseline, _ in results if baseline is None]
+    if missing and not args.update_baselines:
+        print(f"\nNo baseline, not compared: {', '.join(missing)}")
+
+    if args.update_baselines:
+        saveBaselines(baselines)
+        print(f"Updated {BASELINES_PATH}")
+    elif failures:
+        print("\nERROR: benchmarks exceeded their baselines:")
+        for failure in failures:
+            print(f"  {failure}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Per-file and per-function coverage differences between two llvm-cov exports.
+
+Files are aligned by their path relative to the common folder of each report, functions by that path and
+their (mangled) name. Coverage percentages and their deltas are computed over whole arrays with numpy when
+it is installed, the pure Python fallback gives the same results.
+"""
+
+import llvm_cov
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FUNCTION_METRIC = "regions"
+
+
+def percentages(covered, count):
+    if numpy is not None:
+        covered = numpy.asarray(covered, dtype=numpy.float64)
+        count = numpy.asarray(count, dtype=numpy.float64)
+        return numpy.divide(covered, count, out=numpy.zeros_like(covered), where=count > 0) * 100
+    return [llvm_cov.percent(c, n) for c, n in zip(covered, count)]
+
+
+def rankRegressions(baseCovered, baseCount, currentCovered, currentCount):
+    """Returns `[(index, delta)]` of the rows whose coverage percentage dropped, biggest drop first.
+
+    Drops of the same size are ordered by the number of newly uncovered items, then by row.
+    """
+    base = percentages(baseCovered, baseCount)
+    current = percentages(currentCovered, currentCount)
+    if numpy is not None:
+        delta = current - base
+        uncovered = (numpy.asarray(currentCount) - numpy.asarray(currentCovered)) - (
+            numpy.asarray(baseCount) - numpy.asarray(baseCovered)
+        )
+        order = numpy.lexsort((-uncovered, delta))
+        order = order[delta[order] < 0]
+        return [(int(index), float(delta[index])) for index in order]
+
+    delta = [c - b for b, c in zip(base, current)]
+    uncovered = [(currentCount[i] - currentCovered[i]) - (baseCount[i] - baseCovered[i]) for i in range(len(delta))]
+    order = sorted((i for i in range(len(delta)) if delta[i] < 0), key=lambda i: (delta[i], -uncovered[i], i))
+    return [(index, delta[index]) for index in order]
+
+
+def side(covered, count):
+    return {"covered": covered, "count": count, "percent": llvm_cov.percent(covered, count)}
+
+
+def diffEntries(baseline, current, top, describe):
+    """Aligns two `{key: (covered, count)}` maps and returns the comparison of their common keys."""
+    common = sorted(baseline.keys() & current.keys())
+    columns = list(zip(*([*baseline[key], *current[key]] for key in common))) or [(), (), (), ()]
+    ranked = rankRegressions(*columns)
+    regressions = []
+    for index, delta in ranked[:top]:
+        key = common[index]
+        regression = describe(key)
+        regression["baseline"] = side(*baseline[key])
+        regression["current"] = side(*current[key])
+        regression["delta"] = delta
+        regressions.append(regression)
+    return {
+        "compared": len(common),
+        "added": sorted(current.keys() - baseline.keys()),
+        "removed": sorted(baseline.keys() - current.keys()),
+        "regressed": len(ranked),
+        "regressions": regressions,
+    }
+
+
+def diffTotals(baseline, current):
+    totals = {}
+    for metric in llvm_cov.SUMMARY_METRICS:
+        base = baseline.get("totals", {}).get(metric)
+        cur = current.get("totals", {}).get(metric)
+        if base is None or cur is None:
+            continue
+        totals[metric] = {
+            "baseline": llvm_cov.percent(base["covered"], base["count"]),
+            "current": llvm_cov.percent(cur["covered"], cur["count"]),
+        }
+        totals[metric]["delta"] = totals[metric]["current"] - totals[metric]["baseline"]
+    return totals
+
+
+def summaryCounts(summaries, metric):
+    return {
+        filename: (summary[metric]["covered"], summary[metric]["count"])
+        for filename, summary in summaries.items()
+        if metric in summary
+    }
+
+
+def diffExports(baseline, current, metric="lines", top=20):
+    """Compares two loaded exports (`data[0]` objects). `top=None` lists all regressions."""
+    files = diffEntries(
+        summaryCounts(llvm_cov.fileSummaries(baseline), metric),
+        summaryCounts(llvm_cov.fileSummaries(current), metric),
+        top,
+        lambda filename: {"filename": filename},
+    )
+    baseFunctions = {key: value[:2] for key, value in llvm_cov.functionRegions(baseline).items()}
+    currentFunctions = {key: value[:2] for key, value in llvm_cov.functionRegions(current).items()}
+    functions = diffEntries(baseFunctions, currentFunctions, top, lambda key: {"filename": key[0], "name": key[1]})
+    # Added and removed functions are only counted, reports list tens of thousands of them.
+    functions["added"] = len(functions["added"])
+    functions["removed"] = len(functions["removed"])
+    return {
+        "metric": metric,
+        "functionMetric": FUNCTION_METRIC,
+        "totals": diffTotals(baseline, current),
+        "files": files,
+        "functions": functions,
+    }
+
+
+def formatRegression(regression):
+    return (
+        f"{regression['delta']:>+8.2f}%  {regression['baseline']['percent']:6.2f}% -> "
+        f"{regression['current']['percent']:6.2f}%  "
+        f"({regression['current']['count'] - regression['current']['covered']:>4} uncovered)"
+    )
+
+
+def formatDiff(diff):
+    lines = ["Totals:"]
+    for metric, total in diff["totals"].items():
+        lines.append(f"  {metric:<15} {total['baseline']:6.2f}% -> {total['current']:6.2f}% ({total['delta']:+.2f})")
+
+    files = diff["files"]
+    lines.append("")
+    lines.append(
+        f"Files: {files['compared']} compared, {len(files['added'])} added, {len(files['removed'])} removed, "
+        f"{files['regressed']} with lower {diff['metric']} coverage"
+    )
+    for regression in files["regressions"]:
+        lines.append(f"{formatRegression(regression)}  {regression['filename']}")
+
+    functions = diff["functions"]
+    lines.append("")
+    lines.append(
+        f"Functions: {functions['compared']} compared, {functions['added']} added, {functions['removed']} removed, "
+        f"{functions['regressed']} with lower {diff['functionMetric']} coverage"
+    )
+    for regression in functions["regressions"]:
+        lines.append(f"{formatRegression(regression)}  {regression['name']} ({regression['filename']})")
+    return "\n".join(lines)
@@ -0,0 +1,192 @@
+"""Local SQLite store of published coverage reports.
+
+Every report written by `parse-code-coverage.py` (the JSON that is gzipped and uploaded to S3) becomes one
+row with its component, scheme, branch, commit, build number and the covered/count pair of every totals
+metric. Rows are indexed by component, branch and creation date, so trend queries read only the rows they
+return.
+"""
+
+import gzip
+import json
+import sqlite3
+
+import llvm_cov
+
+SCHEMA_VERSION = 1
+
+COLUMNS = [f"{metric}_{field}" for metric in llvm_cov.SUMMARY_METRICS for field in ("covered", "count")]
+
+
+def buildOrder(buildNumber):
+    """Numeric build numbers sort numerically, others are ordered by creation date only."""
+    try:
+        return int(buildNumber)
+    except (TypeError, ValueError):
+        return None
+
+
+class CoverageHistory:
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.createSchema()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def createSchema(self):
+        metricColumns = ", ".join(f"{column} INTEGER" for column in COLUMNS)
+        with self.connection:
+            self.connection.executescript(
+                f"""
+                CREATE TABLE IF NOT EXISTS reports (
+                    id INTEGER PRIMARY KEY,
+                    project TEXT,
+                    component TEXT NOT NULL,
+                    scheme TEXT NOT NULL,
+                    branch TEXT,
+                    commit_sha TEXT NOT NULL,
+                    commit_message TEXT,
+                    build_number TEXT NOT NULL,
+                    build_order INTEGER,
+                    created_at TEXT NOT NULL,
+                    {metricColumns},
+                    UNIQUE (component, scheme, commit_sha, build_number)
+                );
+                CREATE INDEX IF NOT EXISTS reports_by_branch ON reports (component, branch, created_at);
+                CREATE INDEX IF NOT EXISTS reports_by_commit ON reports (commit_sha);
+                PRAGMA user_version = {SCHEMA_VERSION};
+                """
+            )
+
+    @staticmethod
+    def row(report):
+        totals = report.get("coverage", {}).get("totals") or {}
+        values = {
+            "project": report.get("project"),
+            "component": report["component"],
+            "scheme": report.get("coverage", {}).get("scheme", ""),
+            "branch": report.get("branch"),
+            "commit_sha": report["commit_sha"],
+            "commit_message": report.get("commit_message"),
+            "build_number": str(report.get("build_number", "0")),
+            "build_order": buildOrder(report.get("build_number")),
+            "created_at": report["created_at"],
+        }
+        for metric in llvm_cov.SUMMARY_METRICS:
+            values[f"{metric}_covered"] = totals.get(metric, {}).get("covered")
+            values[f"{metric}_count"] = totals.get(metric, {}).get("count")
+        return values
+
+    def addReports(self, reports):
+        """Stores published reports, a report of the same component, scheme, commit and build is replaced."""
+        rows = [self.row(report) for report in reports]
+        if not rows:
+            return 0
+        columns = list(rows[0].keys())
+        statement = (
+            f"INSERT OR REPLACE INTO reports ({', '.join(columns)}) "
+            f"VALUES ({', '.join(':' + column for column in columns)})"
+        )
+        with self.connection:
+            self.connection.executemany(statement, rows)
+        return len(rows)
+
+    def add(self, report):
+        self.addReports([report])
+
+    def importFiles(self, paths):
+        """Imports published `.json.gz` (or plain `.json`) reports in a single transaction."""
+
+        def reports():
+            for path in paths:
+                with (gzip.open if path.endswith(".gz") else open)(path, "rt") as f:
+                    yield json.load(f)
+
+        return self.addReports(reports())
+
+    def trend(self, component, branch, metric="lines", scheme=None, limit=200):
+        """Returns the `limit` latest reports of a branch, oldest first."""
+        if metric not in llvm_cov.SUMMARY_METRICS:
+            raise Exception(f"Unknown coverage metric '{metric}'")
+        query = (
+            f"SELECT created_at, build_number, commit_sha, scheme, {metric}_covered AS covered, {metric}_count AS count"
+            " FROM reports WHERE component = ? AND branch = ?"
+        )
+        parameters = [component, branch]
+        if scheme is not None:
+            query += " AND scheme = ?"
+            parameters.append(scheme)
+        query += " ORDER BY created_at DESC, build_order DESC LIMIT ?"
+        parameters.append(limit)
+        rows = [dict(row) for row in self.connection.execute(query, parameters)]
+        for row in rows:
+            row["percent"] = llvm_cov.percent(row["covered"] or 0, row["count"] or 0)
+        return rows[::-1]
+
+    def latest(self, component, ref, scheme=None):
+        """Returns the latest report of a commit (full or abbreviated SHA) or, failing that, of a branch."""
+        for condition, value in [("commit_sha = ?", ref), ("commit_sha GLOB ?", ref + "*"), ("branch = ?", ref)]:
+            query = f"SELECT * FROM reports WHERE component = ? AND {condition}"
+            parameters = [component, value]
+            if scheme is not None:
+                query += " AND scheme = ?"
+                parameters.append(scheme)
+            query += " ORDER BY created_at DESC, build_order DESC LIMIT 1"
+            row = self.connection.execute(query, parameters).fetchone()
+            if row is not None:
+                return dict(row)
+        return None
+
+    def compare(self, component, baseRef, currentRef, scheme=None):
+        """Compares the totals of the latest reports of two commits or branches."""
+        base = self.latest(component, baseRef, scheme)
+        current = self.latest(component, currentRef, scheme)
+        for ref, row in [(baseRef, base), (currentRef, current)]:
+            if row is None:
+                raise Exception(f"No {component} coverage report for '{ref}'")
+
+        metrics = {}
+        for metric in llvm_cov.SUMMARY_METRICS:
+            if base[f"{metric}_count"] is None or current[f"{metric}_count"] is None:
+                continue
+            basePercent = llvm_cov.percent(base[f"{metric}_covered"], base[f"{metric}_count"])
+            currentPercent = llvm_cov.percent(current[f"{metric}_covered"], current[f"{metric}_count"])
+            metrics[metric] = {
+                "baseline": basePercent,
+                "current": currentPercent,
+                "delta": currentPercent - basePercent,
+            }
+        return {"baseline": base, "current": current, "totals": metrics}
+
+
+def formatTrend(rows, metric):
+    lines = [f"{'Date':<20} {'Build':>8} {'Commit':<10} {metric:>8}"]
+    previous = None
+    for row in rows:
+        change = "" if previous is None else f" ({row['percent'] - previous:+.2f})"
+        lines.append(
+            f"{row['created_at'][:19]:<20} {row['build_number']:>8} {row['commit_sha'][:10]:<10} "
+            f"{row['percent']:7.2f}%{change}"
+        )
+        previous = row["percent"]
+    return "\n".join(lines)
+
+
+def formatComparison(comparison):
+    base = comparison["baseline"]
+    current = comparison["current"]
+    lines = [
+        f"Baseline: {base['commit_sha'][:10]} ({base['branch']}, build {base['build_number']}, {base['created_at'][:19]})",
+        f"Current:  {current['commit_sha'][:10]} ({current['branch']}, build {current['build_number']}, "
+        f"{current['created_at'][:19]})",
+    ]
+    for metric, total in comparison["totals"].items():
+        lines.append(f"  {metric:<15} {total['baseline']:6.2f}% -> {total['current']:6.2f}% ({total['delta']:+.2f})")
+    return "\n".join(lines)
@@ -0,0 +1,211 @@
+"""Merge llvm-cov exports of test shards that ran the same build.
+
+Shards share the coverage mapping of the binary, so the same files, functions and regions appear in every
+export and only the execution counts differ. Counts are summed per segment, branch and region, keyed by their
+position, then the summaries are recomputed from the merged data following llvm-cov's rules:
+
+- lines: from the segments (see `llvm_cov.lineCoverage`),
+- regions: code regions of the functions of the file, counting the best covered instantiation of a function,
+- functions: instantiation groups with at least one executed instantiation,
+- instantiations: executed function records,
+- branches: both outcomes of every branch of the file.
+
+Files are merged in worker processes, the totals are the sum of the file summaries.
+"""
+
+import concurrent.futures
+import os
+import sys
+
+import llvm_cov
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+
+# Files per worker task, a file takes well under a millisecond to merge.
+CHUNK_SIZE = 64
+
+
+def sumCounts(records, countIndexes):
+    """Sums the counts of records at the same position. Records are lists where `countIndexes` hold counts."""
+    merged = {}
+    for record in records:
+        key = tuple(value for index, value in enumerate(record) if index not in countIndexes)
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = list(record)
+        else:
+            for index in countIndexes:
+                existing[index] += record[index]
+    return list(merged.values())
+
+
+def mergeSegments(segmentLists):
+    """Unions segments by position: counts are summed and a segment has a count when any shard has one."""
+    merged = {}
+    for segments in segmentLists:
+        for segment in segments:
+            key = (segment[0], segment[1])
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = list(segment)
+            else:
+                existing[2] += segment[2]
+                existing[3] = existing[3] or segment[3]
+                existing[4] = existing[4] or segment[4]
+                if len(existing) > 5 and len(segment) > 5:
+                    existing[5] = existing[5] and segment[5]
+    return [merged[key] for key in sorted(merged)]
+
+
+def mergeBranches(branchLists):
+    # [lineStart, columnStart, lineEnd, columnEnd, trueCount, falseCount, fileID, expandedFileID, kind]
+    return sumCounts([branch for branches in branchLists for branch in branches], {4, 5})
+
+
+def mergeRegions(regionLists):
+    # [lineStart, columnStart, lineEnd, columnEnd, executionCount, fileID, expandedFileID, kind]
+    return sumCounts([region for regions in regionLists for region in regions], {4})
+
+
+def mergeExpansions(expansionLists):
+    merged = {}
+    for expansions in expansionLists:
+        for expansion in expansions:
+            source = expansion["source_region"]
+            key = (tuple(source[:4]), tuple(expansion.get("filenames", [])))
+            merged.setdefault(key, []).append(expansion)
+
+    result = []
+    for expansions in merged.values():
+        expansion = dict(expansions[0])
+        expansion["source_region"] = mergeRegions([e["source_region"]] for e in expansions)[0]
+        expansion["target_regions"] = mergeRegions(e.get("target_regions", []) for e in expansions)
+        expansion["branches"] = mergeBranches(e.get("branches", []) for e in expansions)
+        result.append(expansion)
+    return result
+
+
+def mergeFile(fileReports):
+    """Merges the reports of one file from several shards, the summary is computed later."""
+    merged = dict(fileReports[0])
+    merged["segments"] = mergeSegments(f.get("segments", []) for f in fileReports)
+    merged["branches"] = mergeBranches(f.get("branches", []) for f in fileReports)
+    merged["expansions"] = mergeExpansions(f.get("expansions", []) for f in fileReports)
+    return merged
+
+
+def mergeFunction(functions):
+    merged = dict(functions[0])
+    merged["count"] = sum(f.get("count", 0) for f in functions)
+    merged["regions"] = mergeRegions(f.get("regions", []) for f in functions)
+    merged["branches"] = mergeBranches(f.get("branches", []) for f in functions)
+    return merged
+
+
+def mergeFileChunk(chunk):
+    return [mergeFile(fileReports) for fileReports in chunk]
+
+
+def mergeFunctionChunk(chunk):
+    return [mergeFunction(functions) for functions in chunk]
+
+
+def counter(covered, count, notCovered=False):
+    result = {"count": count, "covered": covered}
+    if notCovered:
+        result["notcovered"] = count - covered
+    result["percent"] = llvm_cov.percent(covered, count)
+    return result
+
+
+def fileSummary(fileReport, functions):
+    """Recomputes the summary of a merged file, `functions` are the merged function records of the file."""
+    linesCovered, lines = llvm_cov.lineCoverage(fileReport.get("segments", []))
+
+    # Instantiations of a function share the position of their first region.
+    groups = {}
+    for function in functions:
+        regions = function.get("regions") or [[0, 0]]
+        groups.setdefault((regions[0][0], regions[0][1]), []).append(function)
+    regionsCovered = 0
+    regions = 0
+    for group in groups.values():
+        counts = [llvm_cov.regionCounts(function) for function in group]
+        regions += counts[0][1]
+        regionsCovered += max(covered for covered, _ in counts)
+
+    branches = 0
+    branchesCovered = 0
+    for branch in fileReport.get("branches", []):
+        branches += 2
+        branchesCovered += (branch[4] > 0) + (branch[5] > 0)
+
+    return {
+        "branches": counter(branchesCovered, branches, notCovered=True),
+        "functions": counter(
+            sum(1 for group in groups.values() if any(f.get("count", 0) > 0 for f in group)), len(groups)
+        ),
+        "instantiations": counter(sum(1 for f in functions if f.get("count", 0) > 0), len(functions)),
+        "lines": counter(linesCovered, lines),
+        "regions": counter(regionsCovered, regions, notCovered=True),
+    }
+
+
+def totals(summaries):
+    result = {}
+    for metric in llvm_cov.SUMMARY_METRICS:
+        covered = sum(summary[metric]["covered"] for summary in summaries)
+        count = sum(summary[metric]["count"] for summary in summaries)
+        result[metric] = counter(covered, count, notCovered=metric in ("regions", "branches"))
+    return result
+
+
+def chunks(items, size):
+    return [items[index : index + size] for index in range(0, len(items), size)]
+
+
+def mapChunks(function, items, pool):
+    if pool is None:
+        return [result for chunk in chunks(items, CHUNK_SIZE) for result in function(chunk)]
+    return [result for results in pool.map(function, chunks(items, CHUNK_SIZE)) for result in results]
+
+
+def mergeExports(reports, jobs=os.cpu_count()):
+    """Merges full llvm-cov exports (`{"data": [...], "type": ..., "version": ...}`) into one."""
+    shards = [report["data"][0] for report in reports]
+
+    with tracing.span("Group records"):
+        fileReports = {}
+        for shard in shards:
+            for fileReport in shard.get("files", []):
+                fileReports.setdefault(fileReport["filename"], []).append(fileReport)
+        functionRecords = {}
+        for shard in shards:
+            for function in shard.get("functions", []):
+                key = (function["name"], tuple(function.get("filenames", [])))
+                functionRecords.setdefault(key, []).append(function)
+
+    pool = None
+    if jobs > 1 and len(fileReports) > CHUNK_SIZE:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    try:
+        with tracing.span("Merge files", files=len(fileReports), jobs=jobs if pool else 1):
+            files = mapChunks(mergeFileChunk, list(fileReports.values()), pool)
+        with tracing.span("Merge functions", functions=len(functionRecords)):
+            functions = mapChunks(mergeFunctionChunk, list(functionRecords.values()), pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    with tracing.span("Summarize files"):
+        functionsByFile = {}
+        for function in functions:
+            if function.get("filenames"):
+                functionsByFile.setdefault(function["filenames"][0], []).append(function)
+        for fileReport in files:
+            fileReport["summary"] = fileSummary(fileReport, functionsByFile.get(fileReport["filename"], []))
+
+    merged = {key: value for key, value in reports[0].items() if key != "data"}
+    merged["data"] = [{"files": files, "functions": functions, "totals": totals([f["summary"] for f in files])}]
+    return merged
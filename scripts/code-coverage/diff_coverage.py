@@ -0,0 +1,237 @@
+"""Coverage of the lines changed between the merge-base with a base branch and HEAD.
+
+Changed lines come from `git diff -U0` and are kept per file in an `IntervalIndex`. Line coverage is derived
+from the segments of the llvm-cov export the way llvm-cov computes it: a line is executable when a region
+with a count starts on it or the region active at its start has a count, and its execution count is the
+highest of those. Lines without segments inherit the region active at their start, so the stretches between
+segment lines are matched against the changed intervals as ranges and each segment is visited once.
+"""
+
+import bisect
+import os
+import re
+import subprocess
+import sys
+
+import llvm_cov
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+
+HUNK_HEADER = re.compile(r"^@@ -[0-9]+(?:,[0-9]+)? \+([0-9]+)(?:,([0-9]+))? @@")
+
+COVERED = "covered"
+UNCOVERED = "uncovered"
+NOT_EXECUTABLE = "not executable"
+
+
+class IntervalIndex:
+    """Sorted, non-overlapping closed line intervals."""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __contains__(self, line):
+        index = bisect.bisect_right(self.starts, line) - 1
+        return index >= 0 and line <= self.ends[index]
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def lineCount(self):
+        return sum(end - start + 1 for start, end in self)
+
+    def overlaps(self, start, end):
+        """Yields the parts of the intervals inside `[start, end]`."""
+        index = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        while index < len(self.starts) and self.starts[index] <= end:
+            if self.ends[index] >= start:
+                yield max(start, self.starts[index]), min(end, self.ends[index])
+            index += 1
+
+
+def git(repoPath, *arguments):
+    return tracing.run(["git", "-C", repoPath, *arguments], stdout=subprocess.PIPE, text=True, check=True).stdout
+
+
+def parseDiff(diff):
+    """Returns `{path: IntervalIndex}` of the lines added or modified by a `git diff -U0` output."""
+    changes = {}
+    path = None
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            target = line[4:]
+            path = target[2:] if target.startswith("b/") else None
+            if path is not None:
+                changes.setdefault(path, [])
+        elif path is not None and line.startswith("@@"):
+            match = HUNK_HEADER.match(line)
+            if match is None:
+                continue
+            start = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            if count > 0:
+                changes[path].append((start, start + count - 1))
+    return {path: IntervalIndex(intervals) for path, intervals in changes.items() if intervals}
+
+
+def changedLines(repoPath, base):
+    """Returns `(merge-base sha, repository root, {path: IntervalIndex})` for HEAD compared to `base`."""
+    root = git(repoPath, "rev-parse", "--show-toplevel").strip()
+    mergeBase = git(repoPath, "merge-base", base, "HEAD").strip()
+    diff = git(
+        repoPath,
+        "-c",
+        "core.quotePath=false",
+        "diff",
+        "-U0",
+        "--no-color",
+        "--no-ext-diff",
+        "--src-prefix=a/",
+        "--dst-prefix=b/",
+        mergeBase,
+        "HEAD",
+    )
+    return mergeBase, root, parseDiff(diff)
+
+
+def matchFiles(exportFilenames, changedPaths, root):
+    """Maps changed repository paths to the export files they were built from.
+
+    Exports hold the absolute paths of the build machine, so paths under `root` are matched directly and the
+    others by their longest path suffix.
+    """
+    byBasename = {}
+    for filename in exportFilenames:
+        byBasename.setdefault(os.path.basename(filename), []).append(filename)
+
+    matches = {}
+    for path in changedPaths:
+        candidates = byBasename.get(os.path.basename(path), [])
+        direct = os.path.join(root, path)
+        if direct in candidates:
+            matches[path] = direct
+            continue
+        suffixed = [filename for filename in candidates if filename.endswith(os.sep + path)]
+        if len(suffixed) == 1:
+            matches[path] = suffixed[0]
+    return matches
+
+
+def classifyLines(segments, changed):
+    """Yields `(start, end, state)` for the changed lines of a file, in line order, in a single pass."""
+    wrapped = None
+    index = 0
+    previousLine = 0
+    while index < len(segments):
+        line = segments[index][0]
+        end = index
+        while end < len(segments) and segments[end][0] == line:
+            end += 1
+        lineSegments = segments[index:end]
+
+        # Lines between the previous segment line and this one only depend on the active region.
+        if line > previousLine + 1:
+            state = NOT_EXECUTABLE
+            if wrapped is not None and wrapped[3]:
+                state = COVERED if wrapped[2] > 0 else UNCOVERED
+            for start, stop in changed.overlaps(previousLine + 1, line - 1):
+                yield start, stop, state
+
+        if line in changed:
+            yield line, line, lineState(lineSegments, wrapped)
+
+        wrapped = lineSegments[-1]
+        previousLine = line
+        index = end
+
+    # llvm-cov does not report lines after the last segment.
+    if changed.starts:
+        for start, stop in changed.overlaps(previousLine + 1, changed.ends[-1]):
+            yield start, stop, NOT_EXECUTABLE
+
+
+def lineState(lineSegments, wrapped):
+    count = llvm_cov.lineExecutionCount(lineSegments, wrapped)
+    if count is None:
+        return NOT_EXECUTABLE
+    return COVERED if count > 0 else UNCOVERED
+
+
+def uncoveredHunks(ranges):
+    """Joins uncovered ranges that are only separated by non executable changed lines."""
+    hunks = []
+    openHunk = False
+    lastLine = None
+    for start, end, state in ranges:
+        contiguous = lastLine is not None and start == lastLine + 1
+        if state == UNCOVERED:
+            if openHunk and contiguous:
+                hunks[-1][1] = end
+            else:
+                hunks.append([start, end])
+            openHunk = True
+        elif state == COVERED or not contiguous:
+            openHunk = False
+        lastLine = end
+    return [tuple(hunk) for hunk in hunks]
+
+
+def diffCoverage(export, changes, root):
+    """Returns the coverage of the changed lines of the files in the export (`data[0]` object)."""
+    files = {f["filename"]: f for f in export.get("files", [])}
+    matches = matchFiles(files.keys(), changes.keys(), root)
+
+    result = {"covered": 0, "executable": 0, "files": [], "unmatched": sorted(changes.keys() - matches.keys())}
+    for path in sorted(matches):
+        ranges = list(classifyLines(files[matches[path]].get("segments", []), changes[path]))
+        covered = sum(end - start + 1 for start, end, state in ranges if state == COVERED)
+        uncovered = sum(end - start + 1 for start, end, state in ranges if state == UNCOVERED)
+        if covered + uncovered == 0:
+            continue
+        result["covered"] += covered
+        result["executable"] += covered + uncovered
+        result["files"].append(
+            {
+                "path": path,
+                "changed": changes[path].lineCount(),
+                "covered": covered,
+                "executable": covered + uncovered,
+                "percent": covered / (covered + uncovered) * 100,
+                "uncoveredHunks": uncoveredHunks(ranges),
+            }
+        )
+    result["percent"] = result["covered"] / result["executable"] * 100 if result["executable"] else None
+    return result
+
+
+def formatDiffCoverage(result):
+    if result["executable"] == 0:
+        lines = ["No executable changed lines in the coverage report"]
+    else:
+        lines = [
+            f"{result['percent']:.2f}% of {result['executable']} changed executable lines covered "
+            f"({result['executable'] - result['covered']} uncovered)"
+        ]
+    for file in result["files"]:
+        lines.append(f"  {file['percent']:6.2f}% {file['covered']:>5}/{file['executable']:<5} {file['path']}")
+
+    hunks = [(file["path"], hunk) for file in result["files"] for hunk in file["uncoveredHunks"]]
+    if hunks:
+        lines.append("")
+        lines.append("Uncovered changed lines:")
+        for path, (start, end) in hunks:
+            lines.append(f"  {path}:{start}" + (f"-{end}" if end != start else ""))
+    if result["unmatched"]:
+        lines.append("")
+        lines.append(f"{len(result['unmatched'])} changed files are not part of the coverage report")
+    return "\n".join(lines)
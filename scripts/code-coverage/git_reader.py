@@ -0,0 +1,342 @@
+"""Read the commit information of a repository straight from its `.git` folder.
+
+Only what coverage reports need is supported: HEAD, loose and packed refs, the config of the remotes and
+commit objects, loose or in version 2 packs (with offset and reference deltas). `.git` files with a
+`gitdir:` line (submodules) and linked worktrees (`commondir`) are followed. Anything else, like reftable
+repositories or object alternates, raises `GitReaderError` so that callers can fall back to GitPython.
+"""
+
+import glob
+import mmap
+import os
+import re
+import struct
+import zlib
+
+PACK_IDX_MAGIC = b"\377tOc"
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+
+# Branch of the build when the checkout is a detached HEAD, in order of preference.
+BRANCH_ENVIRONMENT = ["GITHUB_HEAD_REF", "GITHUB_REF_NAME", "CIRCLE_BRANCH", "BUILDKITE_BRANCH", "CI_COMMIT_REF_NAME"]
+
+SHA = re.compile(r"^[0-9a-f]{40}$")
+
+
+class GitReaderError(Exception):
+    pass
+
+
+def findGitDir(path):
+    """Returns `(git dir, common dir)` of the repository containing `path`, like `search_parent_directories`."""
+    path = os.path.abspath(path)
+    while True:
+        dotGit = os.path.join(path, ".git")
+        if os.path.isdir(dotGit):
+            return dotGit, commonDir(dotGit)
+        if os.path.isfile(dotGit):
+            with open(dotGit) as f:
+                content = f.read().strip()
+            if not content.startswith("gitdir:"):
+                raise GitReaderError(f"Unexpected content in {dotGit}")
+            gitDir = os.path.normpath(os.path.join(path, content[len("gitdir:") :].strip()))
+            return gitDir, commonDir(gitDir)
+        parent = os.path.dirname(path)
+        if parent == path:
+            raise GitReaderError("Not a git repository")
+        path = parent
+
+
+def commonDir(gitDir):
+    """Linked worktrees keep refs, objects and config in the main repository."""
+    commonDirFile = os.path.join(gitDir, "commondir")
+    if not os.path.isfile(commonDirFile):
+        return gitDir
+    with open(commonDirFile) as f:
+        return os.path.normpath(os.path.join(gitDir, f.read().strip()))
+
+
+def parseConfig(path):
+    """Returns `{section: {key: value}}`, subsections are named like `remote.origin`. Keys are lowercase."""
+    config = {}
+    section = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] in "#;":
+                continue
+            header = re.match(r'^\[\s*([^\s\]"]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]', line)
+            if header:
+                name = header.group(1).lower()
+                if header.group(2) is not None:
+                    name += "." + re.sub(r"\\(.)", r"\1", header.group(2))
+                section = config.setdefault(name, {})
+                continue
+            if section is None:
+                continue
+            key, _, value = line.partition("=")
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            section[key.strip().lower()] = value
+    return config
+
+
+class PackIndex:
+    """Version 2 pack index: fan-out table, sorted object names, CRCs, offsets and large offsets."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] != PACK_IDX_MAGIC or struct.unpack(">I", self.data[4:8])[0] != 2:
+            raise GitReaderError(f"Unsupported pack index {path}")
+        self.fanout = struct.unpack(">256I", self.data[8 : 8 + 1024])
+        self.count = self.fanout[255]
+        self.namesOffset = 8 + 1024
+        self.offsetsOffset = self.namesOffset + self.count * 20 + self.count * 4
+        self.largeOffsetsOffset = self.offsetsOffset + self.count * 4
+
+    def name(self, index):
+        start = self.namesOffset + index * 20
+        return self.data[start : start + 20]
+
+    def offset(self, sha):
+        """Returns the pack offset of an object, None if the pack does not contain it."""
+        binary = bytes.fromhex(sha)
+        low = self.fanout[binary[0] - 1] if binary[0] else 0
+        high = self.fanout[binary[0]]
+        while low < high:
+            middle = (low + high) // 2
+            name = self.name(middle)
+            if name < binary:
+                low = middle + 1
+            elif name > binary:
+                high = middle
+            else:
+                start = self.offsetsOffset + middle * 4
+                offset = struct.unpack(">I", self.data[start : start + 4])[0]
+                if offset & 0x80000000:
+                    start = self.largeOffsetsOffset + (offset & 0x7FFFFFFF) * 8
+                    offset = struct.unpack(">Q", self.data[start : start + 8])[0]
+                return offset
+        return None
+
+
+def applyDelta(base, delta):
+    def varint(position):
+        value = 0
+        shift = 0
+        while True:
+            byte = delta[position]
+            position += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, position
+
+    baseSize, position = varint(0)
+    if baseSize != len(base):
+        raise GitReaderError("Delta base size mismatch")
+    resultSize, position = varint(position)
+    result = bytearray()
+    while position < len(delta):
+        instruction = delta[position]
+        position += 1
+        if instruction & 0x80:
+            # Copy from the base: offset and size bytes are present according to the low bits.
+            offset = 0
+            size = 0
+            for bit in range(4):
+                if instruction & (1 << bit):
+                    offset |= delta[position] << (8 * bit)
+                    position += 1
+            for bit in range(3):
+                if instruction & (1 << (4 + bit)):
+                    size |= delta[position] << (8 * bit)
+                    position += 1
+            result += base[offset : offset + (size or 0x10000)]
+        elif instruction:
+            result += delta[position : position + instruction]
+            position += instruction
+        else:
+            raise GitReaderError("Invalid delta instruction")
+    if len(result) != resultSize:
+        raise GitReaderError("Delta result size mismatch")
+    return bytes(result)
+
+
+class Pack:
+    def __init__(self, indexPath):
+        self.index = PackIndex(indexPath)
+        with open(indexPath[: -len(".idx")] + ".pack", "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def inflate(self, position, size):
+        decompressor = zlib.decompressobj()
+        # Compressed objects are rarely bigger than their content, so one read is usually enough.
+        chunk = max(size + 64, 4096)
+        output = b""
+        while not decompressor.eof:
+            data = self.data[position : position + chunk]
+            if not data:
+                raise GitReaderError("Truncated pack")
+            output += decompressor.decompress(data)
+            position += chunk
+        return output
+
+    def readAt(self, offset, readObject):
+        """Returns `(type, content)` of the object at `offset`, resolving deltas."""
+        byte = self.data[offset]
+        objectType = (byte >> 4) & 7
+        size = byte & 0x0F
+        shift = 4
+        position = offset + 1
+        while byte & 0x80:
+            byte = self.data[position]
+            position += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+
+        if objectType == OBJ_OFS_DELTA:
+            byte = self.data[position]
+            position += 1
+            distance = byte & 0x7F
+            while byte & 0x80:
+                byte = self.data[position]
+                position += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7F)
+            baseType, base = self.readAt(offset - distance, readObject)
+            return baseType, applyDelta(base, self.inflate(position, size))
+        if objectType == OBJ_REF_DELTA:
+            baseSha = self.data[position : position + 20].hex()
+            baseType, base = readObject(baseSha)
+            return baseType, applyDelta(base, self.inflate(position + 20, size))
+        if objectType not in OBJECT_TYPES:
+            raise GitReaderError(f"Unknown object type {objectType}")
+        return OBJECT_TYPES[objectType], self.inflate(position, size)
+
+
+class GitRepository:
+    def __init__(self, path):
+        self.gitDir, self.commonDir = findGitDir(path)
+        if os.path.isdir(os.path.join(self.commonDir, "reftable")):
+            raise GitReaderError("reftable repositories are not supported")
+        self._packs = None
+        self._packedRefs = None
+
+    def head(self):
+        """Returns `(symbolic ref or None, sha)` of HEAD."""
+        with open(os.path.join(self.gitDir, "HEAD")) as f:
+            content = f.read().strip()
+        if content.startswith("ref:"):
+            ref = content[4:].strip()
+            return ref, self.resolve(ref)
+        return None, content
+
+    def packedRefs(self):
+        if self._packedRefs is None:
+            self._packedRefs = {}
+            path = os.path.join(self.commonDir, "packed-refs")
+            if os.path.isfile(path):
+                with open(path) as f:
+                    for line in f:
+                        if line.startswith(("#", "^")):
+                            continue
+                        sha, _, ref = line.strip().partition(" ")
+                        self._packedRefs[ref] = sha
+        return self._packedRefs
+
+    def resolve(self, ref, depth=0):
+        if depth > 5:
+            raise GitReaderError(f"Too many symbolic ref levels for {ref}")
+        # Per-worktree refs like HEAD live in the git dir, shared refs in the common dir.
+        for directory in (self.gitDir, self.commonDir):
+            path = os.path.join(directory, ref)
+            if os.path.isfile(path):
+                with open(path) as f:
+                    content = f.read().strip()
+                if content.startswith("ref:"):
+                    return self.resolve(content[4:].strip(), depth + 1)
+                return content
+        sha = self.packedRefs().get(ref)
+        if sha is None:
+            raise GitReaderError(f"Cannot resolve {ref}")
+        return sha
+
+    def config(self):
+        return parseConfig(os.path.join(self.commonDir, "config"))
+
+    def packs(self):
+        if self._packs is None:
+            pattern = os.path.join(self.commonDir, "objects", "pack", "*.idx")
+            self._packs = [Pack(path) for path in sorted(glob.glob(pattern))]
+        return self._packs
+
+    def readObject(self, sha):
+        """Returns `(type, content)` of an object."""
+        loose = os.path.join(self.commonDir, "objects", sha[:2], sha[2:])
+        if os.path.isfile(loose):
+            with open(loose, "rb") as f:
+                data = zlib.decompress(f.read())
+            header, _, content = data.partition(b"\0")
+            return header.split(b" ")[0].decode(), content
+        for pack in self.packs():
+            offset = pack.index.offset(sha)
+            if offset is not None:
+                return pack.readAt(offset, self.readObject)
+        raise GitReaderError(f"Object {sha} not found")
+
+    def commitMessage(self, sha):
+        objectType, content = self.readObject(sha)
+        if objectType != "commit":
+            raise GitReaderError(f"{sha} is a {objectType}, not a commit")
+        _, _, message = content.partition(b"\n\n")
+        return message.decode("utf-8", errors="replace")
+
+
+def detachedBranch():
+    for variable in BRANCH_ENVIRONMENT:
+        value = os.environ.get(variable)
+        if value:
+            return value
+    return "HEAD"
+
+
+def projectName(url):
+    # See https://stackoverflow.com/a/63352532
+    return url.split(".git")[0].split("/")[-1]
+
+
+def readRepositoryInfo(path):
+    """Returns `(project, branch, sha, message)` of the repository containing `path`."""
+    repository = GitRepository(path)
+    ref, sha = repository.head()
+    if not SHA.match(sha):
+        raise GitReaderError(f"Unsupported object name {sha}")
+    url = repository.config().get("remote.origin", {}).get("url")
+    if url is None:
+        raise GitReaderError("No origin remote")
+    branch = ref[len("refs/heads/") :] if ref and ref.startswith("refs/heads/") else detachedBranch()
+    return projectName(url), branch, sha, repository.commitMessage(sha)
+
+
+def readRepositoryInfoWithGitPython(path):
+    import git
+
+    repo = git.Repo(path, search_parent_directories=True)
+    try:
+        branch = repo.active_branch.name
+    except TypeError:
+        # Detached HEAD
+        branch = detachedBranch()
+    return projectName(repo.remotes.origin.url), branch, repo.head.object.hexsha, repo.head.object.message
+
+
+def repositoryInfo(path):
+    """Returns `(project, branch, sha, message)`, reading `.git` directly and using GitPython if that fails."""
+    try:
+        return readRepositoryInfo(path)
+    except (GitReaderError, OSError, zlib.error, struct.error, IndexError, ValueError) as error:
+        print(f"Reading git information with GitPython: {error}")
+        return readRepositoryInfoWithGitPython(path)
@@ -0,0 +1,147 @@
+"""Helpers to read `llvm-cov export` JSON reports.
+
+An export looks like `{"data": [{"files": [...], "functions": [...], "totals": {...}}], "type": ..., "version": ...}`:
+
+- files: `filename`, `segments` (`[line, column, count, hasCount, isRegionEntry, isGapRegion]`), `branches`,
+  `expansions` and a `summary` with `lines`, `functions`, `instantiations`, `regions` and `branches` counters,
+- functions: `name`, `count`, `filenames` and `regions`
+  (`[lineStart, columnStart, lineEnd, columnEnd, executionCount, fileID, expandedFileID, kind]`),
+- totals: the summary counters of all files.
+
+Reports produced on different machines have different absolute paths, so files are identified by their path
+relative to the common folder of all files of the report.
+"""
+
+import gzip
+import json
+import os
+
+# CounterMappingRegion::RegionKind
+CODE_REGION = 0
+
+SUMMARY_METRICS = ["lines", "functions", "instantiations", "regions", "branches"]
+
+
+def openReport(path, mode="rt"):
+    return (gzip.open if path.endswith(".gz") else open)(path, mode)
+
+
+def loadReport(path):
+    """Returns the whole export at `path`, which may be gzipped."""
+    with openReport(path) as f:
+        return json.load(f)
+
+
+def loadExport(path):
+    """Returns `data[0]` of the export at `path`, which may be gzipped."""
+    return loadReport(path)["data"][0]
+
+
+def commonFolder(filenames):
+    filenames = list(filenames)
+    if not filenames:
+        return ""
+    if len(filenames) == 1:
+        return os.path.dirname(filenames[0])
+    return os.path.commonpath(filenames)
+
+
+def reportRoot(export):
+    """Returns the common folder of the files of the export."""
+    return commonFolder(f["filename"] for f in export.get("files", []))
+
+
+def relativeFilename(filename, root):
+    if root and (filename + os.sep).startswith(root.rstrip(os.sep) + os.sep):
+        return os.path.relpath(filename, root)
+    return filename
+
+
+def fileSummaries(export):
+    """Returns `{relative filename: summary}`."""
+    root = reportRoot(export)
+    return {relativeFilename(f["filename"], root): f.get("summary", {}) for f in export.get("files", [])}
+
+
+def startsRegion(segment):
+    """Whether a segment starts a region with a count (`[line, column, count, hasCount, isRegionEntry, isGap]`)."""
+    return segment[3] and segment[4] and not (len(segment) > 5 and segment[5])
+
+
+def lineExecutionCount(lineSegments, wrapped):
+    """Returns the execution count of a line like llvm-cov does, None if the line is not executable.
+
+    `lineSegments` are the segments starting on the line and `wrapped` the segment active at its start.
+    """
+    if lineSegments and not lineSegments[0][3] and lineSegments[0][4]:
+        # Start of a skipped region.
+        return None
+    regionStarts = [segment for segment in lineSegments if startsRegion(segment)]
+    if not regionStarts and (wrapped is None or not wrapped[3]):
+        return None
+    count = wrapped[2] if wrapped is not None else 0
+    for segment in regionStarts:
+        count = max(count, segment[2])
+    return count
+
+
+def lineCoverage(segments):
+    """Returns `(covered, executable)` lines of a file from its segments."""
+    covered = 0
+    executable = 0
+    wrapped = None
+    index = 0
+    while index < len(segments):
+        line = segments[index][0]
+        end = index
+        while end < len(segments) and segments[end][0] == line:
+            end += 1
+        lineSegments = segments[index:end]
+        # Lines up to the next segment line are all in the region of the last segment.
+        if end < len(segments) and lineSegments[-1][3]:
+            gap = segments[end][0] - line - 1
+            executable += gap
+            if lineSegments[-1][2] > 0:
+                covered += gap
+        count = lineExecutionCount(lineSegments, wrapped)
+        if count is not None:
+            executable += 1
+            if count > 0:
+                covered += 1
+        wrapped = lineSegments[-1]
+        index = end
+    return covered, executable
+
+
+def regionCounts(function):
+    """Returns `(covered code regions, code regions)` of a function record."""
+    covered = 0
+    total = 0
+    for region in function.get("regions", []):
+        if len(region) < 8 or region[7] == CODE_REGION:
+            total += 1
+            if region[4] != 0:
+                covered += 1
+    return covered, total
+
+
+def functionRegions(export):
+    """Returns `{(relative filename, function name): (covered code regions, code regions, execution count)}`.
+
+    Regions are counted like llvm-cov counts them for function summaries. Functions listed more than
+    once (one entry per instantiation) are reported with their best covered instance.
+    """
+    root = reportRoot(export)
+    functions = {}
+    for function in export.get("functions", []):
+        filenames = function.get("filenames") or [""]
+        key = (relativeFilename(filenames[0], root), function["name"])
+        covered, total = regionCounts(function)
+        current = functions.get(key)
+        if current is None or covered > current[0]:
+            functions[key] = (covered, total, function.get("count", 0))
+    return functions
+
+
+def percent(covered, count):
+    return covered / count * 100 if count else 0.0
@@ -3,17 +3,95 @@
 import os
 from io import open
 import argparse
-import git
 import subprocess
 import json
 import gzip
 import datetime
+import sys
 
 scripts_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(scripts_dir, "..", "utilities"))
+
+# Only the helpers every command needs are imported here, the others are imported by the commands using them
+# so that plain totals and --help do not load numpy, sqlite3 or concurrent.futures.
+import llvm_cov
+import tracing
+
 S3_DIRECTORY = "mobile_staging.codecoverage_v3"
 
+CHUNK_SIZE = 1 << 20
+TOTALS_KEY = b'"totals"'
+# Bytes kept from the previous chunk: enough for a key split across chunks and the backslashes in front of it.
+CHUNK_OVERLAP = 4096
+# The totals object is a few hundred bytes, anything bigger means the match was not the export totals.
+MAX_TOTALS_SIZE = 16 << 20
+
+
+def streamTotals(reportPath, chunkSize=CHUNK_SIZE):
+    """Finds the first `"totals": {...}` member of an llvm-cov export without loading the whole report.
+
+    llvm-cov writes `totals` after the `files` and `functions` arrays of `data[0]`, and no other object of the
+    export has a member with that name. JSON strings can only contain `"totals"` with escaped quotes, so a
+    `"totals"` token whose opening quote is not escaped and that is followed by `:` is the key.
+    Returns None if the key cannot be found, memory usage is bounded by the chunk size.
+    """
+    decoder = json.JSONDecoder()
+    with open(reportPath, "rb") as f:
+        buffer = b""
+        # Offset in `buffer` from which keys have not been looked for yet.
+        searchFrom = 0
+        while True:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                return None
+            buffer += chunk
+
+            position = buffer.find(TOTALS_KEY, searchFrom)
+            while position != -1:
+                backslashes = 0
+                while position - backslashes > 0 and buffer[position - backslashes - 1] == ord("\\"):
+                    backslashes += 1
+                valueStart = position + len(TOTALS_KEY)
+                if backslashes % 2 == 0:
+                    # Read on until the character after the key is known.
+                    while len(buffer[valueStart:].lstrip()) == 0:
+                        chunk = f.read(chunkSize)
+                        if not chunk:
+                            return None
+                        buffer += chunk
+                    rest = buffer[valueStart:].lstrip()
+                    if rest[:1] == b":":
+                        return decodeValue(f, decoder, rest[1:], chunkSize)
+                position = buffer.find(TOTALS_KEY, position + 1)
+
+            buffer = buffer[-CHUNK_OVERLAP:]
+            searchFrom = max(0, len(buffer) - len(TOTALS_KEY) + 1)
+
+
+def decodeValue(f, decoder, buffer, chunkSize):
+    """Decodes the JSON value at the start of `buffer`, reading more of `f` until it is complete."""
+    while True:
+        text = buffer.decode("utf-8", errors="ignore").lstrip()
+        try:
+            value, _ = decoder.raw_decode(text)
+            return value
+        except json.JSONDecodeError:
+            if len(buffer) > MAX_TOTALS_SIZE:
+                return None
+            chunk = f.read(chunkSize)
+            if not chunk:
+                return None
+            buffer += chunk
+
+
+@tracing.traced("Read totals")
+def parseReport(reportPath, streaming=True):
+    if streaming:
+        totals = streamTotals(reportPath)
+        if isinstance(totals, dict):
+            return totals
+        print("Could not stream coverage totals, parsing the whole report")
 
-def parseReport(reportPath):
     with open(reportPath) as f:
         results = json.load(f)
 
@@ -33,9 +111,9 @@ def publish_coverage_report(report, fileName):
 
     publish_script = os.path.join(scripts_dir, "publish_to_aws.sh")
     try:
-        publish_results = subprocess.check_output(
-            ["sh", publish_script, S3_DIRECTORY, fileName], stderr=subprocess.STDOUT
-        )
+        publish_results = tracing.run(
+            ["sh", publish_script, S3_DIRECTORY, fileName], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True
+        ).stdout
         print(publish_results)
     except subprocess.CalledProcessError as e:
         raise RuntimeError("command '{}' return with error (code {}): {}".format(e.cmd, e.returncode, e.output))
@@ -44,45 +122,11 @@ def publish_coverage_report(report, fileName):
         os.remove(fileName)
 
 
-if __name__ == "__main__":
-    # Example:
-    # ./scripts/code-coverage/parse-code-coverage.py --report data.profraw.json --scheme MapboxTestHost -c MapboxMaps -g . -d
-    parser = argparse.ArgumentParser(description="Script to parse the lcov JSON coverage report.")
-    parser.add_argument("--report", help="Provide path the lcov JSON report", required=True)
-    parser.add_argument("--scheme", help="Xcode scheme", required=True)
-    parser.add_argument(
-        "-c",
-        "--component",
-        help="Provide a specific benchmark name, used for comparisons.",
-        required=True,
-    )
-    parser.add_argument(
-        "-g",
-        "--git",
-        help="Provide path to retrieve git information from (eg. upstream dependency submodule)",
-        required=True,
-    )
-
-    # Optional
-    parser.add_argument(
-        "-d",
-        "--dryrun",
-        help="Run the analyzer locally without uploading result to S3.",
-        action="store_true",
-    )
-    parser.add_argument(
-        "-b",
-        "--build",
-        help="Build number of circle-ci job, default is 0.",
-        default="0",
-    )
-
-    args = parser.parse_args()
-
+def publishTotals(args):
     buildNumber = args.build
     component = args.component
     scheme = args.scheme
-    reportPath = os.path.abspath(args.report)
+    reportPaths = [os.path.abspath(path) for path in args.report]
     gitInfoPath = os.path.abspath(args.git)
 
     isLocal = args.dryrun
@@ -104,19 +148,22 @@ if __name__ == "__main__":
     #   "build_number" : string (CI build number)
     # }
 
-    # Git properties
-    repo = git.Repo(gitInfoPath, search_parent_directories=True)
+    import git_reader
 
-    # Get project name (see https://stackoverflow.com/a/63352532)
-    project = repo.remotes.origin.url.split(".git")[0].split("/")[-1]
-    branch = repo.active_branch.name
-    sha = repo.head.object.hexsha
-    message = repo.head.object.message
+    # Git properties
+    with tracing.span("Read git information"):
+        project, branch, sha, message = git_reader.repositoryInfo(gitInfoPath)
 
     coverage_info = {}
     coverage_info["version"] = "1"
     coverage_info["scheme"] = scheme
-    coverage_info["totals"] = parseReport(reportPath)
+    if len(reportPaths) == 1:
+        coverage_info["totals"] = parseReport(reportPaths[0], streaming=not args.full_parse)
+    else:
+        import coverage_merge
+
+        merged = coverage_merge.mergeExports(loadReports(reportPaths), jobs=args.jobs)
+        coverage_info["totals"] = merged["data"][0]["totals"]
 
     report = {}
     report["coverage"] = coverage_info
@@ -132,12 +179,263 @@ if __name__ == "__main__":
     # Print the stats of current file
     print(json.dumps(report, indent=2))
 
+    if args.history_db:
+        import coverage_history
+
+        with tracing.span("Store in history"), coverage_history.CoverageHistory(args.history_db) as history:
+            history.add(report)
+        print(f"### Stored in {args.history_db}.")
+
     # Save stats as a zipped file and publish to aws
     if isLocal:
         print("### Local run, do not upload to S3.")
     else:
         print("### Uploading to S3.")
-        publish_coverage_report(
-            report,
-            "./code-coverage-" + component + "-" + scheme + "-" + buildNumber + ".json.gz",
-        )
+        with tracing.span("Publish"):
+            publish_coverage_report(
+                report,
+                "./code-coverage-" + component + "-" + scheme + "-" + buildNumber + ".json.gz",
+            )
+
+
+def loadReports(paths):
+    reports = []
+    for path in paths:
+        with tracing.span("Load report", path=path):
+            reports.append(llvm_cov.loadReport(path))
+    return reports
+
+
+def loadExport(path):
+    with tracing.span("Load report", path=path):
+        return llvm_cov.loadExport(path)
+
+
+def runDiff(args):
+    import coverage_diff
+
+    baseline = loadExport(args.baseline)
+    current = loadExport(args.current)
+    with tracing.span("Diff exports", metric=args.metric):
+        diff = coverage_diff.diffExports(baseline, current, metric=args.metric, top=args.top)
+    diff["baseline"] = os.path.abspath(args.baseline)
+    diff["current"] = os.path.abspath(args.current)
+
+    if args.json_output == "-":
+        print(json.dumps(diff, indent=2))
+    else:
+        print(coverage_diff.formatDiff(diff))
+        if args.json_output:
+            with open(args.json_output, "w") as f:
+                json.dump(diff, f, indent=2)
+
+
+def runDiffCoverage(args):
+    import diff_coverage
+
+    with tracing.span("Find changed lines", base=args.base):
+        mergeBase, root, changes = diff_coverage.changedLines(os.path.abspath(args.git), args.base)
+    export = loadExport(args.report)
+    with tracing.span("Classify changed lines"):
+        result = diff_coverage.diffCoverage(export, changes, root)
+    result["base"] = args.base
+    result["mergeBase"] = mergeBase
+
+    if args.json_output == "-":
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"Coverage of the lines changed since {args.base} ({mergeBase[:10]}):")
+        print(diff_coverage.formatDiffCoverage(result))
+        if args.json_output:
+            with open(args.json_output, "w") as f:
+                json.dump(result, f, indent=2)
+
+    if args.fail_under is not None and result["percent"] is not None and result["percent"] < args.fail_under:
+        exit(1)
+
+
+def runMerge(args):
+    import coverage_merge
+
+    merged = coverage_merge.mergeExports(loadReports(args.shards), jobs=args.jobs)
+    with tracing.span("Write merged report"), llvm_cov.openReport(args.output, "wt") as f:
+        json.dump(merged, f, separators=(",", ":"))
+    lines = merged["data"][0]["totals"]["lines"]
+    print(
+        f"Merged {len(args.shards)} reports into {args.output}: "
+        f"{lines['covered']}/{lines['count']} lines covered ({lines['percent']:.2f}%)"
+    )
+
+
+def runImport(args):
+    import coverage_history
+
+    with coverage_history.CoverageHistory(args.history_db) as history:
+        count = history.importFiles(args.reports)
+    print(f"Imported {count} reports into {args.history_db}")
+
+
+def runTrend(args):
+    import coverage_history
+
+    with coverage_history.CoverageHistory(args.history_db) as history:
+        rows = history.trend(args.component, args.branch, metric=args.metric, scheme=args.scheme, limit=args.limit)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(coverage_history.formatTrend(rows, args.metric))
+
+
+def runCompare(args):
+    import coverage_history
+
+    with coverage_history.CoverageHistory(args.history_db) as history:
+        comparison = history.compare(args.component, args.baseline, args.current, scheme=args.scheme)
+    if args.json:
+        print(json.dumps(comparison, indent=2))
+    else:
+        print(coverage_history.formatComparison(comparison))
+
+
+if __name__ == "__main__":
+    # Example:
+    # ./scripts/code-coverage/parse-code-coverage.py --report data.profraw.json --scheme MapboxTestHost -c MapboxMaps -g . -d
+    # ./scripts/code-coverage/parse-code-coverage.py diff baseline.json current.json --top 20 --json-output diff.json
+    # ./scripts/code-coverage/parse-code-coverage.py merge shard1.json shard2.json -o merged.json
+    # ./scripts/code-coverage/parse-code-coverage.py trend --history-db coverage.db -c MapboxMaps --branch main
+    # ./scripts/code-coverage/parse-code-coverage.py diff-coverage data.profraw.json --base origin/main -g .
+    parser = argparse.ArgumentParser(description="Script to parse the lcov JSON coverage report.")
+    parser.add_argument(
+        "--report",
+        nargs="+",
+        help="Provide path the lcov JSON report, reports of test shards are merged before computing the totals",
+    )
+    parser.add_argument("--scheme", help="Xcode scheme")
+    parser.add_argument(
+        "-c",
+        "--component",
+        help="Provide a specific benchmark name, used for comparisons.",
+    )
+    parser.add_argument(
+        "-g",
+        "--git",
+        help="Provide path to retrieve git information from (eg. upstream dependency submodule)",
+    )
+
+    # Optional
+    parser.add_argument(
+        "-d",
+        "--dryrun",
+        help="Run the analyzer locally without uploading result to S3.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-b",
+        "--build",
+        help="Build number of circle-ci job, default is 0.",
+        default="0",
+    )
+
+    parser.add_argument(
+        "--full-parse",
+        help="Load the whole report instead of streaming the totals out of it.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="Number of processes used to merge reports."
+    )
+    parser.add_argument(
+        "--history-db",
+        help="SQLite coverage history to store the report in, in addition to the S3 upload or instead of it with -d.",
+    )
+    tracing.add_argument(parser)
+
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    diffParser = subparsers.add_parser(
+        "diff", help="Compare per-file and per-function coverage of two llvm-cov exports instead of publishing totals."
+    )
+    diffParser.add_argument("baseline", help="Baseline llvm-cov export (JSON, may be gzipped).")
+    diffParser.add_argument("current", help="Current llvm-cov export (JSON, may be gzipped).")
+    diffParser.add_argument(
+        "--metric",
+        choices=llvm_cov.SUMMARY_METRICS,
+        default="lines",
+        help="File coverage metric to compare, lines by default. Functions are compared by region coverage.",
+    )
+    diffParser.add_argument("--top", type=int, default=20, help="Number of regressions to list, 20 by default.")
+    diffParser.add_argument("--json-output", help="Also write the diff as JSON to this path, '-' prints only JSON.")
+
+    diffCoverageParser = subparsers.add_parser(
+        "diff-coverage", help="Report the coverage of the lines changed since the merge-base with a base branch."
+    )
+    diffCoverageParser.add_argument("report", help="llvm-cov export of the current HEAD (JSON, may be gzipped).")
+    diffCoverageParser.add_argument("--base", default="origin/main", help="Base branch, origin/main by default.")
+    diffCoverageParser.add_argument("-g", "--git", default=".", help="Path inside the repository, '.' by default.")
+    diffCoverageParser.add_argument(
+        "--json-output", help="Also write the result as JSON to this path, '-' prints only JSON."
+    )
+    diffCoverageParser.add_argument(
+        "--fail-under", type=float, help="Exit with an error when less of the changed lines are covered (percent)."
+    )
+
+    mergeParser = subparsers.add_parser(
+        "merge", help="Merge the llvm-cov exports of test shards that ran the same build into one export."
+    )
+    mergeParser.add_argument("shards", nargs="+", help="llvm-cov exports to merge (JSON, may be gzipped).")
+    mergeParser.add_argument("-o", "--output", required=True, help="Merged export, gzipped if it ends with .gz.")
+
+    # The history database can also be given after the command.
+    historyParser = argparse.ArgumentParser(add_help=False)
+    historyParser.add_argument(
+        "--history-db", default=argparse.SUPPRESS, help="SQLite coverage history, created if it does not exist."
+    )
+
+    importParser = subparsers.add_parser(
+        "import", parents=[historyParser], help="Import published .json.gz coverage reports into the history."
+    )
+    importParser.add_argument("reports", nargs="+", help="Published reports (.json.gz or .json).")
+
+    trendParser = subparsers.add_parser(
+        "trend", parents=[historyParser], help="Show the coverage of the latest builds of a branch."
+    )
+    trendParser.add_argument("-c", "--component", required=True, help="Component, e.g. MapboxMaps.")
+    trendParser.add_argument("--branch", default="main", help="Branch, main by default.")
+    trendParser.add_argument("--scheme", help="Only show reports of this Xcode scheme.")
+    trendParser.add_argument("--metric", choices=llvm_cov.SUMMARY_METRICS, default="lines", help="lines by default.")
+    trendParser.add_argument("--limit", type=int, default=200, help="Number of builds, 200 by default.")
+    trendParser.add_argument("--json", action="store_true", help="Print JSON instead of a table.")
+
+    compareParser = subparsers.add_parser(
+        "compare", parents=[historyParser], help="Compare the totals of two commits or branches from the history."
+    )
+    compareParser.add_argument("baseline", help="Commit SHA (may be abbreviated) or branch of the baseline.")
+    compareParser.add_argument("current", help="Commit SHA (may be abbreviated) or branch to compare.")
+    compareParser.add_argument("-c", "--component", required=True, help="Component, e.g. MapboxMaps.")
+    compareParser.add_argument("--scheme", help="Only compare reports of this Xcode scheme.")
+    compareParser.add_argument("--json", action="store_true", help="Print JSON instead of text.")
+
+    args = parser.parse_args()
+
+    if args.command in ("import", "trend", "compare") and not args.history_db:
+        parser.error(f"{args.command} requires --history-db")
+    if args.command is None:
+        missing = [name for name in ["report", "scheme", "component", "git"] if getattr(args, name) is None]
+        if missing:
+            parser.error("the following arguments are required: " + ", ".join("--" + name for name in missing))
+
+    tracing.setup(args.trace)
+    with tracing.span(args.command or "publish"):
+        if args.command == "diff":
+            runDiff(args)
+        elif args.command == "diff-coverage":
+            runDiffCoverage(args)
+        elif args.command == "merge":
+            runMerge(args)
+        elif args.command == "import":
+            runImport(args)
+        elif args.command == "trend":
+            runTrend(args)
+        elif args.command == "compare":
+            runCompare(args)
+        else:
+            publishTotals(args)
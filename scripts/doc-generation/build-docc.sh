@@ -50,6 +50,10 @@ update_favicon() {
     cp "$theme_dir/favicon.svg" "$docc_archive/"
 }
 
+postprocess_docc() {
+    "$script_dir/postprocess-docc.py" "$docc_archive"
+}
+
 rm -fr "$docc_archive"
 trap cleanup EXIT ERR
 process_template footer.html
@@ -57,4 +61,5 @@ process_template header.html
 build_doc
 patch_docc_theme
 update_favicon
+postprocess_docc
 echo Created "$docc_archive"
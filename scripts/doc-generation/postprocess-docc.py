@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Prepare a .doccarchive for hosting.
+
+- Minifies the JSON pages under `data/`.
+- Writes precompressed `.gz` and, if the `brotli` module is installed, `.br` siblings of text assets,
+  so that the docs host can serve them without compressing on the fly.
+- Replaces files with identical content by hard links to a single copy.
+- Prints a size report.
+
+Minification and compression run in a process pool. The script can be run again on a processed archive,
+existing `.gz`/`.br` files are regenerated from their sources.
+"""
+
+import argparse
+import concurrent.futures
+import gzip
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+from sizes import format_size
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {".json", ".js", ".css", ".html", ".svg", ".txt", ".xml", ".map", ".ico"}
+COMPRESSED_EXTENSIONS = {".gz", ".br"}
+# Smaller files do not get below a single packet and are not worth an extra request for the host.
+MIN_COMPRESS_SIZE = 512
+
+
+def write_atomically(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def minify(path):
+    """Rewrites a JSON file without whitespace. Returns (size before, size after)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        minified = json.dumps(json.loads(data), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    except ValueError:
+        return len(data), len(data)
+    if len(minified) < len(data):
+        write_atomically(path, minified)
+        return len(data), len(minified)
+    return len(data), len(data)
+
+
+def compress(path, use_brotli):
+    """Writes the compressed siblings of `path`. Returns (size, gzip size, brotli size), 0 for skipped outputs."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    sizes = [len(data), 0, 0]
+    outputs = [(".gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if use_brotli:
+        outputs.append((".br", lambda: brotli.compress(data, quality=11)))
+
+    for index, (suffix, encode) in enumerate(outputs, start=1):
+        compressed = encode()
+        # Keep stale siblings from a previous run from being served when the compressed copy is not smaller.
+        if len(compressed) < len(data):
+            write_atomically(path + suffix, compressed)
+            sizes[index] = len(compressed)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return tuple(sizes)
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            h.update(chunk)
+    return path, h.hexdigest()
+
+
+def link_duplicates(paths, pool):
+    """Replaces files with the same content by hard links to the first one. Returns (files, bytes) saved."""
+    by_size = {}
+    for path in paths:
+        stat = os.stat(path)
+        by_size.setdefault(stat.st_size, []).append((path, stat))
+
+    candidates = [path for group in by_size.values() if len(group) > 1 for path, _ in group]
+    groups = {}
+    for path, digest in pool.map(file_digest, candidates, chunksize=64):
+        groups.setdefault(digest, []).append(path)
+
+    linked_files = 0
+    saved_bytes = 0
+    for group in groups.values():
+        original = group[0]
+        original_stat = os.stat(original)
+        for path in group[1:]:
+            stat = os.stat(path)
+            if (stat.st_dev, stat.st_ino) == (original_stat.st_dev, original_stat.st_ino):
+                continue
+            temp_path = os.path.join(os.path.dirname(path), f".tmp-link-{os.getpid()}-{os.path.basename(path)}")
+            os.link(original, temp_path)
+            os.replace(temp_path, path)
+            linked_files += 1
+            saved_bytes += stat.st_size
+    return linked_files, saved_bytes
+
+
+def list_files(root):
+    paths = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if not name.startswith(".tmp-"):
+                paths.append(os.path.join(directory, name))
+    return sorted(paths)
+
+
+def ratio(size, total):
+    return f"{size / total * 100:.1f}%" if total else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minify, precompress and deduplicate a DocC archive for hosting.")
+    parser.add_argument("docc", metavar="docc-archive", help="Path to the .doccarchive folder.")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes. Defaults to the CPU count."
+    )
+    parser.add_argument(
+        "--compress",
+        default=True,
+        action=argparse.BooleanOptionalAction,
+        help="Write .gz (and .br with the brotli module installed) siblings of text assets.",
+    )
+    parser.add_argument(
+        "--link-duplicates",
+        default=True,
+        action=argparse.BooleanOptionalAction,
+        help="Replace files with identical content by hard links.",
+    )
+    tracing.add_argument(parser)
+    args = parser.parse_args()
+    tracing.setup(args.trace)
+
+    print(f"Post-processing DocC archive {args.docc}")
+    files = [path for path in list_files(args.docc) if os.path.splitext(path)[1] not in COMPRESSED_EXTENSIONS]
+    original_size = sum(os.path.getsize(path) for path in files)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        data_dir = os.path.join(args.docc, "data") + os.sep
+        json_files = [path for path in files if path.startswith(data_dir) and path.endswith(".json")]
+        with tracing.span("Minify JSON", files=len(json_files)):
+            minified = list(pool.map(minify, json_files, chunksize=64))
+        json_before = sum(before for before, _ in minified)
+        json_after = sum(after for _, after in minified)
+
+        compressible = [
+            path
+            for path in files
+            if os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS and os.path.getsize(path) >= MIN_COMPRESS_SIZE
+        ]
+        compressed = []
+        if args.compress:
+            if brotli is None:
+                print("brotli module is not installed, writing only .gz files. Install it with `pip install brotli`.")
+            with tracing.span("Compress", files=len(compressible), brotli=brotli is not None):
+                compressed = list(
+                    pool.map(compress, compressible, [brotli is not None] * len(compressible), chunksize=64)
+                )
+
+        linked_files, saved_bytes = 0, 0
+        if args.link_duplicates:
+            with tracing.span("Link duplicates"):
+                linked_files, saved_bytes = link_duplicates(list_files(args.docc), pool)
+
+    processed_size = sum(os.path.getsize(path) for path in files)
+    source_size = sum(size for size, _, _ in compressed)
+    gzip_size = sum(size if size else source for source, size, _ in compressed)
+    brotli_size = sum(size if size else source for source, _, size in compressed)
+
+    print("Size report:")
+    print(f"  Files:             {len(files)}")
+    print(f"  Original size:     {format_size(original_size)}")
+    print(
+        f"  Minified JSON:     {format_size(json_before)} -> {format_size(json_after)} "
+        f"({ratio(json_after, json_before)}, {len(json_files)} pages)"
+    )
+    print(f"  Processed size:    {format_size(processed_size)} ({ratio(processed_size, original_size)})")
+    if compressed:
+        print(f"  Compressible:      {format_size(source_size)} in {len(compressed)} files")
+        print(f"  gzip:              {format_size(gzip_size)} ({ratio(gzip_size, source_size)})")
+        if brotli is not None:
+            print(f"  brotli:            {format_size(brotli_size)} ({ratio(brotli_size, source_size)})")
+    if args.link_duplicates:
+        print(f"  Hard-linked:       {linked_files} duplicate files, {format_size(saved_bytes)} saved")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,32 @@
 #!/usr/bin/env python3
+"""Validate a MapboxMaps .doccarchive.
+
+Every JSON page under `data/` is parsed in parallel and reduced to its identifier, topic sections
+and the `doc://com.mapbox.MapboxMaps/...` references it contains. The check then runs on that index:
+
+- topic section titles of every page must be accepted by the first section rule matching the page
+  (see `SECTION_RULES`),
+- a page should not curate the same identifier twice,
+- every `doc://com.mapbox.MapboxMaps/...` reference should resolve to a page of the archive,
+- symbol pages should be reachable from the root page through topic sections, other symbols are reported as orphans.
+
+Only section rule violations fail the check by default, the other findings are warnings until the `--fail-on-*`
+option of their check is passed.
+"""
 
-# Load the JSON file
 import argparse
+import concurrent.futures
+import fnmatch
 import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
+
+BUNDLE_PREFIX = "doc://com.mapbox.MapboxMaps/"
+ROOT_IDENTIFIER = f"{BUNDLE_PREFIX}documentation/MapboxMaps"
 
 acceptedTopSectionTitles = [
     "Articles",
@@ -16,37 +40,221 @@ acceptedTopSectionTitles = [
     "Extended Modules",
 ]
 
+# Groups of the root page that must not appear deeper in the hierarchy, where they would hide symbols
+# from the catalogs of the root page.
+rootOnlySectionTitles = ["Dependencies", "Internal"]
+
+# Page identifier globs mapped to the topic section title globs accepted and forbidden on matching pages, None
+# accepting any title. The first matching rule wins, the last rule applies to every page.
+SECTION_RULES = [
+    (ROOT_IDENTIFIER, acceptedTopSectionTitles, []),
+    ("*", None, rootOnlySectionTitles),
+]
+
+# JSON strings in the raw page that reference the bundle. Slashes may be escaped by the encoder.
+_REFERENCE = re.compile(rb'"(doc:(?:\\?/){2}com\.mapbox\.MapboxMaps(?:\\?/)[^"#]*)')
+
+
+class Page:
+    __slots__ = ("path", "identifier", "kind", "role", "sections", "references")
+
+    def __init__(self, path, identifier, kind, role, sections, references):
+        self.path = path
+        self.identifier = identifier
+        self.kind = kind
+        self.role = role
+        self.sections = sections
+        self.references = references
+
+
+def load_page(path):
+    """Runs in a worker process. Returns the `Page` of a render JSON file, or None for other JSON files."""
+    with open(path, "rb") as f:
+        data = f.read()
+    page = json.loads(data)
+    if not isinstance(page, dict) or "identifier" not in page:
+        return None
+
+    sections = [(section.get("title", ""), section.get("identifiers", [])) for section in page.get("topicSections", [])]
+    references = {match.replace(b"\\/", b"/").decode("utf-8") for match in _REFERENCE.findall(data)}
+    return Page(
+        path,
+        page["identifier"]["url"],
+        page.get("kind"),
+        page.get("metadata", {}).get("role"),
+        sections,
+        references,
+    )
+
+
+@tracing.traced("Find pages")
+def find_pages(docc_path):
+    paths = []
+    for root, _, files in os.walk(os.path.join(docc_path, "data")):
+        for name in files:
+            if name.endswith(".json"):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+@tracing.traced("Load pages")
+def load_pages(paths, jobs):
+    if jobs > 1 and len(paths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            pages = list(pool.map(load_page, paths, chunksize=max(1, len(paths) // (jobs * 8))))
+    else:
+        pages = [load_page(path) for path in paths]
+    return [page for page in pages if page is not None]
+
+
+def short_name(identifier):
+    return identifier.replace(f"{ROOT_IDENTIFIER}/", "")
+
+
+def section_rule(identifier):
+    """Returns the accepted and forbidden section title globs of a page."""
+    for pattern, accepted, forbidden in SECTION_RULES:
+        if fnmatch.fnmatchcase(identifier, pattern):
+            return accepted, forbidden
+    return None, []
+
+
+def is_title_allowed(title, accepted, forbidden):
+    if any(fnmatch.fnmatchcase(title, pattern) for pattern in forbidden):
+        return False
+    return accepted is None or any(fnmatch.fnmatchcase(title, pattern) for pattern in accepted)
+
+
+@tracing.traced("Check sections")
+def check_sections(index):
+    errors = []
+    for identifier, page in sorted(index.items()):
+        accepted, forbidden = section_rule(identifier)
+        for title, identifiers in page.sections:
+            if not is_title_allowed(title, accepted, forbidden):
+                errors.append(f"{title}:" if identifier == ROOT_IDENTIFIER else f"{short_name(identifier)} › {title}:")
+                for section_identifier in identifiers:
+                    errors.append(f"- {short_name(section_identifier)}")
+    return errors
+
+
+@tracing.traced("Check duplicates")
+def check_duplicates(index):
+    errors = []
+    for identifier, page in sorted(index.items()):
+        curated = set()
+        for _, identifiers in page.sections:
+            for section_identifier in identifiers:
+                if section_identifier in curated:
+                    errors.append(f"- {short_name(identifier)} curates {short_name(section_identifier)} more than once")
+                curated.add(section_identifier)
+    return errors
+
+
+@tracing.traced("Check references")
+def check_references(index):
+    unresolved = {}
+    for identifier, page in index.items():
+        for reference in page.references:
+            if reference not in index:
+                unresolved.setdefault(reference, []).append(identifier)
+    return unresolved
+
+
+@tracing.traced("Find orphans")
+def find_orphans(index):
+    reachable = {ROOT_IDENTIFIER}
+    queue = [ROOT_IDENTIFIER]
+    while queue:
+        page = index.get(queue.pop())
+        if page is None:
+            continue
+        for _, identifiers in page.sections:
+            for identifier in identifiers:
+                if identifier not in reachable:
+                    reachable.add(identifier)
+                    queue.append(identifier)
+    return sorted(
+        identifier for identifier, page in index.items() if page.kind == "symbol" and identifier not in reachable
+    )
+
 
 def main():
     parser = argparse.ArgumentParser(description="Check DocC top sections for unexpected items.")
     parser.add_argument("--docc", required=True, type=str, help="Path to doccarchive folder")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes. Defaults to the CPU count."
+    )
+    parser.add_argument(
+        "--fail-on-duplicates",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Fail when a page curates the same symbol more than once.",
+    )
+    parser.add_argument(
+        "--fail-on-unresolved-references",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Fail when a doc:// reference does not resolve to a page of the archive.",
+    )
+    parser.add_argument(
+        "--fail-on-orphans",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Fail when some symbol pages are not reachable from the root page through topic sections.",
+    )
+    tracing.add_argument(parser)
 
     args = parser.parse_args()
+    tracing.setup(args.trace)
 
-    root_file_path = f"{args.docc}/data/documentation/mapboxmaps.json"
-    print(f"Checking DocC top sections for unexpected items in {args.docc}")
+    print(f"Checking DocC archive {args.docc}")
 
-    with open(root_file_path) as f:
-        root = json.load(f)
+    pages = load_pages(find_pages(args.docc), args.jobs)
+    index = {page.identifier: page for page in pages}
+    if ROOT_IDENTIFIER not in index:
+        print(f"❌ Root page {ROOT_IDENTIFIER} not found.")
+        exit(1)
+    print(f"Indexed {len(index)} pages")
 
-    errors = []
-    for section in root["topicSections"]:
-        if section["title"] not in acceptedTopSectionTitles:
-            errors.append(f"{section['title']}:")
-            for identifier in section["identifiers"]:
-                symbol = identifier.replace("doc://com.mapbox.MapboxMaps/documentation/MapboxMaps/", "")
-                errors.append(f"- {symbol}")
+    failed = False
 
+    errors = check_sections(index)
     if len(errors) > 0:
+        failed = True
         print("❌ Unexpected sections found.")
         for error in errors:
             print(error)
         print(
             "Please make sure these symbols are expected to be publicly available and list them in one of the Markdown files in Sources/MapboxMaps/Documentation.docc/API Catalogs"
         )
+
+    duplicates = check_duplicates(index)
+    if duplicates:
+        failed = failed or args.fail_on_duplicates
+        print(f"{'❌' if args.fail_on_duplicates else '⚠️'} Duplicate curation found.")
+        for error in duplicates:
+            print(error)
+
+    unresolved = check_references(index)
+    if unresolved:
+        failed = failed or args.fail_on_unresolved_references
+        print(f"{'❌' if args.fail_on_unresolved_references else '⚠️'} {len(unresolved)} unresolved references found.")
+        for reference, referrers in sorted(unresolved.items()):
+            print(f"- {short_name(reference)} (referenced from {', '.join(sorted(map(short_name, referrers))[:3])})")
+
+    orphans = find_orphans(index)
+    if orphans:
+        failed = failed or args.fail_on_orphans
+        print(f"{'❌' if args.fail_on_orphans else '⚠️'} {len(orphans)} symbols are not curated under the root page.")
+        for identifier in orphans:
+            print(f"- {short_name(identifier)}")
+
+    if failed:
         exit(1)
     else:
         print("✅ Check passed.")
 
 
-main()
+if __name__ == "__main__":
+    main()
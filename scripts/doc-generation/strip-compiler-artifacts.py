@@ -6,17 +6,72 @@ Newer Swift compilers (Xcode 16.3+) import `char8_t` from auto-generated
 is re-exported (via @_exported import), these symbols leak into the
 MapboxMaps documentation. This script strips them from the symbol graphs
 before DocC processes them.
+
+Most symbol graphs do not mention any artifact at all, so every file is first
+scanned for the quoted artifact names and only the matching ones are parsed.
+Files are processed in parallel, and a manifest of the processed files lets
+incremental doc builds skip symbol graphs that did not change since the last run.
 """
 
+import argparse
+import concurrent.futures
+import hashlib
 import json
+import mmap
 import os
+import shutil
 import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "utilities"))
+import tracing
 
 # Symbols that are compiler artifacts and should not appear in public docs.
 ARTIFACTS = {"char8_t"}
 
+MANIFEST_NAME = ".strip-compiler-artifacts.json"
+MANIFEST_VERSION = 1
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def mentions_artifacts(path):
+    """Cheap prefilter: True if any artifact name appears as a JSON string in the raw file."""
+    needles = [json.dumps(name).encode("utf-8") for name in ARTIFACTS]
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return any(data.find(needle) != -1 for needle in needles)
+
+
+def write_json_atomically(path, value):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f, separators=(",", ":"))
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
 
 def strip(path):
+    """Strips the artifacts from the symbol graph at `path`. Returns the removed identifiers."""
+    if not mentions_artifacts(path):
+        return set()
+
     with open(path) as f:
         sg = json.load(f)
 
@@ -29,27 +84,114 @@ def strip(path):
             filtered_symbols.append(sym)
 
     if not artifact_ids:
-        return
+        return artifact_ids
 
     sg["symbols"] = filtered_symbols
     sg["relationships"] = [
         r for r in sg.get("relationships", []) if r["source"] not in artifact_ids and r["target"] not in artifact_ids
     ]
 
-    with open(path, "w") as f:
-        json.dump(sg, f)
+    write_json_atomically(path, sg)
+    return artifact_ids
+
+
+def process(path):
+    """Runs in a worker process. Returns the removed identifiers and the manifest record of the result."""
+    artifact_ids = strip(path)
+    stat = os.stat(path)
+    return artifact_ids, {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash(path)}
 
-    basepath = os.path.relpath(path, sys.argv[1])
-    print(f"  Stripped {artifact_ids} from {basepath}")
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("artifacts") != sorted(ARTIFACTS):
+        return {}
+    return manifest.get("files", {})
+
+
+def unchanged_record(path, record):
+    """Returns the up to date manifest record if the file was processed before and did not change, else None."""
+    if record is None:
+        return None
+    stat = os.stat(path)
+    if stat.st_size != record["size"]:
+        return None
+    if stat.st_mtime_ns == record["mtime_ns"]:
+        return record
+    # Regenerated graphs get a new mtime even if their content is the same, fall back to the hash.
+    if file_hash(path) != record["sha256"]:
+        return None
+    return dict(record, mtime_ns=stat.st_mtime_ns)
 
 
 def main():
-    symbol_graph_dir = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Remove compiler-artifact symbols from DocC symbol graphs.")
+    parser.add_argument("symbol_graph_dir", metavar="symbol-graph-dir", help="Folder with .symbols.json files.")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes. Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=True,
+        action=argparse.BooleanOptionalAction,
+        help=f"Skip symbol graphs that did not change since the previous run, tracked in {MANIFEST_NAME}.",
+    )
+    tracing.add_argument(parser)
+    args = parser.parse_args()
+    tracing.setup(args.trace)
+
+    symbol_graph_dir = args.symbol_graph_dir
     print(f"Stripping compiler artifacts from symbol graphs in {symbol_graph_dir}")
-    for root, _, files in os.walk(symbol_graph_dir):
-        for name in files:
-            if name.endswith(".symbols.json"):
-                strip(os.path.join(root, name))
+
+    manifest_path = os.path.join(symbol_graph_dir, MANIFEST_NAME)
+    previous = load_manifest(manifest_path) if args.manifest else {}
+
+    with tracing.span("Find changed symbol graphs") as span:
+        paths = []
+        for root, _, files in os.walk(symbol_graph_dir):
+            for name in files:
+                if name.endswith(".symbols.json"):
+                    paths.append(os.path.join(root, name))
+        paths.sort()
+
+        manifest = {}
+        pending = []
+        for path in paths:
+            basepath = os.path.relpath(path, symbol_graph_dir)
+            record = unchanged_record(path, previous.get(basepath))
+            if record is not None:
+                manifest[basepath] = record
+            else:
+                pending.append(path)
+        span.set(files=len(paths), changed=len(pending))
+
+    with tracing.span("Strip symbol graphs", files=len(pending)):
+        if args.jobs > 1 and len(pending) > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(args.jobs, len(pending))) as pool:
+                results = list(pool.map(process, pending, chunksize=max(1, len(pending) // (args.jobs * 4))))
+        else:
+            results = [process(path) for path in pending]
+
+    for path, (artifact_ids, record) in zip(pending, results):
+        basepath = os.path.relpath(path, symbol_graph_dir)
+        manifest[basepath] = record
+        if artifact_ids:
+            print(f"  Stripped {artifact_ids} from {basepath}")
+
+    print(f"  Processed {len(pending)} of {len(paths)} symbol graphs, {len(paths) - len(pending)} unchanged")
+
+    if args.manifest:
+        write_json_atomically(
+            manifest_path, {"version": MANIFEST_VERSION, "artifacts": sorted(ARTIFACTS), "files": manifest}
+        )
 
 
 if __name__ == "__main__":
@@ -40,6 +40,21 @@ replace_regex_in_file() {
     "$replace_text_script_path" --old "$oldText"  --new "$newText" "$filepath"
 }
 
+# Apply a rules file with 'pattern<TAB>replacement<TAB>glob' lines to all matching files under root in one pass
+replace_regex_with_rules() {
+    if [[ $# -lt 1 || $# -gt 2 ]]; then
+        echo "Illegal number of parameters in ${FUNCNAME[0]}"
+        exit 1
+    fi
+
+    local rulesPath=$1
+    local root=${2:-"."}
+
+    local replace_text_script_path="$__HELPERS_UTILS_SCRIPT_DIR/replace-regex-in-file.py"
+
+    "$replace_text_script_path" --rules "$rulesPath" --root "$root"
+}
+
 repeat_command_until_it_fails() {
     local command=$1
     local max_attempts=$2
@@ -1,26 +1,203 @@
 #!/usr/bin/env python3
-import sys
+"""Replace regex matches in files.
+
+Single replacement:
+
+    replace-regex-in-file.py --old 'version = ".*"' --new 'version = "11.0.0"' MapboxMaps.podspec
+
+Batch mode reads rules from a file, one `pattern<TAB>replacement<TAB>file glob` rule per line
+(`#` starts a comment line). Globs are relative to `--root` and support `**`. Rules without a glob apply
+to the files given on the command line:
+
+    replace-regex-in-file.py --rules version-bump.tsv --root . [--dry-run]
+
+All rules of a file are compiled into a single alternation and applied in one pass, so at every position
+the first listed rule that matches wins, and the output of a rule is not matched again by later rules.
+When the patterns cannot be combined (inline global flags, numeric backreferences) or with `--sequential`,
+the rules are applied one after another like separate invocations would do.
+Files are processed in parallel, only changed files are rewritten, and every rewrite is atomic.
+"""
+
 import argparse
+import concurrent.futures
+import difflib
+import glob
+import os
 import re
+import shutil
+import sys
+import tempfile
+
+# Escaped backslashes and numeric group references in replacement templates: \\, \1, \g<1>.
+_TEMPLATE_GROUP = re.compile(r"\\(?:\\|([1-9][0-9]?)|g<([0-9]+)>)")
+_PATTERN_BACKREFERENCE = re.compile(r"\\[1-9]")
+
+
+class Rule:
+    def __init__(self, pattern, replacement, file_glob=None):
+        self.pattern = pattern
+        self.replacement = replacement
+        self.file_glob = file_glob or None
+        self.regex = re.compile(pattern)
+
+    def __repr__(self):
+        return f"Rule({self.pattern!r} -> {self.replacement!r}, {self.file_glob})"
+
+
+def parse_rules(path):
+    rules = []
+    with open(sys.stdin.fileno() if path == "-" else path, "rt", closefd=path != "-") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            fields = line.split("\t")
+            if len(fields) not in (2, 3):
+                raise Exception(f"{path}:{number}: expected 'pattern<TAB>replacement[<TAB>glob]', got {line!r}")
+            try:
+                rules.append(Rule(*fields))
+            except re.error as error:
+                raise Exception(f"{path}:{number}: invalid pattern: {error}")
+    return rules
+
+
+def combine(rules):
+    """Returns `(regex, replace)` applying all rules in one pass, or None if the patterns cannot be combined."""
+    if any(_PATTERN_BACKREFERENCE.search(rule.pattern) for rule in rules):
+        return None
+    try:
+        regex = re.compile("|".join(f"({rule.pattern})" for rule in rules))
+    except re.error:
+        return None
+
+    # Every rule is wrapped in a group, so its group numbers are shifted by the groups of the preceding rules.
+    # The wrapping group closes last and is reported as `lastindex` of a match.
+    templates = {}
+    offset = 1
+    for rule in rules:
+
+        def shift_group(match, offset=offset):
+            if match.group(1) is None and match.group(2) is None:
+                return match.group(0)
+            return f"\\g<{int(match.group(1) or match.group(2)) + offset}>"
+
+        templates[offset] = _TEMPLATE_GROUP.sub(shift_group, rule.replacement)
+        offset += rule.regex.groups + 1
+
+    def replace(match):
+        return match.expand(templates[match.lastindex])
+
+    return regex, replace
+
+
+def apply_rules(data, rules, sequential=False):
+    combined = None if sequential or len(rules) == 1 else combine(rules)
+    if combined is None:
+        for rule in rules:
+            data = rule.regex.sub(rule.replacement, data)
+        return data
+    regex, replace = combined
+    return regex.sub(replace, data)
+
+
+def write_atomically(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wt", newline="") as f:
+            f.write(data)
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def process_file(path, rules, sequential=False, dry_run=False):
+    """Applies the rules to a file. Returns the unified diff of the change, empty if nothing changed."""
+    with open(path, "rt", newline="") as f:
+        data = f.read()
+    updated = apply_rules(data, rules, sequential)
+    if updated == data:
+        return ""
+    if not dry_run:
+        write_atomically(path, updated)
+    return "".join(
+        difflib.unified_diff(
+            data.splitlines(keepends=True), updated.splitlines(keepends=True), f"a/{path}", f"b/{path}"
+        )
+    )
+
+
+def collect_files(rules, root, files):
+    """Maps every affected file to the rules that apply to it, keeping the order of the rules."""
+    targets = {}
+    for rule in rules:
+        if rule.file_glob is None:
+            paths = files
+        else:
+            paths = [
+                os.path.join(root, path)
+                for path in sorted(glob.glob(rule.file_glob, root_dir=root, recursive=True))
+                if os.path.isfile(os.path.join(root, path))
+            ]
+        for path in paths:
+            targets.setdefault(os.path.normpath(path), []).append(rule)
+    return targets
+
+
+def run_batch(args):
+    rules = parse_rules(args.rules)
+    targets = collect_files(rules, args.root, args.files)
+
+    jobs = [(path, rules, args.sequential, args.dry_run) for path, rules in targets.items()]
+    # Spawning workers costs more than processing a handful of files.
+    if args.jobs > 1 and len(jobs) > 8:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            diffs = list(pool.map(process_file, *zip(*jobs)))
+    else:
+        diffs = [process_file(*job) for job in jobs]
+
+    changed = [diff for diff in diffs if diff]
+    if args.dry_run:
+        sys.stdout.write("".join(changed))
+        print(f"{len(changed)} of {len(jobs)} files would change", file=sys.stderr)
+    else:
+        print(f"Updated {len(changed)} of {len(jobs)} files", file=sys.stderr)
 
 
 def main(argv):
     parser = argparse.ArgumentParser(description="Replace string in file.")
-    parser.add_argument("--old", required=True)
-    parser.add_argument("--new", required=True)
-    parser.add_argument("file")
+    parser.add_argument("--old", help="Pattern to replace.")
+    parser.add_argument("--new", help="Replacement, may refer to groups of the pattern.")
+    parser.add_argument(
+        "--rules", help="Batch mode: file with 'pattern<TAB>replacement<TAB>glob' lines, '-' for stdin."
+    )
+    parser.add_argument("--root", default=".", help="Batch mode: folder the rule globs are relative to.")
+    parser.add_argument(
+        "--sequential",
+        default=False,
+        action="store_true",
+        help="Batch mode: apply the rules one after another instead of in a single pass.",
+    )
+    parser.add_argument("--dry-run", default=False, action="store_true", help="Print a diff instead of writing files.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Batch mode: number of processes.")
+    parser.add_argument("files", metavar="file", nargs="*")
+
+    args = parser.parse_args(argv)
 
-    args = parser.parse_args()
+    if args.rules is not None:
+        if args.old is not None or args.new is not None:
+            parser.error("--old/--new cannot be combined with --rules")
+        run_batch(args)
+        return
 
-    fin = open(args.file, "rt")
-    data = fin.read()
-    pattern = re.compile(args.old)
-    data = re.sub(pattern, args.new, data)
-    fin.close()
+    if args.old is None or args.new is None or len(args.files) != 1:
+        parser.error("either --rules or --old, --new and a single file are required")
 
-    fin = open(args.file, "wt")
-    fin.write(data)
-    fin.close()
+    diff = process_file(args.files[0], [Rule(args.old, args.new)], dry_run=args.dry_run)
+    if args.dry_run:
+        sys.stdout.write(diff)
 
 
 if __name__ == "__main__":
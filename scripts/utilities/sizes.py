@@ -0,0 +1,10 @@
+"""Byte sizes in the output of the release and CI scripts."""
+
+
+def format_size(size: int) -> str:
+    """Formats a size in bytes with a binary unit, for example `12.3 MB`."""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+    return f"{size:.1f} TB"
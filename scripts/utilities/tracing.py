@@ -0,0 +1,350 @@
+"""Phase timing shared by the release and CI scripts.
+
+Scripts add a `--trace` option and wrap their phases in spans:
+
+    tracing.add_argument(parser)
+    args = parser.parse_args()
+    tracing.setup(args.trace)
+
+    with tracing.span("Extract SDK", path=sdk_path):
+        ...
+    proc = tracing.run(["xcrun", "--find", "swift-api-digester"], capture_output=True, text=True)
+
+Spans nest per thread. `run` and `Popen` are the `subprocess` ones, and with tracing on they also record
+the wall time, CPU time and peak RSS of the child process. At exit the spans are written as a Chrome
+trace-event file (open it in chrome://tracing or https://ui.perfetto.dev) and summed up in a table on
+stderr. With tracing off, `span` returns a shared no-op context manager and nothing is recorded.
+"""
+
+import atexit
+import functools
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+_tracer = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **arguments):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def peak_rss_bytes(usage) -> int:
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "arguments", "start", "path")
+
+    def __init__(self, tracer, name, arguments):
+        self.tracer = tracer
+        self.name = name
+        self.arguments = arguments
+
+    def set(self, **arguments):
+        """Attaches values known only once the phase ran, like a result count or a status code."""
+        self.arguments.update(arguments)
+
+    def begin(self):
+        stack = self.tracer.stack()
+        self.path = (stack[-1].path if stack else ()) + (self.name,)
+        self.start = time.perf_counter_ns()
+
+    def end(self):
+        self.tracer.record(self.name, self.path, self.start, time.perf_counter_ns(), self.arguments)
+
+    def __enter__(self):
+        self.begin()
+        self.tracer.stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.stack().pop()
+        if exc_type is not None:
+            self.arguments["error"] = exc_type.__name__
+        self.end()
+        return False
+
+
+class Tracer:
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.origin = time.perf_counter_ns()
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def stack(self) -> list:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def span(self, name: str, arguments: dict) -> _Span:
+        return _Span(self, name, arguments)
+
+    def record(self, name: str, path: tuple, start: int, end: int, arguments: dict):
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.origin) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {
+                key: value if isinstance(value, (int, float, bool)) else str(value) for key, value in arguments.items()
+            },
+        }
+        with self.lock:
+            self.events.append((path, event))
+
+    def write(self):
+        with self.lock:
+            events = [event for _, event in self.events]
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": thread_names[tid]}}
+            for tid in sorted({event["tid"] for event in events})
+            if tid in thread_names
+        ]
+        with open(self.output_path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self) -> str:
+        """Returns a table of the spans grouped by their nesting path, in the order they first started."""
+        with self.lock:
+            recorded = sorted(self.events, key=lambda item: item[1]["ts"])
+        rows = {}
+        for path, event in recorded:
+            row = rows.setdefault(path, {"count": 0, "wall": 0.0, "cpu": 0.0, "rss": 0})
+            row["count"] += 1
+            row["wall"] += event["dur"] / 1e6
+            row["cpu"] += event["args"].get("cpu_s", 0)
+            row["rss"] = max(row["rss"], event["args"].get("peak_rss_mb", 0))
+
+        # Parents are recorded after their children, so order each row by its first start or that of a descendant.
+        first_starts = {}
+        for path, event in recorded:
+            for length in range(1, len(path) + 1):
+                first_starts.setdefault(path[:length], event["ts"])
+
+        def order(path):
+            return tuple(first_starts[path[:length]] for length in range(1, len(path) + 1))
+
+        lines = [f"{'Phase':<60} {'Count':>6} {'Wall':>9} {'Child CPU':>10} {'Child RSS':>10}"]
+        for path in sorted(rows, key=order):
+            row = rows[path]
+            name = "  " * (len(path) - 1) + path[-1]
+            if len(name) > 60:
+                name = name[:57] + "..."
+            cpu = f"{row['cpu']:.2f}s" if row["cpu"] else ""
+            rss = f"{row['rss']:.0f} MB" if row["rss"] else ""
+            lines.append(f"{name:<60} {row['count']:>6} {row['wall']:>8.2f}s {cpu:>10} {rss:>10}")
+
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        lines.append(
+            f"Process: {own.ru_utime + own.ru_stime:.2f}s CPU, {peak_rss_bytes(own) / 2**20:.0f} MB peak RSS. "
+            f"Child processes: {children.ru_utime + children.ru_stime:.2f}s CPU, "
+            f"{peak_rss_bytes(children) / 2**20:.0f} MB largest peak RSS."
+        )
+        return "\n".join(lines)
+
+    def finish(self):
+        self.write()
+        print(self.summary(), file=sys.stderr)
+        print(f"Trace written to {self.output_path}", file=sys.stderr)
+
+
+def add_argument(parser):
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write a Chrome trace of the script phases and subprocesses to PATH and print a timing summary.",
+    )
+
+
+def setup(output_path: str = None):
+    """Enables tracing when an output path is given. The trace is written when the script exits."""
+    global _tracer
+    if not output_path or _tracer is not None:
+        return
+    _tracer = Tracer(os.path.abspath(output_path))
+    atexit.register(_tracer.finish)
+
+
+def span(name: str, **arguments):
+    """Context manager timing a phase. Arguments are shown in the trace viewer."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, arguments)
+
+
+def traced(name: str = None):
+    """Decorator recording every call of a function as a span."""
+
+    def decorate(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with _tracer.span(label, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def in_current_span(function):
+    """Wraps `function` so that the spans it records on another thread, like a pool worker, nest in the current span."""
+    if _tracer is None:
+        return function
+    stack = _tracer.stack()
+    if not stack:
+        return function
+    parent = stack[-1]
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        worker_stack = _tracer.stack()
+        worker_stack.append(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            worker_stack.pop()
+
+    return wrapper
+
+
+def command_name(arguments) -> str:
+    if isinstance(arguments, (str, bytes, os.PathLike)):
+        return os.path.basename(os.fsdecode(arguments).split()[0])
+    arguments = [os.fsdecode(argument) for argument in arguments]
+    name = os.path.basename(arguments[0])
+    if name == "xcrun":
+        # Name xcrun invocations after the tool they run, `xcrun --sdk iphoneos swift-api-digester ...`.
+        remaining = iter(arguments[1:])
+        for argument in remaining:
+            if argument in ("--sdk", "--toolchain"):
+                next(remaining, None)
+            elif argument == "--find":
+                return f"xcrun --find {next(remaining, '')}"
+            elif not argument.startswith("-"):
+                return f"xcrun {argument}"
+    return name
+
+
+class Popen(subprocess.Popen):
+    """`subprocess.Popen` that records a span with the CPU time and peak RSS of the child once it is waited for."""
+
+    def __init__(self, args, *popen_args, **kwargs):
+        self._trace_span = None
+        self._trace_lock = threading.Lock()
+        if _tracer is not None:
+            command = args if isinstance(args, (str, bytes)) else " ".join(os.fsdecode(a) for a in args)
+            # The child can be waited for on another thread, so its span stays off the span stack.
+            self._trace_span = _tracer.span(f"$ {command_name(args)}", {"command": command[:2000]})
+            self._trace_span.begin()
+        try:
+            super().__init__(args, *popen_args, **kwargs)
+        except BaseException as error:
+            if self._trace_span is not None:
+                self._trace_span.set(error=type(error).__name__)
+                self._trace_span.end()
+            raise
+
+    def poll(self):
+        if self._trace_span is not None and self._trace_lock.acquire(blocking=False):
+            try:
+                self._reap(os.WNOHANG)
+            finally:
+                self._trace_lock.release()
+        return super().poll()
+
+    def wait(self, timeout=None):
+        if self._trace_span is None:
+            return super().wait(timeout)
+        if timeout is None:
+            with self._trace_lock:
+                self._reap(0)
+            return super().wait()
+        # wait4 has no timeout, poll it the way subprocess does.
+        deadline = time.monotonic() + timeout
+        delay = 0.0005
+        while True:
+            if self._trace_lock.acquire(timeout=max(0, deadline - time.monotonic())):
+                try:
+                    self._reap(os.WNOHANG)
+                finally:
+                    self._trace_lock.release()
+            if self._trace_span is None:
+                return super().wait()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            delay = min(delay * 2, remaining, 0.05)
+            time.sleep(delay)
+
+    def _reap(self, wait_flags):
+        """Waits for the child with `os.wait4`, records its span and sets `returncode` once it has exited."""
+        if self._trace_span is None or self.returncode is not None:
+            return
+        try:
+            pid, status, usage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            # The child was reaped elsewhere, e.g. with SIGCHLD ignored. subprocess sets the return code.
+            span = self._trace_span
+            self._trace_span = None
+            span.end()
+            return
+        if pid != self.pid:
+            return
+        self.returncode = os.waitstatus_to_exitcode(status)
+        span = self._trace_span
+        self._trace_span = None
+        span.set(
+            cpu_s=round(usage.ru_utime + usage.ru_stime, 3),
+            peak_rss_mb=round(peak_rss_bytes(usage) / 2**20, 1),
+            exit_code=self.returncode,
+        )
+        span.end()
+
+
+def run(*popenargs, input=None, capture_output=False, timeout=None, check=False, **kwargs):
+    """`subprocess.run` that records the wall time, CPU time and peak RSS of the child with tracing on."""
+    if _tracer is None:
+        return subprocess.run(
+            *popenargs, input=input, capture_output=capture_output, timeout=timeout, check=check, **kwargs
+        )
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    with Popen(*popenargs, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except BaseException:
+            process.kill()
+            raise
+        returncode = process.poll()
+    if check and returncode:
+        raise subprocess.CalledProcessError(returncode, process.args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(process.args, returncode, stdout, stderr)